@@ -1,16 +1,25 @@
-import uuid
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Header
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import os
 import shutil
 import logging
+import asyncio
+import json
+import zipfile
 from datetime import datetime
-import random
-from app.utils.extraction import parse_note_to_hpo
-from app.utils.diagnosing import diagnose_helper
-from app.utils.llm_chat import HPODiagnosisChat
+from app.utils.extraction import clinphen_version, get_clinphen_pool
+from app.utils.note_cache import get_note_cache, note_cache_key
+from app.utils.note_stream import extract_streaming
+from app.utils.diagnosing import diagnose_batch, diagnose_helper, get_engine, rank_candidate_genes
+from app.utils.chat_sessions import get_chat_sessions
+from app.utils.llm_client import get_llm_client
+from app.utils.verification_cache import get_verification_cache
+from app.utils.session_store import get_session_store
+from app.utils.metrics import MetricsMiddleware, get_metrics, span
 
 # ___________________________ CODE FOR SETTING UP THE API ___________________________
 app = FastAPI()
@@ -22,12 +31,57 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-route request counts and latency, and the optional Server-Timing breakdown
+app.add_middleware(MetricsMiddleware)
+
+logger = logging.getLogger(__name__)
+
+@app.on_event("startup")
+def load_phrank_engine():
+    """Build the shared Phrank engine once so requests never re-parse hp.obo / phenotype.hpoa."""
+    try:
+        get_engine().load()
+    except Exception as e:
+        logger.warning(f"Phrank engine not loaded at startup, falling back to demo diagnoses: {e}")
+
+@app.on_event("startup")
+def start_clinphen_pool():
+    """Start the warm ClinPhen workers so the first upload does not pay their load cost."""
+    get_clinphen_pool().start()
+
+@app.on_event("shutdown")
+def stop_clinphen_pool():
+    get_clinphen_pool().shutdown()
+
+@app.on_event("shutdown")
+def stop_batch_pool():
+    get_engine().shutdown_batch_pool()
+
+@app.on_event("shutdown")
+def park_chat_sessions():
+    """Write open chats to disk so they survive a restart."""
+    get_chat_sessions().spill_all()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await get_llm_client().aclose()
 
 @app.get("/")
 async def read_root():
     return {"Hello": "World"}
 
+# Session used by clients that do not send one, so a single-user frontend keeps working unchanged
+DEFAULT_SESSION_ID = "default"
+
+def get_session_id(x_session_id: Optional[str] = Header(None), session_id: Optional[str] = None) -> str:
+    """
+    Identify the caller's session from the X-Session-ID header or the session_id query parameter.
+    HPO codes, diagnoses and recommendations are stored per session in the shared session store.
+    """
+    return x_session_id or session_id or DEFAULT_SESSION_ID
+
 # ___________________________ CODE FOR UPLOADING AND GETTING HPO TERMS ___________________________
 # Add these models and global dictionary for HPO codes
 
@@ -41,12 +95,37 @@ class HPOCode(BaseModel):
 class HPOCodesResponse(BaseModel):
     codes: List[HPOCode]
 
-# Global dictionary to store HPO codes
-hpo_codes_dict: Dict[str, HPOCode] = {}
+def load_hpo_codes(session_id: str) -> Dict[str, Dict[str, Any]]:
+    """Return the session's HPO codes as {hpo_id: {"id", "name", "source"}}."""
+    return get_session_store().get(session_id, "hpo_codes", {})
 
+def save_hpo_codes(session_id: str, hpo_codes: Dict[str, Dict[str, Any]]):
+    store = get_session_store()
+    store.set(session_id, "hpo_codes", hpo_codes)
+    # Diagnoses and recommendations were derived from the previous codes
+    store.delete(session_id, "diagnoses")
+    store.delete(session_id, "recommendations")
 
-# TODO: Replace this with actual lookup from HPO data file
-def lookup_hpo_name(hpo_id: str) -> str:
+
+def lookup_hpo_names(hpo_ids: List[str]) -> Dict[str, str]:
+    """
+    Look up the names of many HPO terms in one call.
+
+    Names come from the in-memory id -> name index built from the same hp.obo the Phrank
+    engine uses, so alt_ids and obsolete ids with a replacement resolve too.
+
+    Args:
+        hpo_ids: HPO IDs in the format "HP:0000123"
+
+    Returns:
+        A dict of HPO ID -> term name for the IDs that could be resolved
+    """
+    engine = get_engine()
+    if not engine.loaded:
+        return {}
+    return engine.lookup_names(hpo_ids)
+
+def lookup_hpo_name(hpo_id: str) -> Optional[str]:
     """
     Look up the name of an HPO term based on its ID.
     
@@ -54,50 +133,36 @@ def lookup_hpo_name(hpo_id: str) -> str:
         hpo_id: HPO ID in the format "HP:0000123"
         
     Returns:
-        The name of the HPO term
+        The name of the HPO term, or None if it is unknown
     """
-    # Placeholder function that returns random names
-    # This will be replaced with actual lookup logic from HPO data file
-    
-    sample_names = [
-        "Joint hypermobility",
-        "Abnormal joint mobility",
-        "Joint pain",
-        "Fatigue",
-        "Muscular hypotonia",
-        "Recurrent joint dislocations",
-        "Skin hyperextensibility",
-        "Delayed gross motor development",
-        "Poor coordination",
-        "Easy bruising"
-    ]
-    
-    return random.choice(sample_names)
+    return lookup_hpo_names([hpo_id]).get(hpo_id)
 
 # Update the add_hpo_codes endpoint to use the lookup function
 @app.post("/hpo-codes", response_model=HPOCodesResponse)
-async def add_hpo_codes(codes: List[HPOCode]):
+async def add_hpo_codes(codes: List[HPOCode], session_id: str = Depends(get_session_id)):
     """
     Add a list of HPO codes
     """
-    # Add each code to the global dictionary, using ID as key to avoid duplicates
+    # Resolve all names in one bulk lookup, keeping the submitted name for unknown IDs
+    names = lookup_hpo_names([code.id for code in codes])
+
+    # Add each code to the session's codes, using ID as key to avoid duplicates
+    hpo_codes = load_hpo_codes(session_id)
     for code in codes:
-        # Only lookup the name if it's the placeholder
-        code.name = lookup_hpo_name(code.id)
+        code.name = names.get(code.id, code.name)
         
-        hpo_codes_dict[code.id] = code
+        hpo_codes[code.id] = code.dict()
+    save_hpo_codes(session_id, hpo_codes)
     
     # Return all codes
-    return {"codes": list(hpo_codes_dict.values())}
-
-logger = logging.getLogger(__name__)
+    return {"codes": list(hpo_codes.values())}
 
 @app.get("/hpo-codes", response_model=HPOCodesResponse)
-async def get_hpo_codes():
+async def get_hpo_codes(session_id: str = Depends(get_session_id)):
     """
     Get all HPO codes
     """
-    return {"codes": list(hpo_codes_dict.values())}
+    return {"codes": list(load_hpo_codes(session_id).values())}
 
     # ___________________________ CODE FOR UPLOADING CLINICAL NOTES ___________________________
 # Model for clinical notes analysis response
@@ -108,6 +173,53 @@ class ClinicalAnalysisResponse(BaseModel):
     potential_diagnoses: Optional[List[Dict[str, Any]]] = None
     recommendations: Optional[List[Dict[str, Any]]] = None
 
+# Available note extractors: the ClinPhen worker pool or the in-process HPO synonym matcher
+EXTRACTORS = ("clinphen", "native")
+
+async def extract_hpo_terms(text: str, extractor: str = "clinphen") -> Dict[str, Dict[str, Any]]:
+    """
+    Extract HPO terms from note text with the selected extractor.
+    Results are cached by a hash of the normalized note and the extractor version.
+    """
+    if extractor == "native":
+        # Loads the engine first if startup could not, so keep it off the event loop
+        matcher = await run_in_threadpool(get_engine().phenotype_matcher)
+        version = matcher.version
+    elif extractor == "clinphen":
+        version = clinphen_version()
+    else:
+        raise ValueError(f"Unknown extractor {extractor!r}, expected one of {EXTRACTORS}")
+
+    cache = get_note_cache()
+    key = note_cache_key(text, version)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return {hpo_id: dict(hpo_data) for hpo_id, hpo_data in cached.items()}
+
+    if extractor == "native":
+        with span("native_extraction"):
+            extracted_hpo = await run_in_threadpool(matcher.extract, text)
+    else:
+        extracted_hpo = await get_clinphen_pool().extract(text)
+    # Empty results are not cached since a failed ClinPhen run also comes back empty
+    if extracted_hpo:
+        await cache.aput(key, {hpo_id: dict(hpo_data) for hpo_id, hpo_data in extracted_hpo.items()})
+    return extracted_hpo
+
+async def count_hpo_terms(text: str, extractor: str = "clinphen") -> Dict[str, Any]:
+    """Extract {hpo_id: (name, occurrences)} from one segment of a streamed note."""
+    if extractor == "native":
+        matcher = await run_in_threadpool(get_engine().phenotype_matcher)
+        with span("native_extraction"):
+            counts = await run_in_threadpool(matcher.count_mentions, text)
+        return {hpo_id: (matcher.names.get(hpo_id, hpo_id), n) for hpo_id, n in counts.items()}
+    if extractor == "clinphen":
+        return await get_clinphen_pool().count(text)
+    raise ValueError(f"Unknown extractor {extractor!r}, expected one of {EXTRACTORS}")
+
+# Uploads larger than this are always processed in streaming mode
+STREAM_THRESHOLD_BYTES = int(os.environ.get("NOTE_STREAM_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+
 # Ensure uploads directory exists
 UPLOAD_DIR = "app/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -116,35 +228,40 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 async def upload_clinical_notes(
     file: UploadFile = File(...),
     patient_id: Optional[str] = Form(None),
-    notes: Optional[str] = Form(None)
+    notes: Optional[str] = Form(None),
+    extractor: str = Form("clinphen"),
+    stream: bool = Form(False),
+    session_id: str = Depends(get_session_id)
 ):
-    # update hpo_codes_dict 
+    # update the session's HPO codes
     try:
-        # Reset the global dictionary for each new upload
-        hpo_codes_dict.clear()
-
-        # Read and decode the uploaded file
-        contents = await file.read()
-        text = contents.decode("utf-8")
-
-        
-        # Extract HPO terms using the parse_note_to_hpo function which returns a dict
-        extracted_hpo = parse_note_to_hpo(user_input_text=text)
+        # Large notes are read and extracted chunk by chunk instead of decoded in one go
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+        file.file.seek(0)
+
+        if stream or size > STREAM_THRESHOLD_BYTES:
+            if extractor not in EXTRACTORS:
+                raise ValueError(f"Unknown extractor {extractor!r}, expected one of {EXTRACTORS}")
+            extracted_hpo = await extract_streaming(file.read, lambda segment: count_hpo_terms(segment, extractor))
+        else:
+            # Read and decode the uploaded file
+            contents = await file.read()
+            text = contents.decode("utf-8")
+
+            # Extract HPO terms (ClinPhen worker pool or native matcher) without blocking the event loop
+            extracted_hpo = await extract_hpo_terms(text, extractor)
 
         # # Debugging: Print extracted HPO terms
         # print("Extracted HPO terms:", extracted_hpo)
         
-        # Update the global hpo_codes_dict with the extracted HPO terms
-        for hpo_id, hpo_data in extracted_hpo.items():
-            hpo_codes_dict[hpo_id] = hpo_data
-        
-        # # Debugging: Print updated hpo_codes_dict
-        # print("Updated hpo_codes_dict:", hpo_codes_dict)
+        # Each new upload replaces the session's HPO codes with the extracted terms
+        save_hpo_codes(session_id, extracted_hpo)
         
         return {
             "success": True,
             "message": "Clinical notes processed successfully.",
-            "file_info": {"filename": file.filename, "size": len(contents)},
+            "file_info": {"filename": file.filename, "size": size},
             "extracted_hpo": [{"id": hpo_id, "name": hpo_data["name"]} for hpo_id, hpo_data in extracted_hpo.items()]
         }
     
@@ -155,6 +272,125 @@ async def upload_clinical_notes(
             "file_info": None
         }
     
+@app.get("/clinical-notes/cache-stats")
+async def get_note_cache_stats():
+    """Hit/miss counters of the note extraction cache."""
+    return get_note_cache().stats()
+    
+# ___________________________ CODE FOR BULK CLINICAL NOTES ___________________________
+# Number of notes from one bulk upload that are extracted concurrently
+BULK_NOTES_PARALLELISM = int(os.environ.get("BULK_NOTES_PARALLELISM", "8"))
+# Notes (files or archive members) larger than this are rejected without being read
+BULK_MAX_NOTE_BYTES = int(os.environ.get("BULK_MAX_NOTE_BYTES", str(8 * 1024 * 1024)))
+# Maximum number of notes in one bulk upload, counting every archive member
+BULK_MAX_NOTES = int(os.environ.get("BULK_MAX_NOTES", "10000"))
+
+def iter_bulk_notes(files: List[UploadFile]):
+    """
+    Yield (patient_id, filename, text, error) for every note in a bulk upload, expanding .zip
+    archives into their member files. The patient ID is the note's file name without extension.
+    Notes over BULK_MAX_NOTE_BYTES come back with an error and no text; past BULK_MAX_NOTES
+    one error is yielded and the rest of the upload is skipped.
+
+    Reads and decompresses synchronously, so iterate it with iterate_in_threadpool.
+    """
+    count = 0
+    for upload in files:
+        if upload.filename.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile as e:
+                yield os.path.splitext(os.path.basename(upload.filename))[0], upload.filename, None, str(e)
+                continue
+            with archive:
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or not name or name.startswith(".") or "__MACOSX" in info.filename:
+                        continue
+                    count += 1
+                    patient_id = os.path.splitext(name)[0]
+                    if count > BULK_MAX_NOTES:
+                        yield patient_id, info.filename, None, f"Upload has more than {BULK_MAX_NOTES} notes"
+                        return
+                    # file_size is the declared uncompressed size; zipfile stops reading past it
+                    if info.file_size > BULK_MAX_NOTE_BYTES:
+                        yield patient_id, info.filename, None, f"Note is larger than {BULK_MAX_NOTE_BYTES} bytes"
+                        continue
+                    yield patient_id, info.filename, archive.read(info).decode("utf-8", errors="replace"), None
+        else:
+            count += 1
+            patient_id = os.path.splitext(os.path.basename(upload.filename))[0]
+            if count > BULK_MAX_NOTES:
+                yield patient_id, upload.filename, None, f"Upload has more than {BULK_MAX_NOTES} notes"
+                return
+            upload.file.seek(0, os.SEEK_END)
+            if upload.file.tell() > BULK_MAX_NOTE_BYTES:
+                yield patient_id, upload.filename, None, f"Note is larger than {BULK_MAX_NOTE_BYTES} bytes"
+                continue
+            upload.file.seek(0)
+            yield patient_id, upload.filename, upload.file.read().decode("utf-8", errors="replace"), None
+
+async def process_bulk_note(patient_id: str, filename: str, text: str, extractor: str,
+                            score: bool, top_n: int, mode: Optional[str]) -> Dict[str, Any]:
+    """Extract one note's HPO set and optionally score it with Phrank."""
+    result: Dict[str, Any] = {"patient_id": patient_id, "filename": filename}
+    try:
+        extracted_hpo = await extract_hpo_terms(text, extractor)
+        result["hpo_codes"] = [{"id": hpo_id, "name": hpo_data["name"]} for hpo_id, hpo_data in extracted_hpo.items()]
+        if score:
+            engine = get_engine()
+            result["diagnoses"] = await run_in_threadpool(engine.diagnose, list(extracted_hpo), top_n, mode)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+async def stream_bulk_results(files: List[UploadFile], extractor: str, score: bool, top_n: int, mode: Optional[str]):
+    """Extract notes with bounded concurrency and yield one NDJSON line per note as it finishes."""
+    pending = set()
+    try:
+        # Archive and file reads run in the threadpool, one note at a time
+        async for patient_id, filename, text, error in iterate_in_threadpool(iter_bulk_notes(files)):
+            if error is not None:
+                yield json.dumps({"patient_id": patient_id, "filename": filename, "error": error}) + "\n"
+                continue
+            if len(pending) >= BULK_NOTES_PARALLELISM:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    yield json.dumps(task.result()) + "\n"
+            pending.add(asyncio.ensure_future(
+                process_bulk_note(patient_id, filename, text, extractor, score, top_n, mode)
+            ))
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                yield json.dumps(task.result()) + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
+
+@app.post("/clinical-notes/bulk")
+async def upload_bulk_clinical_notes(
+    files: List[UploadFile] = File(...),
+    extractor: str = Form("clinphen"),
+    score: bool = Form(False),
+    top_n: int = Form(5),
+    mode: Optional[str] = Form(None)
+):
+    """
+    Extract HPO terms from many notes (multiple files and/or .zip archives) in parallel.
+    Streams back NDJSON with one line per note, in completion order, each holding the
+    patient's HPO set and, if score is set, their top_n Phrank diagnoses.
+    """
+    if extractor not in EXTRACTORS:
+        raise HTTPException(status_code=400, detail=f"Unknown extractor {extractor!r}, expected one of {EXTRACTORS}")
+    if score and not get_engine().loaded:
+        raise HTTPException(status_code=503, detail="Phrank engine is not loaded")
+
+    return StreamingResponse(
+        stream_bulk_results(files, extractor, score, top_n, mode),
+        media_type="application/x-ndjson"
+    )
+
 # ___________________________ CODE FOR DIAGNOSING ___________________________
 
 # Enhanced diagnoses model with additional useful columns
@@ -163,21 +399,18 @@ class Diagnosis(BaseModel):
     name: str
     probability: str
     details: str
-    symptoms: str
-    orpha_code: str
-    inheritance: str
-    prevalence: str
-    specialist: str
-    key_tests: str
+    symptoms: str = ""
+    orpha_code: str = ""
+    inheritance: str = ""
+    prevalence: str = ""
+    specialist: str = ""
+    key_tests: str = ""
 
 
 # Define a response model for list of diagnoses
 class DiagnosesResponse(BaseModel):
     diagnoses: List[Diagnosis]
 
-# Global dictionary to store diagnoses for each patient
-patient_diagnoses: Dict[str, List[Dict[str, Any]]] = {}
-
 # Mock diagnoses data - would normally be generated from HPO codes and clinical notes
 default_diagnoses_demo = [
     {
@@ -243,22 +476,139 @@ default_diagnoses_demo = [
 ]
 
 @app.get("/diagnoses", response_model=DiagnosesResponse)
-async def get_diagnoses():
-    """Diagnose based on the uploaded HPO terms using the Phrank algorithm."""
+def get_diagnoses(mode: Optional[str] = None, session_id: str = Depends(get_session_id)):
+    """
+    Diagnose based on the session's HPO terms using the Phrank algorithm.
+    mode selects "count" (shared-term count) or "ic" (information-content weighted) scoring.
+    """
 
     # Convert the stored HPO dictionary into a list of phenotype IDs
-    phenotype_list = list(hpo_codes_dict.keys())
+    phenotype_list = list(load_hpo_codes(session_id).keys())
 
     if not phenotype_list:
         return {"diagnoses": []}
 
-    # diagnose using Phrank scoring
-    # diagnoses = diagnose_helper(phenotype_list)
-    
-    diagnoses = default_diagnoses_demo # for demo
-
+    # diagnose using Phrank scoring when the shared engine is available
+    if get_engine().loaded:
+        try:
+            # The session's running scores are updated with just the codes added or removed since its last call
+            diagnoses = diagnose_helper(phenotype_list, mode=mode, session_id=session_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        diagnoses = default_diagnoses_demo # for demo
+
+    get_session_store().set(session_id, "diagnoses", diagnoses)
     return {"diagnoses": diagnoses}
 
+# Models for scoring a cohort of patients in one call
+class BatchPatient(BaseModel):
+    patient_id: str
+    hpo_codes: List[str]
+
+class BatchDiagnosesRequest(BaseModel):
+    patients: List[BatchPatient]
+    top_n: int = 5
+    mode: Optional[str] = None  # "count" or "ic"
+
+class PatientDiagnoses(BaseModel):
+    patient_id: str
+    diagnoses: List[Diagnosis]
+
+class BatchDiagnosesResponse(BaseModel):
+    results: List[PatientDiagnoses]
+
+@app.post("/diagnoses/batch", response_model=BatchDiagnosesResponse)
+def get_batch_diagnoses(request: BatchDiagnosesRequest):
+    """
+    Score many patients' HPO code sets in one pass against the shared Phrank engine
+    and return the top_n diagnoses for each patient.
+    """
+    if not get_engine().loaded:
+        raise HTTPException(status_code=503, detail="Phrank engine is not loaded")
+
+    try:
+        all_diagnoses = diagnose_batch(
+            [patient.hpo_codes for patient in request.patients], top_n=request.top_n, mode=request.mode
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "results": [
+            {"patient_id": patient.patient_id, "diagnoses": diagnoses}
+            for patient, diagnoses in zip(request.patients, all_diagnoses)
+        ]
+    }
+
+# Models for gene-level ranking, e.g. of the candidate genes from an exome
+class GeneRankingRequest(BaseModel):
+    hpo_codes: Optional[List[str]] = None  # the session's HPO codes if omitted
+    candidate_genes: Optional[List[str]] = None  # all genes if omitted
+    top_n: Optional[int] = None  # every candidate if omitted, 20 genes when ranking all genes
+    mode: Optional[str] = None  # "count" or "ic"
+
+class RankedGene(BaseModel):
+    id: int
+    symbol: str
+    score: float
+    probability: str
+    diseases: List[str]
+
+class GeneRankingResponse(BaseModel):
+    genes: List[RankedGene]
+    unmatched_genes: List[str]
+
+@app.post("/genes/rank", response_model=GeneRankingResponse)
+def rank_genes(request: GeneRankingRequest, session_id: str = Depends(get_session_id)):
+    """
+    Rank genes by the Phrank score of their phenotype profile (the union of their diseases'
+    profiles) against the given HPO codes or the session's. Restricted to candidate_genes when
+    given; candidates with no known disease association are returned in unmatched_genes.
+    """
+    if not get_engine().loaded:
+        raise HTTPException(status_code=503, detail="Phrank engine is not loaded")
+
+    phenotype_list = request.hpo_codes
+    if phenotype_list is None:
+        phenotype_list = list(load_hpo_codes(session_id).keys())
+    top_n = request.top_n
+    if top_n is None and request.candidate_genes is None:
+        top_n = 20
+
+    try:
+        genes, unmatched = rank_candidate_genes(
+            phenotype_list, request.candidate_genes, top_n=top_n, mode=request.mode
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"genes": genes, "unmatched_genes": unmatched}
+
+# Request body for hot-reloading the Phrank engine; paths must lie in the engine's data directory
+class EngineReloadRequest(BaseModel):
+    ontology_path: Optional[str] = None
+    annotations_path: Optional[str] = None
+
+@app.post("/engine/reload")
+def reload_engine(request: EngineReloadRequest = EngineReloadRequest()):
+    """
+    Reload hp.obo and phenotype.hpoa into the shared Phrank engine (e.g. after an HPO release).
+    Runs in the threadpool; requests in flight keep scoring against the previous snapshot, which
+    also stays active if the new files are rejected or fail to load.
+    """
+    engine = get_engine()
+    try:
+        engine.reload(request.ontology_path, request.annotations_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reloading Phrank engine: {str(e)}")
+    return {
+        "success": True,
+        "ontology_path": engine.ontology_path,
+        "annotations_path": engine.annotations_path,
+    }
+
 # ___________________________ CODE FOR RECOMMENDATIONS ___________________________
 # Define a model for Recommendation
 class Recommendation(BaseModel):
@@ -312,22 +662,26 @@ sample_recommendations = [
 
 # GET route to fetch all recommendations
 @app.get("/recommendations", response_model=RecommendationsResponse)
-async def get_recommendations():
-    """Return recommendations based on the HPO terms in the system.
+async def get_recommendations(session_id: str = Depends(get_session_id)):
+    """Return recommendations based on the session's HPO terms.
     Will only return recommendations if there are HPO terms entered (similar to diagnoses)
     """
-    # Check if there are any HPO codes in the system
-    if not hpo_codes_dict:
+    store = get_session_store()
+    # Check if there are any HPO codes in this session
+    if not load_hpo_codes(session_id):
         # No HPO codes entered yet, return empty list
         return {"recommendations": []}
     
-    # Return only the top 3 recommendations
-    return {"recommendations": sample_recommendations}
+    recommendations = store.get(session_id, "recommendations")
+    if recommendations is None:
+        # Return only the top 3 recommendations
+        recommendations = sample_recommendations
+        store.set(session_id, "recommendations", recommendations)
+    return {"recommendations": recommendations}
 
 
 # ___________________________ CODE FOR CHAT FEATURE ___________________________
-# Define chat_sessions at the module level before using it
-chat_sessions: Dict[str, HPODiagnosisChat] = {}
+# Chats are held by a bounded session manager that parks idle ones on disk
 
 class Message(BaseModel):
     text: str
@@ -345,22 +699,33 @@ async def start_chat(session_id: Optional[str] = None):
     If session_id is provided and exists, return that session.
     If not, create a new session.
     """
-    global chat_sessions
-    
     # If no session_id or session doesn't exist, create a new one
-    if not session_id or session_id not in chat_sessions:
-        session_id = str(uuid.uuid4())
-        chat_sessions[session_id] = HPODiagnosisChat()
+    session_id, chat_instance, _ = get_chat_sessions().get_or_create(session_id)
     
-    # Get the chat instance for this session
-    chat_instance = chat_sessions[session_id]
     welcome_message = chat_instance.start_conversation()
     
     return ChatResponse(message=welcome_message, session_id=session_id)
 
 # Update the send-message endpoint
+def merge_chat_hpo_codes(hpo_session_id: str, identified_hpo_codes: List[Dict[str, Any]]):
+    """
+    Add the chat's HPO codes to the session's HPO codes (source "Chat") so they are used for
+    diagnosis. Only codes validated against the ontology are added.
+    """
+    grounded = [hpo for hpo in identified_hpo_codes if hpo.get("grounding")]
+    if not grounded:
+        return
+    hpo_codes = load_hpo_codes(hpo_session_id)
+    added = False
+    for hpo in grounded:
+        if hpo["hpo_code"] not in hpo_codes:
+            hpo_codes[hpo["hpo_code"]] = {"id": hpo["hpo_code"], "name": hpo["hpo_name"], "source": "Chat"}
+            added = True
+    if added:
+        save_hpo_codes(hpo_session_id, hpo_codes)
+
 @app.post("/send-message", response_model=ChatResponse)
-async def send_message(request_data: dict):
+async def send_message(request_data: dict, hpo_session_id: str = Depends(get_session_id)):
     """
     Send a message to a specific chat session
     """
@@ -370,9 +735,107 @@ async def send_message(request_data: dict):
     if not message_text or not session_id:
         raise HTTPException(status_code=400, detail="Missing message text or session ID")
     
-    if session_id not in chat_sessions:
-        # Create a new session if it doesn't exist
-        chat_sessions[session_id] = HPODiagnosisChat()
-    
-    response = chat_sessions[session_id].process_user_input(message_text)
+    chat_sessions = get_chat_sessions()
+    # Pinned in memory for the whole turn (created if it doesn't exist), so a concurrent
+    # message for this session waits on the same chat instead of rehydrating a copy
+    chat_instance = chat_sessions.checkout(session_id)
+    try:
+        response = await chat_instance.process_user_input(message_text)
+    finally:
+        chat_sessions.checkin(session_id, chat_instance)
+    merge_chat_hpo_codes(hpo_session_id, chat_instance.identified_hpo_codes)
     return ChatResponse(message=response, session_id=session_id)
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_chat_events(chat_sessions, session_id: str, message_text: str, hpo_session_id: str):
+    """Relay a chat turn as SSE: delta events with partial model output, hpo_codes, message, then done."""
+    # Checked out only once the stream starts, so a client that never reads it pins nothing
+    chat_instance = chat_sessions.checkout(session_id)
+    try:
+        async for event, data in chat_instance.stream_user_input(message_text):
+            if event == "delta":
+                yield sse_event("delta", {"text": data})
+            elif event == "hpo_codes":
+                yield sse_event("hpo_codes", {"codes": data})
+            else:
+                yield sse_event("message", {"message": data, "session_id": session_id})
+    except Exception as e:
+        logger.warning(f"Streaming chat turn failed for session {session_id}: {e}")
+        yield sse_event("error", {"detail": str(e)})
+    finally:
+        chat_sessions.checkin(session_id, chat_instance)
+    merge_chat_hpo_codes(hpo_session_id, chat_instance.identified_hpo_codes)
+    yield sse_event("done", {})
+
+@app.post("/send-message/stream")
+async def send_message_stream(request_data: dict, hpo_session_id: str = Depends(get_session_id)):
+    """
+    Streaming variant of /send-message. Responds with server-sent events: "delta" events carrying
+    the model output as it is generated, "hpo_codes" once the identified codes are parsed,
+    then the final formatted "message" and "done".
+    """
+    message_text = request_data.get("text")
+    session_id = request_data.get("session_id")
+    
+    if not message_text or not session_id:
+        raise HTTPException(status_code=400, detail="Missing message text or session ID")
+    
+    return StreamingResponse(
+        stream_chat_events(get_chat_sessions(), session_id, message_text, hpo_session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/chat-sessions/stats")
+async def get_chat_session_stats():
+    """Number of in-memory and parked chat sessions and the memory they hold."""
+    chat_sessions = get_chat_sessions()
+    chat_sessions.evict_idle()
+    return chat_sessions.stats()
+
+@app.get("/chat/verification-cache-stats")
+async def get_verification_cache_stats():
+    """Hit/miss/coalesced counters of the verification question cache."""
+    return get_verification_cache().stats()
+
+# ___________________________ CODE FOR METRICS ___________________________
+# Counters kept by other components are read at scrape time rather than mirrored
+
+def collect_note_cache_metrics():
+    stats = get_note_cache().stats()
+    return [
+        ("cache_requests_total", {"cache": "notes", "result": "hit"}, stats["hits"]),
+        ("cache_requests_total", {"cache": "notes", "result": "miss"}, stats["misses"]),
+    ]
+
+def collect_verification_cache_metrics():
+    stats = get_verification_cache().stats()
+    return [
+        ("cache_requests_total", {"cache": "verification_questions", "result": "hit"}, stats["hits"]),
+        ("cache_requests_total", {"cache": "verification_questions", "result": "coalesced"}, stats["coalesced"]),
+        ("cache_requests_total", {"cache": "verification_questions", "result": "miss"}, stats["misses"]),
+    ]
+
+def collect_session_metrics():
+    chat_sessions = get_chat_sessions()
+    return [
+        ("sessions", {}, get_session_store().session_count()),
+        ("chat_sessions", {"state": "active"}, chat_sessions.active_count()),
+        ("chat_session_events_total", {"event": "created"}, chat_sessions.created),
+        ("chat_session_events_total", {"event": "evicted"}, chat_sessions.evictions),
+        ("chat_session_events_total", {"event": "rehydrated"}, chat_sessions.rehydrations),
+    ]
+
+for collector in (collect_note_cache_metrics, collect_verification_cache_metrics, collect_session_metrics):
+    get_metrics().register_collector(collector)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """
+    Prometheus text exposition of stage timings (ontology/annotation loading, scoring, ClinPhen,
+    LLM calls), per-route request latency, cache hit counters, session counts and subprocess spawns.
+    """
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,273 @@
+import logging
+import os
+from array import array
+
+from app.utils.binary_cache import file_checksum, read_array_file, write_array_file
+from app.utils.metrics import count_cache
+
+logger = logging.getLogger(__name__)
+
+ANNOTATION_MAGIC = b"HPOANNO1"
+ANNOTATION_FORMAT_VERSION = 1
+
+# Frequency value stored for annotations that do not state one
+NO_FREQUENCY = 0xFFFFFFFF
+# Frequencies are stored as integers in units of 1/FREQUENCY_SCALE
+FREQUENCY_SCALE = 10000
+
+# Midpoints of the HPO frequency subontology classes; "Excluded" (0%) is treated like NOT
+HPO_FREQUENCY_TERMS = {
+    "HP:0040280": 1.0,     # Obligate
+    "HP:0040281": 0.895,   # Very frequent (80-99%)
+    "HP:0040282": 0.545,   # Frequent (30-79%)
+    "HP:0040283": 0.17,    # Occasional (5-29%)
+    "HP:0040284": 0.025,   # Very rare (1-4%)
+    "HP:0040285": 0.0,     # Excluded
+}
+
+
+def parse_frequency(value):
+    """Parse a phenotype.hpoa frequency ("HP:0040281", "3/7" or "50%") into [0, 1], or None."""
+    value = value.strip()
+    if not value:
+        return None
+    if value in HPO_FREQUENCY_TERMS:
+        return HPO_FREQUENCY_TERMS[value]
+    try:
+        if value.endswith("%"):
+            return min(max(float(value[:-1]) / 100.0, 0.0), 1.0)
+        if "/" in value:
+            numerator, denominator = value.split("/", 1)
+            return min(max(int(numerator) / int(denominator), 0.0), 1.0)
+    except (ValueError, ZeroDivisionError):
+        pass
+    return None
+
+
+class AnnotationTable:
+    """
+    Integer-coded view of phenotype.hpoa (and optionally genes_to_disease.txt).
+
+    Diseases, HPO terms and genes are interned to integers. The annotations of disease i
+    are terms[offsets[i]:offsets[i + 1]], with their frequency and aspect at the same
+    positions in frequencies and aspects; its genes are genes[gene_offsets[i]:gene_offsets[i + 1]].
+    All of these are flat uint32 buffers, so a table costs a few bytes per annotation, can
+    be memory-mapped from a cache file and is shared copy-on-write by forked workers.
+    """
+
+    def __init__(self, disease_ids, disease_names, term_ids, gene_symbols, offsets, terms, frequencies, aspects,
+                 gene_offsets, genes, _mmap=None):
+        self.disease_ids = disease_ids
+        self.disease_names = disease_names
+        self.term_ids = term_ids
+        self.gene_symbols = gene_symbols
+        self.offsets = offsets
+        self.terms = terms
+        self.frequencies = frequencies
+        self.aspects = aspects
+        self.gene_offsets = gene_offsets
+        self.genes = genes
+        self.disease_index = {disease_id: index for index, disease_id in enumerate(disease_ids)}
+        self._mmap = _mmap
+
+    def __len__(self):
+        return len(self.disease_ids)
+
+    def terms_of(self, index):
+        """Term indices annotated to the disease at position index."""
+        return self.terms[self.offsets[index]:self.offsets[index + 1]]
+
+    def genes_of(self, index):
+        """Gene indices associated with the disease at position index."""
+        return self.genes[self.gene_offsets[index]:self.gene_offsets[index + 1]]
+
+    def annotations_of(self, index):
+        """(hpo_id, frequency or None, aspect) for every annotation of the disease at position index."""
+        result = []
+        for position in range(self.offsets[index], self.offsets[index + 1]):
+            frequency = self.frequencies[position]
+            result.append((
+                self.term_ids[self.terms[position]],
+                None if frequency == NO_FREQUENCY else frequency / FREQUENCY_SCALE,
+                chr(self.aspects[position]),
+            ))
+        return result
+
+    def disease_to_hpo(self):
+        """disease id -> set of annotated HPO ids, the layout read_disease_annotations returns."""
+        term_ids = self.term_ids
+        return {
+            disease_id: {term_ids[term] for term in self.terms_of(index)}
+            for index, disease_id in enumerate(self.disease_ids)
+        }
+
+    def disease_to_genes(self):
+        """disease id -> set of gene symbols."""
+        gene_symbols = self.gene_symbols
+        return {
+            disease_id: {gene_symbols[gene] for gene in self.genes_of(index)}
+            for index, disease_id in enumerate(self.disease_ids)
+        }
+
+    def disease_to_name(self):
+        return dict(zip(self.disease_ids, self.disease_names))
+
+    @classmethod
+    def parse(cls, annotations_path, genes_path=None, aspects=None):
+        """
+        Read phenotype.hpoa. Comment lines and the column header are skipped, as are negated
+        (qualifier NOT) and excluded-frequency annotations. If aspects is given, only
+        annotations with those aspects (P, I, C, M, H) are kept.
+        """
+        disease_ids, disease_names, term_ids = [], [], []
+        disease_index, term_index = {}, {}
+        disease_annotations = []
+
+        with open(annotations_path, "r", encoding="utf-8") as anno_handle:
+            for line in anno_handle:
+                if line.startswith("#") or line.startswith("database_id"):
+                    continue  # Skip comments and the column header
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 4:
+                    continue  # Skip malformed lines
+
+                disease_id, disease_name, qualifier, hpo_id = fields[:4]
+                frequency = parse_frequency(fields[7]) if len(fields) > 7 else None
+                aspect = fields[10].strip() if len(fields) > 10 else ""
+                if qualifier.strip().upper() == "NOT" or frequency == 0.0:
+                    continue
+                if aspects is not None and aspect not in aspects:
+                    continue
+
+                if disease_id not in disease_index:
+                    disease_index[disease_id] = len(disease_ids)
+                    disease_ids.append(disease_id)
+                    disease_names.append(disease_name)
+                    disease_annotations.append({})
+                if hpo_id not in term_index:
+                    term_index[hpo_id] = len(term_ids)
+                    term_ids.append(hpo_id)
+                # One entry per (disease, term): keep the highest stated frequency
+                annotations = disease_annotations[disease_index[disease_id]]
+                term = term_index[hpo_id]
+                previous = annotations.get(term)
+                if previous is None or (frequency is not None and (previous[0] is None or frequency > previous[0])):
+                    annotations[term] = (frequency, aspect)
+
+        offsets, terms, frequencies, aspect_codes = array("I", [0]), array("I"), array("I"), array("I")
+        for annotations in disease_annotations:
+            for term in sorted(annotations):
+                frequency, aspect = annotations[term]
+                terms.append(term)
+                frequencies.append(NO_FREQUENCY if frequency is None else int(round(frequency * FREQUENCY_SCALE)))
+                aspect_codes.append(ord(aspect[0]) if aspect else ord("?"))
+            offsets.append(len(terms))
+
+        gene_symbols, gene_offsets, genes = cls._parse_genes(genes_path, disease_index)
+        return cls(disease_ids, disease_names, term_ids, gene_symbols, offsets, terms, frequencies, aspect_codes,
+                   gene_offsets, genes)
+
+    @staticmethod
+    def _parse_genes(genes_path, disease_index):
+        """
+        Read disease -> gene associations from an HPO genes_to_disease.txt-style file, locating
+        the gene_symbol and disease_id columns from its header.
+        """
+        disease_genes = [set() for _ in disease_index]
+        gene_symbols, gene_index = [], {}
+        if genes_path:
+            with open(genes_path, "r", encoding="utf-8") as genes_handle:
+                symbol_column = disease_column = None
+                for line in genes_handle:
+                    fields = line.rstrip("\n").split("\t")
+                    if symbol_column is None:
+                        header = [field.lstrip("#").strip() for field in fields]
+                        if "gene_symbol" in header and "disease_id" in header:
+                            symbol_column, disease_column = header.index("gene_symbol"), header.index("disease_id")
+                        continue
+                    if len(fields) <= max(symbol_column, disease_column):
+                        continue
+                    disease = disease_index.get(fields[disease_column])
+                    if disease is None:
+                        continue
+                    symbol = fields[symbol_column]
+                    if symbol not in gene_index:
+                        gene_index[symbol] = len(gene_symbols)
+                        gene_symbols.append(symbol)
+                    disease_genes[disease].add(gene_index[symbol])
+
+        gene_offsets, genes = array("I", [0]), array("I")
+        for gene_set in disease_genes:
+            genes.extend(sorted(gene_set))
+            gene_offsets.append(len(genes))
+        return gene_symbols, gene_offsets, genes
+
+    def save(self, path):
+        """Write the table to path atomically."""
+        header = {
+            "version": ANNOTATION_FORMAT_VERSION,
+            "disease_ids": self.disease_ids,
+            "disease_names": self.disease_names,
+            "term_ids": self.term_ids,
+            "gene_symbols": self.gene_symbols,
+        }
+        write_array_file(path, ANNOTATION_MAGIC, header, [
+            ("offsets", self.offsets),
+            ("terms", self.terms),
+            ("frequencies", self.frequencies),
+            ("aspects", self.aspects),
+            ("gene_offsets", self.gene_offsets),
+            ("genes", self.genes),
+        ])
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a table previously written by save()."""
+        header, arrays, mapped = read_array_file(path, ANNOTATION_MAGIC)
+        if header.get("version") != ANNOTATION_FORMAT_VERSION:
+            raise ValueError(f"Unsupported annotation cache version in {path}")
+        return cls(
+            header["disease_ids"], header["disease_names"], header["term_ids"], header["gene_symbols"],
+            arrays["offsets"], arrays["terms"], arrays["frequencies"], arrays["aspects"],
+            arrays["gene_offsets"], arrays["genes"], _mmap=mapped,
+        )
+
+
+def annotation_cache_key(annotations_path, genes_path=None, aspects=None):
+    """Checksum-based key identifying a table built from these inputs and aspect filter."""
+    key = file_checksum(annotations_path)[:16]
+    if genes_path:
+        key += f"-{file_checksum(genes_path)[:16]}"
+    if aspects is not None:
+        key += "-" + "".join(sorted(aspects))
+    return key
+
+
+def load_annotations(annotations_path, genes_path=None, cache_dir=None, aspects=None):
+    """
+    Load an AnnotationTable, reusing a binary cache in cache_dir keyed by the input
+    checksums when available and writing one otherwise. A missing genes_path is ignored.
+    """
+    if genes_path and not os.path.exists(genes_path):
+        logger.warning(f"Gene annotations {genes_path} not found, diseases will have no genes")
+        genes_path = None
+    if cache_dir is None:
+        return AnnotationTable.parse(annotations_path, genes_path, aspects)
+
+    cache_path = os.path.join(cache_dir, f"annotations-{annotation_cache_key(annotations_path, genes_path, aspects)}.bin")
+    if os.path.exists(cache_path):
+        try:
+            table = AnnotationTable.load(cache_path)
+            count_cache("annotations", hit=True)
+            return table
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable annotation cache {cache_path}: {e}")
+    count_cache("annotations", hit=False)
+
+    table = AnnotationTable.parse(annotations_path, genes_path, aspects)
+    try:
+        table.save(cache_path)
+        return AnnotationTable.load(cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write annotation cache {cache_path}: {e}")
+        return table
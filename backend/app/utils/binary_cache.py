@@ -0,0 +1,99 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_array_file(path, magic, header, arrays):
+    """
+    Atomically write a JSON header followed by named uint32 arrays.
+
+    Layout: magic | uint64 header length | JSON header (padded to 4 bytes) | arrays in order.
+    The array lengths are recorded in the header so read_array_file can slice them back out.
+    """
+    header = dict(header, arrays=[[name, len(values)] for name, values in arrays])
+    encoded = json.dumps(header).encode("utf-8")
+    # Pad the header so the uint32 arrays that follow are 4-byte aligned
+    encoded += b" " * (-(len(magic) + 8 + len(encoded)) % 4)
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    handle = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+    try:
+        with handle:
+            handle.write(magic)
+            handle.write(struct.pack("<Q", len(encoded)))
+            handle.write(encoded)
+            for _, values in arrays:
+                handle.write(array("I", values).tobytes())
+        os.replace(handle.name, path)
+    except BaseException:
+        # Do not leave a partial temp file behind in the cache directory
+        try:
+            os.unlink(handle.name)
+        except OSError:
+            pass
+        raise
+
+
+def read_array_file(path, magic):
+    """
+    Memory-map a file written by write_array_file.
+
+    Returns (header, arrays, mapped) where arrays maps each name to a read-only uint32
+    memoryview on the map. Keep mapped alive for as long as the views are in use.
+    Raises ValueError if the file is not of this type or is truncated or malformed.
+    """
+    with open(path, "rb") as handle:
+        try:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files
+            raise ValueError(f"Empty file {path}") from None
+
+    try:
+        header, layout = _read_layout(path, magic, mapped)
+    except ValueError:
+        mapped.close()
+        raise
+
+    view = memoryview(mapped)
+    arrays = {name: view[offset:offset + 4 * length].cast("I") for name, offset, length in layout}
+    return header, arrays, mapped
+
+
+def _read_layout(path, magic, mapped):
+    """Parse and bounds-check the header; returns (header, [(name, byte offset, length)])."""
+    start = len(magic) + 8
+    if len(mapped) < start or mapped[:len(magic)] != magic:
+        raise ValueError(f"Unexpected file type for {path}")
+    (header_len,) = struct.unpack("<Q", mapped[len(magic):start])
+    position = start + header_len
+    if position > len(mapped):
+        raise ValueError(f"Truncated header in {path}")
+    # JSONDecodeError and UnicodeDecodeError are both ValueErrors
+    header = json.loads(mapped[start:position].decode("utf-8"))
+    try:
+        entries = [(str(name), int(length)) for name, length in header["arrays"]]
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed header in {path}: {e!r}") from None
+
+    layout = []
+    for name, length in entries:
+        if length < 0 or position + 4 * length > len(mapped):
+            raise ValueError(f"Truncated array {name!r} in {path}")
+        layout.append((name, position, length))
+        position += 4 * length
+    return header, layout
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from app.utils.llm_chat import HPODiagnosisChat
+
+logger = logging.getLogger(__name__)
+
+# Chats kept in memory, idle time before a chat is parked on disk, where parked chats are
+# written, and how long a parked chat may stay unused before it is deleted for good
+CHAT_SESSION_MAX = int(os.environ.get("CHAT_SESSION_MAX", "1000"))
+CHAT_SESSION_IDLE_SECONDS = float(os.environ.get("CHAT_SESSION_IDLE_SECONDS", str(30 * 60)))
+CHAT_SESSION_DIR = os.environ.get("CHAT_SESSION_DIR", "/code/app/data/chat_sessions")
+CHAT_SESSION_DISK_TTL_SECONDS = float(os.environ.get("CHAT_SESSION_DISK_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+# How many evictions happen between scans of the spill directory for expired chats
+_PRUNE_EVERY = 100
+
+
+class ChatSessionManager:
+    """
+    Bounded registry of HPODiagnosisChat sessions.
+
+    At most max_sessions chats are kept in memory. Chats idle for longer than idle_seconds,
+    and the least recently used ones beyond the cap, are serialized to spill_dir and
+    transparently rehydrated the next time their session id is used. Chats checked out
+    for a turn (checkout() ... checkin()) are pinned in memory until the turn ends, so a
+    second message for the same session always finds the same instance.
+    """
+
+    def __init__(self, max_sessions=CHAT_SESSION_MAX, idle_seconds=CHAT_SESSION_IDLE_SECONDS,
+                 spill_dir=CHAT_SESSION_DIR, disk_ttl_seconds=CHAT_SESSION_DISK_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.spill_dir = spill_dir
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self.created = 0
+        self.evictions = 0
+        self.rehydrations = 0
+        # session_id -> (chat, last used), least recently used first
+        self._sessions = OrderedDict()
+        # session_id -> number of turns in flight; pinned chats are never evicted
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the chat for session_id, rehydrating it from disk if needed (None if unknown)."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                self._sessions[session_id] = (entry[0], now)
+                self._sessions.move_to_end(session_id)
+                return entry[0]
+
+        chat = self._rehydrate(session_id)
+        if chat is not None:
+            self.put(session_id, chat)
+        return chat
+
+    def get_or_create(self, session_id=None):
+        """Return (session_id, chat, created), creating a chat under a new id if session_id is unknown."""
+        chat = self.get(session_id) if session_id else None
+        if chat is not None:
+            return session_id, chat, False
+        return self.create() + (True,)
+
+    def create(self, session_id=None):
+        """Start a new chat, under a fresh id unless session_id is given. Returns (session_id, chat)."""
+        session_id = session_id or str(uuid.uuid4())
+        chat = HPODiagnosisChat()
+        self.put(session_id, chat)
+        with self._lock:
+            self.created += 1
+        return session_id, chat
+
+    def checkout(self, session_id):
+        """
+        Return the chat for session_id (rehydrated, or created under that id if unknown),
+        pinned in memory until the matching checkin().
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                self._pins[session_id] = self._pins.get(session_id, 0) + 1
+                self._sessions[session_id] = (entry[0], time.time())
+                self._sessions.move_to_end(session_id)
+                return entry[0]
+
+        chat = self._rehydrate(session_id)
+        created = chat is None
+        if created:
+            chat = HPODiagnosisChat()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                # Registered by another caller in the meantime: share that instance
+                chat, created = entry[0], False
+            if created:
+                self.created += 1
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+            self._sessions[session_id] = (chat, time.time())
+            self._sessions.move_to_end(session_id)
+            evicted = self._pop_evictable()
+        for evicted_id, evicted_chat in evicted:
+            self._spill(evicted_id, evicted_chat)
+        return chat
+
+    def checkin(self, session_id, chat):
+        """End a turn started with checkout(): unpin the chat and mark it as just used."""
+        with self._lock:
+            pins = self._pins.get(session_id, 0) - 1
+            if pins > 0:
+                self._pins[session_id] = pins
+            else:
+                self._pins.pop(session_id, None)
+        self.put(session_id, chat)
+
+    def put(self, session_id, chat):
+        """Register chat under session_id as the most recently used, evicting others if needed."""
+        with self._lock:
+            self._sessions[session_id] = (chat, time.time())
+            self._sessions.move_to_end(session_id)
+            evicted = self._pop_evictable()
+        for evicted_id, evicted_chat in evicted:
+            self._spill(evicted_id, evicted_chat)
+
+    def active_count(self):
+        """Number of chats currently held in memory."""
+        with self._lock:
+            return len(self._sessions)
+
+    def evict_idle(self):
+        """Park every chat that has been idle past idle_seconds on disk."""
+        with self._lock:
+            evicted = self._pop_evictable()
+        for session_id, chat in evicted:
+            self._spill(session_id, chat)
+
+    def spill_all(self):
+        """Park every in-memory chat on disk, e.g. on shutdown so a restart can pick them up."""
+        with self._lock:
+            sessions = [(session_id, chat) for session_id, (chat, _) in self._sessions.items()]
+            self._sessions.clear()
+        for session_id, chat in sessions:
+            self._spill(session_id, chat)
+
+    def stats(self):
+        """Session counts and an estimate of the memory held by in-memory chats."""
+        with self._lock:
+            chats = [chat for chat, _ in self._sessions.values()]
+            stats = {
+                "active_sessions": len(chats),
+                "max_sessions": self.max_sessions,
+                "created": self.created,
+                "evictions": self.evictions,
+                "rehydrations": self.rehydrations,
+            }
+        stats["spilled_sessions"] = sum(1 for _ in self._spilled_files())
+        stats["session_bytes"] = sum(len(json.dumps(chat.to_dict())) for chat in chats)
+        # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stats["process_peak_rss_bytes"] = peak_rss if sys.platform == "darwin" else peak_rss * 1024
+        return stats
+
+    def _pop_evictable(self):
+        """
+        Remove idle chats and chats over the cap (caller holds the lock) and return them.
+        Pinned chats are skipped, so the cap can be exceeded while many turns are in flight.
+        """
+        evicted = []
+        deadline = time.time() - self.idle_seconds
+        for session_id, (chat, last_used) in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions and last_used >= deadline:
+                break
+            if session_id in self._pins:
+                continue
+            del self._sessions[session_id]
+            evicted.append((session_id, chat))
+        self.evictions += len(evicted)
+        return evicted
+
+    def _spill_path(self, session_id):
+        # Session ids come from clients, so never use them as file names directly
+        digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest[:32]}.json")
+
+    def _spill(self, session_id, chat):
+        path = self._spill_path(session_id)
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=self.spill_dir, delete=False, encoding="utf-8") as handle:
+                json.dump({"session_id": session_id, "chat": chat.to_dict()}, handle)
+                temp_path = handle.name
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not park chat session {session_id} on disk, dropping it: {e}")
+            return
+        if self.evictions % _PRUNE_EVERY == 0:
+            self._prune_spilled()
+
+    def _rehydrate(self, session_id):
+        path = self._spill_path(session_id)
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                state = json.load(handle)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable chat session file {path}: {e}")
+            return None
+        if state.get("session_id") != session_id:
+            return None
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.rehydrations += 1
+        return HPODiagnosisChat.from_dict(state["chat"])
+
+    def _spilled_files(self):
+        try:
+            names = os.listdir(self.spill_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith(".json"):
+                yield os.path.join(self.spill_dir, name)
+
+    def _prune_spilled(self):
+        """Delete parked chats that have not been used for disk_ttl_seconds."""
+        deadline = time.time() - self.disk_ttl_seconds
+        for path in self._spilled_files():
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_chat_sessions = None
+
+
+def get_chat_sessions():
+    """Return the process-wide ChatSessionManager."""
+    global _chat_sessions
+    if _chat_sessions is None:
+        _chat_sessions = ChatSessionManager()
+    return _chat_sessions
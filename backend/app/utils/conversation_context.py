@@ -0,0 +1,120 @@
+import os
+
+# Tokens the conversation part of a symptom-analysis prompt may use, and the share of it the
+# running summary may take. Tokens are estimated from characters, which is close enough for
+# budgeting English text without shipping a tokenizer.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("CHAT_SUMMARY_TOKEN_BUDGET", "400"))
+# HPO candidates carried between turns
+MAX_CANDIDATES = int(os.environ.get("CHAT_MAX_CANDIDATES", "10"))
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to about max_tokens, on a word boundary where possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars - 1)
+    return text[:cut if cut > max_chars // 2 else max_chars - 1].rstrip() + "…"
+
+
+class ConversationContext:
+    """
+    Incrementally maintained context for the symptom-analysis prompt.
+
+    Instead of replaying the conversation, each prompt carries the running symptom summary
+    (rewritten by the model on every analysis), the HPO candidates found so far, and only
+    the patient messages received since the last analysis. All three are trimmed to a token
+    budget, so prompt size stays flat however long the conversation gets.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET,
+                 max_candidates=MAX_CANDIDATES):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.max_candidates = max_candidates
+        self.summary = ""
+        # hpo_code -> {"hpo_code", "hpo_name", "confidence"}, most recently proposed last
+        self.candidates = {}
+        # Patient messages (with the question they answer, if any) not yet folded into the summary
+        self.pending = []
+
+    def add_user_message(self, text, question=None):
+        """Queue a patient message for the next analysis."""
+        self.pending.append({"question": question, "text": text})
+
+    def apply_analysis(self, result):
+        """Fold a symptom-analysis result in: new summary, merged candidates, nothing pending."""
+        summary = result.get("symptom_summary")
+        if isinstance(summary, str) and summary.strip():
+            self.summary = truncate_to_tokens(summary.strip(), self.summary_budget)
+        elif self.pending:
+            # No summary came back; keep the new messages so they are not lost
+            self.summary = truncate_to_tokens(
+                " ".join(filter(None, [self.summary] + [entry["text"] for entry in self.pending])),
+                self.summary_budget
+            )
+        for hpo in result.get("identified_hpo_codes", []):
+            code = hpo.get("hpo_code")
+            if not code:
+                continue
+            self.candidates.pop(code, None)
+            self.candidates[code] = {
+                "hpo_code": code,
+                "hpo_name": hpo.get("hpo_name"),
+                "confidence": hpo.get("confidence")
+            }
+        while len(self.candidates) > self.max_candidates:
+            del self.candidates[next(iter(self.candidates))]
+        self.pending = []
+
+    def prompt_sections(self):
+        """
+        Return (summary, candidates, new_messages) as prompt-ready text within the token budget.
+        The summary and candidates are kept first; the newest pending messages fill what is
+        left, and older ones that do not fit are left out.
+        """
+        summary = self.summary or "Nothing reported yet."
+        remaining = self.token_budget - estimate_tokens(summary)
+
+        candidate_lines = []
+        for candidate in reversed(list(self.candidates.values())):
+            line = f"- {candidate['hpo_code']} {candidate['hpo_name']} ({candidate['confidence']} confidence)"
+            if estimate_tokens(line) > remaining // 4:
+                break
+            candidate_lines.append(line)
+            remaining -= estimate_tokens(line)
+        candidates = "\n".join(reversed(candidate_lines)) or "None yet."
+
+        message_lines = []
+        for entry in reversed(self.pending):
+            line = f"Q: {entry['question']}\nA: {entry['text']}" if entry["question"] else entry["text"]
+            if estimate_tokens(line) > remaining:
+                if not message_lines:
+                    # Always include (the start of) the newest message
+                    message_lines.append(truncate_to_tokens(line, max(remaining, 1)))
+                break
+            message_lines.append(line)
+            remaining -= estimate_tokens(line)
+        omitted = len(self.pending) - len(message_lines)
+        if omitted:
+            message_lines.append(f"({omitted} earlier message(s) omitted)")
+        new_messages = "\n".join(reversed(message_lines)) or "No new information."
+
+        return summary, candidates, new_messages
+
+    def to_dict(self):
+        return {"summary": self.summary, "candidates": list(self.candidates.values()), "pending": self.pending}
+
+    @classmethod
+    def from_dict(cls, state):
+        context = cls()
+        context.summary = state.get("summary", "")
+        context.candidates = {candidate["hpo_code"]: candidate for candidate in state.get("candidates", [])}
+        context.pending = state.get("pending", [])
+        return context
@@ -1,20 +1,472 @@
+import logging
 import math
-from collections import defaultdict
-from pronto import Ontology
-
-def diagnose_helper(phenotype_list):
-    # load data
-    ontology_path = "/code/app/data/hp.obo" 
-    hpo_annotations_path = "/code/app/data/phenotype.hpoa"
-    ontology = load_ontology(ontology_path)
-    
-    # setup computational helpers
-    disease_to_hpo, disease_to_genes, disease_to_name = read_disease_annotations(hpo_annotations_path)
-    ancestor_dict = precompute_ancestors(ontology)
-
-    # score using Phrank algorithm
-    ranked_diseases = phrank_score(phenotype_list, disease_to_hpo, ancestor_dict, top_n=5)
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.utils.annotations import AnnotationTable, annotation_cache_key, load_annotations
+from app.utils.hpo_grounding import HPOGrounder
+from app.utils.metrics import count, span
+from app.utils.ontology import load_obo_graph
+from app.utils.phenotype_matcher import PhenotypeMatcher
+from app.utils.profiles import load_or_build_profiles
+from app.utils.phrank_matrix import GenePhrankScorer, IncrementalScorer, InvertedPhrankScorer, SparsePhrankScorer
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONTOLOGY_PATH = os.environ.get("PHRANK_ONTOLOGY_PATH", "/code/app/data/hp.obo")
+DEFAULT_ANNOTATIONS_PATH = os.environ.get("PHRANK_ANNOTATIONS_PATH", "/code/app/data/phenotype.hpoa")
+DEFAULT_GENES_PATH = os.environ.get("PHRANK_GENES_PATH", "/code/app/data/genes_to_disease.txt")
+DEFAULT_CACHE_DIR = os.environ.get("PHRANK_CACHE_DIR", "/code/app/data/cache")
+# Directory a reload may point the engine at new ontology / annotation files in
+DATA_DIR = os.environ.get("PHRANK_DATA_DIR", os.path.dirname(DEFAULT_ONTOLOGY_PATH))
+# Comma-separated phenotype.hpoa aspects (P, I, C, M, H) to build disease profiles from; all if unset
+DEFAULT_ASPECTS = os.environ.get("PHRANK_ANNOTATION_ASPECTS") or None
+# "matrix" scores with a sparse mat-vec, "inverted" term-at-a-time over the term -> disease
+# index with top-k early termination, "sets" with per-disease set intersections
+DEFAULT_BACKEND = os.environ.get("PHRANK_BACKEND", "matrix")
+SCORING_BACKENDS = ("matrix", "inverted", "sets")
+# Backends built on the disease x term incidence matrix (batch and incremental scoring use it)
+MATRIX_BACKENDS = ("matrix", "inverted")
+# "count" scores by number of shared terms, "ic" weights each shared term by its conditional IC
+DEFAULT_MODE = os.environ.get("PHRANK_MODE", "count")
+SCORING_MODES = ("count", "ic")
+# Batches larger than one shard are split across a process pool of this many workers
+BATCH_SHARD_SIZE = int(os.environ.get("PHRANK_BATCH_SHARD_SIZE", "256"))
+# Default to the CPUs this process may run on (cgroup / taskset limits), not the host's count
+_AVAILABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+BATCH_WORKERS = int(os.environ.get("PHRANK_BATCH_WORKERS", str(_AVAILABLE_CPUS)))
+# Sessions whose running score vectors are kept for incremental re-scoring (least recently used dropped)
+SESSION_SCORERS = int(os.environ.get("PHRANK_SESSION_SCORERS", "128"))
+
+
+class PhrankEngine:
+    """
+    Long-lived holder of the ontology and annotation state used for Phrank scoring.
+
+    The engine is built once (at API startup) and shared by every request, so hp.obo and
+    phenotype.hpoa are parsed a single time instead of on each diagnosis. Call reload() when
+    the HPO release changes; requests already in flight keep using the previous snapshot.
+    """
+
+    def __init__(self, ontology_path=DEFAULT_ONTOLOGY_PATH, annotations_path=DEFAULT_ANNOTATIONS_PATH,
+                 cache_dir=DEFAULT_CACHE_DIR, backend=DEFAULT_BACKEND, mode=DEFAULT_MODE,
+                 genes_path=DEFAULT_GENES_PATH, aspects=DEFAULT_ASPECTS, session_scorers=SESSION_SCORERS,
+                 batch_workers=BATCH_WORKERS, preload_text_indexes=True):
+        if backend not in SCORING_BACKENDS:
+            raise ValueError(f"Unknown Phrank backend {backend!r}, expected one of {SCORING_BACKENDS}")
+        check_scoring_mode(mode)
+        self.ontology_path = ontology_path
+        self.annotations_path = annotations_path
+        self.genes_path = genes_path
+        self.aspects = set(aspects.split(",")) if isinstance(aspects, str) else aspects
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.mode = mode
+        self.session_scorers = session_scorers
+        self.batch_workers = batch_workers
+        # Build the note / code matching indexes with the snapshot, off the request path
+        self.preload_text_indexes = preload_text_indexes
+        self._state = None
+        self._reload_lock = threading.Lock()
+        # (session_id, mode) -> (state, IncrementalScorer), least recently used first
+        self._session_scorers = OrderedDict()
+        self._session_lock = threading.Lock()
+        # Persistent process pool for large batches, started on first use
+        self._batch_pool = None
+        self._batch_pool_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    def load(self):
+        """Parse the ontology and annotations and swap them in as the active snapshot."""
+        with self._reload_lock:
+            self._state = self._build_state()
+        self._snapshot_changed()
+        return self
+
+    def _snapshot_changed(self):
+        # Running scores refer to the previous snapshot's disease and term indices
+        with self._session_lock:
+            self._session_scorers.clear()
+        # Batch workers hold their own copy of the previous snapshot; batches already
+        # submitted finish on it and the next batch starts a fresh pool
+        self.shutdown_batch_pool()
+
+    def _build_state(self, ontology_path=None, annotations_path=None):
+        ontology_path = ontology_path or self.ontology_path
+        annotations_path = annotations_path or self.annotations_path
+        # The native OBO loader (with its own binary cache) replaces pronto on the startup path
+        with span("ontology_load"):
+            ontology = load_obo_graph(ontology_path, self.cache_dir)
+        # Integer-coded annotations, memory-mapped from a cache keyed by the input checksums
+        with span("annotation_load"):
+            annotations = load_annotations(annotations_path, self.genes_path, self.cache_dir, self.aspects)
+        # A file that parses to nothing (wrong path, truncated download) would silently score every disease 0
+        if not len(ontology):
+            raise ValueError(f"No HPO terms found in {ontology_path}")
+        if not len(annotations):
+            raise ValueError(f"No disease annotations found in {annotations_path}")
+        with span("ancestor_expansion"):
+            ancestor_dict = ontology.ancestor_dict()
+            parent_dict = ontology.parent_dict()
+        # Expanded disease profiles are cached on disk keyed by the input checksums
+        with span("profile_load"):
+            profiles = load_or_build_profiles(
+                self.cache_dir, ontology_path, annotation_cache_key(annotations_path, aspects=self.aspects),
+                annotations, ancestor_dict
+            )
+        with span("matrix_build"):
+            matrix = (InvertedPhrankScorer if self.backend == "inverted" else SparsePhrankScorer)(profiles)
+            term_ic = matrix.information_content(parent_dict)
+        count("engine_loads_total")
+        state = {
+            "ontology": ontology,
+            "annotations": annotations,
+            "disease_to_name": annotations.disease_to_name(),
+            "ancestor_dict": ancestor_dict,
+            "profiles": profiles,
+            "matrix": matrix,
+            # Per-term conditional IC, aligned with the profile term vocabulary
+            "term_ic": term_ic,
+        }
+        if self.preload_text_indexes:
+            # Compiling the matcher and grounder takes a noticeable fraction of a second each on the
+            # full hp.obo; doing it here keeps it out of async handlers (load runs at startup or in
+            # the threadpool)
+            with span("matcher_build"):
+                state["matcher"] = PhenotypeMatcher.from_ontology(ontology)
+            with span("grounder_build"):
+                state["grounder"] = HPOGrounder(ontology)
+        return state
+
+    def reload(self, ontology_path=None, annotations_path=None):
+        """
+        Hot-reload the engine, optionally pointing it at a new HPO release inside DATA_DIR.
+        The new paths are only kept once the new snapshot has been built; on any error the
+        engine keeps its previous snapshot and paths.
+        """
+        ontology_path = check_data_path(ontology_path) if ontology_path else self.ontology_path
+        annotations_path = check_data_path(annotations_path) if annotations_path else self.annotations_path
+        with self._reload_lock:
+            self._state = self._build_state(ontology_path, annotations_path)
+            self.ontology_path, self.annotations_path = ontology_path, annotations_path
+        self._snapshot_changed()
+        return self
+
+    def snapshot(self):
+        """Return the active state, loading it on first use."""
+        if self._state is None:
+            with self._reload_lock:
+                if self._state is None:
+                    self._state = self._build_state()
+        return self._state
+
+    def lookup_names(self, hpo_ids):
+        """Resolve HPO ids (including alt_ids and replaced obsolete ids) to term names."""
+        return self.snapshot()["ontology"].lookup_names(hpo_ids)
+
+    def phenotype_matcher(self):
+        """
+        The in-process PhenotypeMatcher for this snapshot's hp.obo, built with the snapshot
+        (compiled on first use if preload_text_indexes is off).
+        """
+        state = self.snapshot()
+        if "matcher" not in state:
+            with span("matcher_build"):
+                state["matcher"] = PhenotypeMatcher.from_ontology(state["ontology"])
+        return state["matcher"]
+
+    def hpo_grounder(self):
+        """
+        The HPOGrounder validating HPO codes against this snapshot's hp.obo, built with the
+        snapshot (on first use if preload_text_indexes is off).
+        """
+        state = self.snapshot()
+        if "grounder" not in state:
+            with span("grounder_build"):
+                state["grounder"] = HPOGrounder(state["ontology"])
+        return state["grounder"]
+
+    def gene_scorer(self):
+        """The GenePhrankScorer for this snapshot's annotations and genes, built on first use."""
+        state = self.snapshot()
+        if "genes" not in state:
+            with span("gene_matrix_build"):
+                state["genes"] = GenePhrankScorer(state["matrix"], state["annotations"])
+        return state["genes"]
+
+    def resolve_terms(self, phenotype_list):
+        """Map HPO ids to their current primary ids (alt_id / replaced_by), dropping unknown ones."""
+        ontology = self.snapshot()["ontology"]
+        resolved = (ontology.resolve_id(hpo_id) for hpo_id in phenotype_list)
+        return [hpo_id for hpo_id in resolved if hpo_id is not None]
+
+    def score(self, phenotype_list, top_n=5, mode=None):
+        """Rank diseases for a list of HPO ids using the "count" or "ic" scoring mode."""
+        mode = check_scoring_mode(mode or self.mode)
+        state = self.snapshot()
+        with span("scoring"):
+            phenotype_list = self.resolve_terms(phenotype_list)
+            term_weights = state["term_ic"] if mode == "ic" else None
+            if self.backend in MATRIX_BACKENDS:
+                expanded_query = expand_query_terms(phenotype_list, state["ancestor_dict"])
+                return state["matrix"].rank(expanded_query, top_n=top_n, term_weights=term_weights)
+            return phrank_score_profiles(
+                phenotype_list, state["profiles"], state["ancestor_dict"], top_n=top_n, term_weights=term_weights
+            )
+
+    def session_scorer(self, session_id, mode):
+        """
+        Return (state, IncrementalScorer) holding session_id's running scores for mode over the
+        active snapshot, starting a new one if there is none or it predates a reload.
+        """
+        state = self.snapshot()
+        key = (session_id, mode)
+        with self._session_lock:
+            entry = self._session_scorers.get(key)
+            if entry is None or entry[0] is not state:
+                term_weights = state["term_ic"] if mode == "ic" else None
+                entry = self._session_scorers[key] = (state, IncrementalScorer(state["matrix"], term_weights))
+            self._session_scorers.move_to_end(key)
+            while len(self._session_scorers) > self.session_scorers:
+                self._session_scorers.popitem(last=False)
+        return entry
+
+    def score_session(self, session_id, phenotype_list, top_n=5, mode=None):
+        """
+        Same ranking as score(), but the session's previous phenotype set is diffed against
+        phenotype_list and only the added and removed terms are applied to its running score
+        vector. Falls back to score() for the sets backend.
+        """
+        mode = check_scoring_mode(mode or self.mode)
+        if self.backend not in MATRIX_BACKENDS:
+            return self.score(phenotype_list, top_n=top_n, mode=mode)
+        state, scorer = self.session_scorer(session_id, mode)
+        ontology, matrix = state["ontology"], state["matrix"]
+        with span("incremental_scoring"), scorer.lock:
+            selected = {hpo_id for hpo_id in map(ontology.resolve_id, phenotype_list) if hpo_id is not None}
+            current = scorer.codes
+            added = {
+                code: [matrix.term_index[term] for term in expand_query_terms([code], state["ancestor_dict"])
+                       if term in matrix.term_index]
+                for code in selected - current
+            }
+            scorer.update(added, current - selected)
+            return scorer.rank(top_n)
+
+    def diagnose_session(self, session_id, phenotype_list, top_n=5, mode=None):
+        """diagnose() for a session's phenotype set, re-scored incrementally (see score_session)."""
+        state = self.snapshot()
+        ranked_diseases = self.score_session(session_id, phenotype_list, top_n=top_n, mode=mode)
+        return format_diagnoses(ranked_diseases, state["disease_to_name"])
+
+    def diagnose(self, phenotype_list, top_n=5, mode=None):
+        """Rank diseases and format them the way the /diagnoses endpoint returns them."""
+        state = self.snapshot()
+        ranked_diseases = self.score(phenotype_list, top_n=top_n, mode=mode)
+        return format_diagnoses(ranked_diseases, state["disease_to_name"])
+
+    def _gene_query(self, phenotype_list, mode):
+        state = self.snapshot()
+        expanded_query = expand_query_terms(self.resolve_terms(phenotype_list), state["ancestor_dict"])
+        return expanded_query, state["term_ic"] if mode == "ic" else None
+
+    def score_genes(self, phenotype_list, candidate_genes=None, top_n=None, mode=None):
+        """
+        Rank genes by the Phrank score of their phenotype profile (the union of their
+        diseases' profiles). candidate_genes restricts the ranking to those symbols, e.g.
+        the genes carrying variants in an exome. Returns (ranked (symbol, score) pairs,
+        candidate symbols with no known disease association).
+        """
+        mode = check_scoring_mode(mode or self.mode)
+        genes = self.gene_scorer()
+        with span("gene_scoring"):
+            candidates, unmatched = (None, []) if candidate_genes is None else genes.resolve_genes(candidate_genes)
+            expanded_query, term_weights = self._gene_query(phenotype_list, mode)
+            ranked_genes = genes.rank(expanded_query, top_n=top_n, term_weights=term_weights, candidates=candidates)
+        return ranked_genes, unmatched
+
+    def rank_genes(self, phenotype_list, candidate_genes=None, top_n=None, mode=None):
+        """
+        score_genes() formatted for the API: one dict per gene with its relative score and
+        its associated diseases, best matching first. Returns (genes, unmatched symbols).
+        """
+        mode = check_scoring_mode(mode or self.mode)
+        state = self.snapshot()
+        ranked_genes, unmatched = self.score_genes(phenotype_list, candidate_genes, top_n=top_n, mode=mode)
+        genes, disease_ids = self.gene_scorer(), state["matrix"].disease_ids
+        expanded_query, term_weights = self._gene_query(phenotype_list, mode)
+        gene_diseases = genes.order_diseases([symbol for symbol, _ in ranked_genes], expanded_query, term_weights)
+
+        max_score = max((score for _, score in ranked_genes), default=0)
+        return [
+            {
+                "id": index + 1,
+                "symbol": symbol,
+                "score": score,
+                "probability": f"{(score / max_score) * 100:.2f}%" if max_score > 0 else "0.00%",
+                "diseases": [state["disease_to_name"].get(disease_ids[position], "Unknown Disease")
+                             for position in gene_diseases[symbol]],
+            }
+            for index, (symbol, score) in enumerate(ranked_genes)
+        ], unmatched
+
+    def batch_pool(self):
+        """
+        The persistent batch-scoring process pool. Workers are spawned (the API process runs
+        threads, so forking it is unsafe) and each loads this engine's configuration once in
+        the pool initializer, from the same on-disk caches, so later batches only ship the
+        patients' HPO codes.
+        """
+        with self._batch_pool_lock:
+            if self._batch_pool is None:
+                self._batch_pool = ProcessPoolExecutor(
+                    max_workers=self.batch_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_batch_worker,
+                    initargs=(self.worker_config(),),
+                )
+                count("subprocess_spawns_total", self.batch_workers, command="phrank_batch_worker")
+            return self._batch_pool
+
+    def shutdown_batch_pool(self):
+        with self._batch_pool_lock:
+            pool, self._batch_pool = self._batch_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def worker_config(self):
+        """Constructor arguments that rebuild this engine (on its current files) in another process."""
+        return {
+            "ontology_path": self.ontology_path,
+            "annotations_path": self.annotations_path,
+            "cache_dir": self.cache_dir,
+            "backend": self.backend,
+            "mode": self.mode,
+            "genes_path": self.genes_path,
+            "aspects": self.aspects,
+            "batch_workers": 1,
+            "preload_text_indexes": False,
+        }
+
+    def score_batch(self, phenotype_lists, top_n=5, mode=None, workers=None):
+        """
+        Rank diseases for many patients at once, returning one top_n list per patient.
+
+        Each shard of BATCH_SHARD_SIZE patients is scored in a single matrix pass. Batches
+        of more than one shard go to the persistent batch_pool() unless workers is 1.
+        """
+        mode = check_scoring_mode(mode or self.mode)
+        self.snapshot()
+        shards = [phenotype_lists[i:i + BATCH_SHARD_SIZE] for i in range(0, len(phenotype_lists), BATCH_SHARD_SIZE)]
+        workers = self.batch_workers if workers is None else workers
+        with span("batch_scoring"):
+            if workers <= 1 or len(shards) <= 1:
+                results = [self._score_shard(shard, top_n, mode) for shard in shards]
+            else:
+                try:
+                    results = list(self.batch_pool().map(
+                        _score_shard, shards, [top_n] * len(shards), [mode] * len(shards)
+                    ))
+                except BrokenProcessPool as e:
+                    logger.warning(f"Phrank batch pool failed, scoring in-process: {e}")
+                    self.shutdown_batch_pool()
+                    results = [self._score_shard(shard, top_n, mode) for shard in shards]
+        return [ranked for shard_results in results for ranked in shard_results]
+
+    def _score_shard(self, phenotype_lists, top_n, mode):
+        state = self.snapshot()
+        if self.backend not in MATRIX_BACKENDS:
+            return [self.score(phenotype_list, top_n=top_n, mode=mode) for phenotype_list in phenotype_lists]
+        expanded_queries = [
+            expand_query_terms(self.resolve_terms(phenotype_list), state["ancestor_dict"])
+            for phenotype_list in phenotype_lists
+        ]
+        term_weights = state["term_ic"] if mode == "ic" else None
+        return state["matrix"].rank_batch(expanded_queries, top_n=top_n, term_weights=term_weights)
+
+    def diagnose_batch(self, phenotype_lists, top_n=5, mode=None):
+        """Batch version of diagnose(): one formatted diagnosis list per patient."""
+        state = self.snapshot()
+        return [
+            format_diagnoses(ranked_diseases, state["disease_to_name"])
+            for ranked_diseases in self.score_batch(phenotype_lists, top_n=top_n, mode=mode)
+        ]
+
+
+# Set once in each batch worker process by _init_batch_worker
+_worker_engine = None
+
+
+def _init_batch_worker(config):
+    global _worker_engine
+    _worker_engine = PhrankEngine(**config).load()
+
+
+def _score_shard(phenotype_lists, top_n, mode):
+    return _worker_engine._score_shard(phenotype_lists, top_n, mode)
+
+
+def check_data_path(path, data_dir=DATA_DIR):
+    """Resolve path and make sure it is a file inside data_dir; raise ValueError otherwise."""
+    resolved = os.path.realpath(path)
+    root = os.path.realpath(data_dir)
+    if os.path.commonpath([resolved, root]) != root:
+        raise ValueError(f"{path} is outside the Phrank data directory {data_dir}")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"{path} does not exist")
+    return resolved
+
+
+def check_scoring_mode(mode):
+    """Validate a Phrank scoring mode name and return it."""
+    if mode not in SCORING_MODES:
+        raise ValueError(f"Unknown Phrank scoring mode {mode!r}, expected one of {SCORING_MODES}")
+    return mode
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide PhrankEngine, creating it (unloaded) if needed."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PhrankEngine()
+    return _engine
+
+
+def diagnose_helper(phenotype_list, engine=None, mode=None, session_id=None):
+    # score using the shared, preloaded Phrank engine; with a session_id, only the terms
+    # added or removed since that session's last call are re-scored
+    engine = engine or get_engine()
+    if session_id is not None:
+        return engine.diagnose_session(session_id, phenotype_list, top_n=5, mode=mode)
+    return engine.diagnose(phenotype_list, top_n=5, mode=mode)
+
+
+def rank_candidate_genes(phenotype_list, candidate_genes=None, engine=None, top_n=None, mode=None):
+    # rank genes (optionally only the caller's candidates) against the shared engine's gene profiles
+    engine = engine or get_engine()
+    return engine.rank_genes(phenotype_list, candidate_genes, top_n=top_n, mode=mode)
+
+
+def diagnose_batch(phenotype_lists, engine=None, top_n=5, mode=None):
+    # score a whole cohort against the shared engine in one matrix pass per shard
+    engine = engine or get_engine()
+    return engine.diagnose_batch(phenotype_lists, top_n=top_n, mode=mode)
+
+
+def format_diagnoses(ranked_diseases, disease_to_name):
+    """Format ranked (disease, score) pairs as diagnosis dicts with relative probabilities."""
     # Get the maximum score
     max_score = max(ranked_diseases, key=lambda x: x[1])[1] if ranked_diseases else 0
 
@@ -33,6 +485,8 @@ def diagnose_helper(phenotype_list):
 
 def load_ontology(path_to_obo):
     """Load the ontology from an OBO file."""
+    # Only the legacy pronto helpers need it; the engine uses the native OBO loader
+    from pronto import Ontology
     return Ontology(path_to_obo)
 
 def precompute_ancestors(ontology):
@@ -42,27 +496,13 @@ def precompute_ancestors(ontology):
         ancestor_dict[term.id] = {parent.id for parent in term.superclasses() if parent.id != term.id}
     return ancestor_dict
 
-def read_disease_annotations(hpo_disease_annotations):
-    """Reads HPO disease annotations and maps diseases to associated HPO terms and genes."""
-    disease_to_hpo = defaultdict(set)
-    disease_to_genes = defaultdict(set)
-    disease_to_name = {}
-
-    with open(hpo_disease_annotations, 'r') as anno_handle:
-        for line in anno_handle:
-            if line.startswith('#'):
-                continue  # Skip headers
-            
-            fields = line.strip().split('\t')
-            if len(fields) < 5:
-                continue  # Skip malformed lines
-
-            disease_id, disease_name, gene_id, hpo_id = fields[:4]
-            disease_to_hpo[disease_id].add(hpo_id)
-            disease_to_genes[disease_id].add(gene_id)
-            disease_to_name[disease_id] = disease_name
-
-    return disease_to_hpo, disease_to_genes, disease_to_name
+def read_disease_annotations(hpo_disease_annotations, genes_path=None):
+    """
+    Reads HPO disease annotations and maps diseases to associated HPO terms and genes.
+    Genes come from genes_path (genes_to_disease.txt) if given, since phenotype.hpoa has none.
+    """
+    annotations = AnnotationTable.parse(hpo_disease_annotations, genes_path)
+    return annotations.disease_to_hpo(), annotations.disease_to_genes(), annotations.disease_to_name()
 
 
 def expand_query_terms(query_terms, ancestor_dict):
@@ -98,3 +538,33 @@ def phrank_score(query_terms, disease_to_hpo, ancestor_dict, top_n=5):
     ranked_diseases = sorted(disease_ranks.items(), key=lambda x: x[1], reverse=True)
 
     return ranked_diseases[:top_n]
+
+
+def phrank_score_profiles(query_terms, profiles, ancestor_dict, top_n=5, term_weights=None):
+    """
+    Same ranking as phrank_score, but against precomputed DiseaseProfiles so only the
+    query is expanded per call; each disease costs a single intersection.
+
+    If term_weights (indexed by profile term index) is given, the score is the summed
+    weight of the shared terms instead of their count.
+    """
+    # Expand query terms and intern them into profile term indices
+    expanded_query = profiles.encode_terms(expand_query_terms(query_terms, ancestor_dict))
+
+    if term_weights is None:
+        # Score is the count of shared terms
+        disease_ranks = {
+            disease: len(expanded_query.intersection(profiles.terms_of(index)))
+            for index, disease in enumerate(profiles.disease_ids)
+        }
+    else:
+        # Score is the information content of the shared terms
+        disease_ranks = {
+            disease: float(sum(term_weights[term] for term in expanded_query.intersection(profiles.terms_of(index))))
+            for index, disease in enumerate(profiles.disease_ids)
+        }
+
+    # Sort diseases by rank score (higher is better)
+    ranked_diseases = sorted(disease_ranks.items(), key=lambda x: x[1], reverse=True)
+
+    return ranked_diseases[:top_n]
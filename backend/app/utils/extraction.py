@@ -1,6 +1,29 @@
+import asyncio
+import functools
+import importlib.metadata
+import logging
+import multiprocessing
 import subprocess
 import tempfile
 import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.utils.metrics import count, span
+
+logger = logging.getLogger(__name__)
+
+# Number of warm ClinPhen worker processes and how many notes may be queued for them
+CLINPHEN_POOL_SIZE = int(os.environ.get("CLINPHEN_POOL_SIZE", "2"))
+CLINPHEN_MAX_PENDING = int(os.environ.get("CLINPHEN_MAX_PENDING", "16"))
+
+
+def clinphen_version():
+    """Installed ClinPhen version, used to key cached extraction results."""
+    try:
+        return f"clinphen-{importlib.metadata.version('clinphen')}"
+    except importlib.metadata.PackageNotFoundError:
+        return "clinphen-unknown"
 
 
 def parse_note_to_hpo(user_input_text=None, file_path=None, original_hpo_dict=None):
@@ -27,11 +50,34 @@ def parse_note_to_hpo(user_input_text=None, file_path=None, original_hpo_dict=No
             print(f"Error reading file: {e}")
             return {}
 
+    with span("clinphen"):
+        stdout = run_clinphen(user_input_text)
+    if stdout is None:
+        return {}
+    return parse_clinphen_output(stdout, original_hpo_dict)
+
+
+class ClinPhenError(RuntimeError):
+    """ClinPhen failed on a note; raised in pool workers so the API process can log it."""
+
+
+def run_clinphen(user_input_text):
+    """Run the clinphen CLI on a note in a fresh subprocess; returns its stdout, or None on error."""
+    try:
+        return run_clinphen_cli(user_input_text)
+    except ClinPhenError as e:
+        logger.warning(f"ClinPhen Error: {e}")
+        return None
+
+
+def run_clinphen_cli(user_input_text):
+    """Like run_clinphen(), but raises ClinPhenError with ClinPhen's stderr on failure."""
     with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix=".txt") as temp_file:
         temp_file.write(user_input_text)
         temp_file_path = temp_file.name  
 
     clinphen_cmd = ["clinphen", temp_file_path]
+    count("subprocess_spawns_total", command="clinphen")
     process = subprocess.Popen(
         clinphen_cmd,
         stdout=subprocess.PIPE,  
@@ -48,9 +94,12 @@ def parse_note_to_hpo(user_input_text=None, file_path=None, original_hpo_dict=No
     os.remove(temp_file_path)
 
     if process.returncode != 0:
-        print("ClinPhen Error:", stderr)
-        return {}
+        raise ClinPhenError(stderr.strip() or f"clinphen exited with status {process.returncode}")
+    return stdout
+
 
+def parse_clinphen_output(stdout, original_hpo_dict):
+    """Add the HPO terms from ClinPhen's tab-separated output to original_hpo_dict."""
     # Process each line of output to extract HPO terms
     for line in stdout.split("\n"):
         if line.startswith("HP:"):  
@@ -67,6 +116,167 @@ def parse_note_to_hpo(user_input_text=None, file_path=None, original_hpo_dict=No
     return original_hpo_dict
 
 
+def parse_clinphen_counts(stdout):
+    """Map each HPO id in ClinPhen's output to (name, number of sentences it was found in)."""
+    counts = {}
+    for line in stdout.split("\n"):
+        if line.startswith("HP:"):
+            parts = line.split("\t")
+            if len(parts) >= 2:
+                occurrences = int(parts[2]) if len(parts) >= 3 and parts[2].strip().isdigit() else 1
+                counts[parts[0].strip()] = (parts[1].strip(), occurrences)
+    return counts
+
+
+# ___________________________ WARM CLINPHEN WORKER POOL ___________________________
+# Set in each worker process by _init_clinphen_worker
+_worker_extract = None
+
+
+def _init_clinphen_worker():
+    """
+    Load ClinPhen once per worker process. When the clinphen package can be imported the
+    extractor runs in-process with its term names and synonym map kept in memory; otherwise
+    the worker falls back to the clinphen CLI.
+    """
+    global _worker_extract
+    try:
+        from clinphen_src import get_phenotypes, src_dir
+    except ImportError:
+        _worker_extract = run_clinphen_cli
+        return
+
+    hpo_to_name = {}
+    with open(os.path.join(src_dir.get_src_dir(), "data", "hpo_term_names.txt"), "r") as names_handle:
+        for line in names_handle:
+            line_data = line.strip().split("\t")
+            if len(line_data) >= 2:
+                hpo_to_name[line_data[0]] = line_data[1]
+
+    # extract_phenotypes re-reads the synonym file on every call; keep it in memory instead
+    get_phenotypes.load_all_hpo_synonyms = functools.lru_cache(maxsize=None)(get_phenotypes.load_all_hpo_synonyms)
+    _worker_extract = functools.partial(_extract_in_process, get_phenotypes, hpo_to_name)
+
+
+def _extract_in_process(get_phenotypes, hpo_to_name, user_input_text):
+    return get_phenotypes.extract_phenotypes(user_input_text, hpo_to_name)
+
+
+def _run_in_worker(user_input_text):
+    # Errors propagate to the API process, which logs them (see ClinPhenPool._submit)
+    return _worker_extract(user_input_text)
+
+
+def _warm_up_worker():
+    return os.getpid()
+
+
+class ClinPhenPool:
+    """
+    Pool of long-lived ClinPhen worker processes.
+
+    Notes are sent to the workers over the executor's queues, so the interpreter and
+    ClinPhen dictionary load is paid once per worker rather than once per note. At most
+    max_pending notes are in flight; further callers wait asynchronously for a slot, which
+    keeps the event loop free and bounds the queue.
+    """
+
+    def __init__(self, size=CLINPHEN_POOL_SIZE, max_pending=CLINPHEN_MAX_PENDING):
+        self.size = size
+        self.max_pending = max_pending
+        self._executor = None
+        self._semaphore = None
+
+    def start(self):
+        """Start the worker processes and load ClinPhen in each of them."""
+        if self._executor is None:
+            # spawn rather than fork: the API process already runs threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_clinphen_worker,
+            )
+            count("subprocess_spawns_total", self.size, command="clinphen_worker")
+            for _ in range(self.size):
+                self._executor.submit(_warm_up_worker)
+        return self
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def extract(self, user_input_text, original_hpo_dict=None):
+        """Extract HPO terms from a note on a warm worker without blocking the event loop."""
+        if original_hpo_dict is None:
+            original_hpo_dict = {}
+        if not user_input_text:
+            raise ValueError("user_input_text must be provided.")
+
+        stdout = await self._run(user_input_text)
+        if stdout is None:
+            return original_hpo_dict
+        return parse_clinphen_output(stdout, original_hpo_dict)
+
+    async def count(self, user_input_text):
+        """Like extract(), but returns {hpo_id: (name, occurrences)} for merging partial results."""
+        stdout = await self._run(user_input_text)
+        if stdout is None:
+            return {}
+        return parse_clinphen_counts(stdout)
+
+    async def _run(self, user_input_text):
+        self.start()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+
+        # Time spent waiting for a free slot is reported apart from the extraction itself
+        with span("clinphen_queue_wait"):
+            await self._semaphore.acquire()
+        try:
+            with span("clinphen"):
+                executor = self._executor
+                try:
+                    return await self._submit(executor, user_input_text)
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. killed for memory on a huge note); the executor stays
+                    # broken for good, so replace it and give the note one more try
+                    logger.warning(f"ClinPhen worker pool broke, restarting it: {e}")
+                    self._restart(executor)
+                    return await self._submit(self._executor, user_input_text)
+        finally:
+            self._semaphore.release()
+
+    async def _submit(self, executor, user_input_text):
+        """Run one note on executor; ClinPhen errors raised in the worker are logged here and give None."""
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(executor, _run_in_worker, user_input_text)
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            logger.warning(f"ClinPhen Error: {e}")
+            return None
+
+    def _restart(self, broken_executor):
+        # Concurrent notes can all see the same broken executor; only the first replaces it
+        if self._executor is broken_executor:
+            self._executor = None
+            broken_executor.shutdown(wait=False)
+            self.start()
+
+
+_clinphen_pool = None
+
+
+def get_clinphen_pool():
+    """Return the process-wide ClinPhenPool (not started until first use or start())."""
+    global _clinphen_pool
+    if _clinphen_pool is None:
+        _clinphen_pool = ClinPhenPool()
+    return _clinphen_pool
+
+
 
 # ===================================
 # 🧪 LOCAL TEST CASES
@@ -0,0 +1,126 @@
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from app.utils.phenotype_matcher import normalize_phrase
+
+# Minimum trigram (Dice) similarity for a fuzzy name match to be accepted
+GROUNDING_MIN_SIMILARITY = float(os.environ.get("HPO_GROUNDING_MIN_SIMILARITY", "0.7"))
+
+
+def _label_key(text):
+    return " ".join(normalize_phrase(text or ""))
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class HPOGrounder:
+    """
+    Validates HPO code/name pairs (e.g. proposed by the LLM) against the loaded ontology.
+
+    Codes are resolved through alt_ids and replaced_by; unknown or obsolete codes are
+    recovered from their name by exact label lookup over names and synonyms, then by
+    trigram similarity. Pairs that cannot be grounded are dropped.
+    """
+
+    def __init__(self, graph, min_similarity=GROUNDING_MIN_SIMILARITY):
+        self.graph = graph
+        self.min_similarity = min_similarity
+        # Normalized name/synonym -> current term id, and the label keys of each term
+        self._label_to_id = {}
+        self._labels_of = defaultdict(set)
+        # Trigram inverted index over the distinct label keys
+        self._label_keys = []
+        label_sizes = []
+        postings = defaultdict(list)
+
+        for index, hpo_id in enumerate(graph.term_ids):
+            if hpo_id in graph.obsolete:
+                continue
+            for text in [graph.names[index]] + graph.synonyms.get(hpo_id, []):
+                key = _label_key(text)
+                if not key:
+                    continue
+                self._labels_of[hpo_id].add(key)
+                if key in self._label_to_id:
+                    # Exact names win over synonyms that happen to collide
+                    continue
+                self._label_to_id[key] = hpo_id
+                trigrams = _trigrams(key)
+                label_index = len(self._label_keys)
+                self._label_keys.append(key)
+                label_sizes.append(len(trigrams))
+                for trigram in trigrams:
+                    postings[trigram].append(label_index)
+
+        # Postings as arrays so shared trigram counts come from one bincount per query
+        self._label_sizes = np.array(label_sizes, dtype=np.float64)
+        self._postings = {trigram: np.array(labels, dtype=np.int64) for trigram, labels in postings.items()}
+
+    def resolve_code(self, hpo_code):
+        """Current, non-obsolete id for hpo_code, or None."""
+        primary = self.graph.resolve_id(hpo_code) if hpo_code else None
+        if primary is None or primary in self.graph.obsolete:
+            return None
+        return primary
+
+    def match_name(self, hpo_name):
+        """Return (hpo_id, similarity) of the best matching term name or synonym, or (None, 0.0)."""
+        key = _label_key(hpo_name)
+        if not key:
+            return None, 0.0
+        if key in self._label_to_id:
+            return self._label_to_id[key], 1.0
+
+        trigrams = _trigrams(key)
+        postings = [self._postings[trigram] for trigram in trigrams if trigram in self._postings]
+        if not postings:
+            return None, 0.0
+        shared = np.bincount(np.concatenate(postings), minlength=len(self._label_keys))
+        # Dice coefficient between the query's and each label's trigram sets
+        similarity = 2.0 * shared / (len(trigrams) + self._label_sizes)
+        best_index = int(np.argmax(similarity))
+        return self._label_to_id[self._label_keys[best_index]], float(similarity[best_index])
+
+    def ground(self, hpo_code, hpo_name=None):
+        """
+        Ground one code/name pair. Returns (hpo_id, how) where how is "code" (valid as given),
+        "resolved" (alt_id or replaced obsolete id), "name" (exact name or synonym) or
+        "fuzzy", or (None, None) if neither the code nor the name can be trusted.
+        """
+        primary = self.resolve_code(hpo_code)
+        name_key = _label_key(hpo_name)
+        if primary is not None:
+            # A valid code with a name belonging to a different term: believe the name
+            if name_key and name_key not in self._labels_of[primary]:
+                named = self._label_to_id.get(name_key)
+                if named is not None:
+                    return named, "name"
+            return primary, "code" if primary == hpo_code else "resolved"
+
+        hpo_id, similarity = self.match_name(hpo_name)
+        if hpo_id is None or similarity < self.min_similarity:
+            return None, None
+        return hpo_id, "name" if similarity == 1.0 else "fuzzy"
+
+    def ground_codes(self, hpo_codes):
+        """
+        Ground a list of {"hpo_code", "hpo_name", ...} dicts as returned by the LLM. Codes and
+        names are replaced by the canonical ones, ungroundable entries and duplicates are
+        dropped, and other fields (confidence, rationale) are kept.
+        """
+        grounded = []
+        seen = set()
+        for hpo in hpo_codes:
+            if not isinstance(hpo, dict):
+                continue
+            hpo_id, how = self.ground(hpo.get("hpo_code"), hpo.get("hpo_name"))
+            if hpo_id is None or hpo_id in seen:
+                continue
+            seen.add(hpo_id)
+            grounded.append(dict(hpo, hpo_code=hpo_id, hpo_name=self.graph.lookup_name(hpo_id), grounding=how))
+        return grounded
@@ -1,20 +1,60 @@
-import os
+import asyncio
 import json
-import openai
-from dotenv import load_dotenv
+from app.utils.conversation_context import ConversationContext
+from app.utils.diagnosing import get_engine
+from app.utils.llm_client import get_llm_client
+from app.utils.metrics import span
+from app.utils.verification_cache import get_verification_cache
 
-# Load environment variables
-load_dotenv()
-
-# Set the API key
-openai.api_key = os.environ.get("OPENAI_API_KEY")
+# Bump when the verification question prompt changes so cached questions are regenerated
+VERIFICATION_PROMPT_VERSION = "1"
 
 class HPODiagnosisChat:
-    def __init__(self):
+    def __init__(self, llm_client=None, verification_cache=None, grounder=None):
         self.conversation_history = []
         self.identified_hpo_codes = []
         self.current_state = "initial"  # States: initial, gathering_symptoms, verifying_hpo, concluded
+        # Running summary, HPO candidates and new messages the analysis prompt is built from
+        self.context = ConversationContext()
+        self.llm_client = llm_client or get_llm_client()
+        self.verification_cache = verification_cache or get_verification_cache()
+        # Validates LLM-proposed codes; defaults to the shared engine's grounder once it is loaded
+        self.grounder = grounder
+        # Serializes turns of this chat; created on first use inside the event loop
+        self._turn_lock = None
         
+    def to_dict(self):
+        """Serialize the conversation state, e.g. to park an idle session on disk"""
+        state = {
+            "conversation_history": self.conversation_history,
+            "identified_hpo_codes": self.identified_hpo_codes,
+            "current_state": self.current_state,
+            "context": self.context.to_dict(),
+        }
+        if hasattr(self, "current_followup_questions"):
+            state["current_followup_questions"] = self.current_followup_questions
+            state["current_followup_index"] = self.current_followup_index
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild a chat from the output of to_dict()"""
+        chat = cls()
+        chat.conversation_history = state.get("conversation_history", [])
+        chat.identified_hpo_codes = state.get("identified_hpo_codes", [])
+        chat.current_state = state.get("current_state", "initial")
+        if "context" in state:
+            chat.context = ConversationContext.from_dict(state["context"])
+        else:
+            # Chats saved before the context existed: start from their recent messages
+            for msg in chat.conversation_history[-6:]:
+                if msg["role"] == "user":
+                    chat.context.add_user_message(msg["content"])
+        if "current_followup_questions" in state:
+            chat.current_followup_questions = state["current_followup_questions"]
+            chat.current_followup_index = state.get("current_followup_index", 0)
+        return chat
+
     def add_message(self, role, content):
         """Add a message to the conversation history"""
         self.conversation_history.append({"role": role, "content": content})
@@ -34,36 +74,90 @@ class HPODiagnosisChat:
         self.current_state = "gathering_symptoms"
         return welcome_message
     
-    def process_user_input(self, user_input):
-        """Process user input and determine the next response"""
-        self.add_message("user", user_input)
+    async def process_user_input(self, user_input, emit=None):
+        """
+        Process user input and determine the next response.
+        If emit is given, the symptom analysis is streamed and emit(event, data) is awaited with
+        "delta" (partial model output) and "hpo_codes" (the parsed codes) events along the way.
+        """
+        if self._turn_lock is None:
+            self._turn_lock = asyncio.Lock()
+        # Messages sent concurrently to the same chat are handled one at a time
+        async with self._turn_lock:
+            self.add_message("user", user_input)
+            
+            if self.current_state == "gathering_symptoms":
+                return await self.analyze_symptoms(user_input, emit)
+            elif self.current_state == "verifying_hpo":
+                return await self.verify_hpo_codes(user_input)
+            elif self.current_state == "asking_followup":
+                return await self.process_followup_response(user_input, emit)
+            else:
+                return "I'm not sure what to do next. Could you describe your symptoms again?"
+    
+    async def stream_user_input(self, user_input):
+        """
+        Async generator version of process_user_input yielding (event, data) pairs: any number
+        of ("delta", text) and ("hpo_codes", codes), then ("message", full response text).
+        """
+        queue = asyncio.Queue()
         
-        if self.current_state == "gathering_symptoms":
-            return self.analyze_symptoms(user_input)
-        elif self.current_state == "verifying_hpo":
-            return self.verify_hpo_codes(user_input)
-        elif self.current_state == "asking_followup":
-            return self.process_followup_response(user_input)
-        else:
-            return "I'm not sure what to do next. Could you describe your symptoms again?"
+        async def emit(event, data):
+            await queue.put((event, data))
+        
+        async def run():
+            try:
+                await queue.put(("message", await self.process_user_input(user_input, emit)))
+            finally:
+                await queue.put(None)
+        
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield item
+            # Surface any exception raised while processing
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
     
-    def analyze_symptoms(self, symptoms_description):
-        """Analyze symptoms and identify potential HPO codes"""
-        context = self._create_symptom_analysis_prompt(symptoms_description)
+    async def analyze_symptoms(self, symptoms_description=None, emit=None):
+        """
+        Analyze symptoms and identify potential HPO codes. symptoms_description is queued as
+        new information; everything queued since the last analysis goes into the prompt.
+        """
+        if symptoms_description:
+            self.context.add_user_message(symptoms_description)
+        context = self._create_symptom_analysis_prompt()
+        messages = [
+            {"role": "system", "content": "You are a medical assistant specializing in rare diseases and HPO classification. Your task is to identify potential HPO codes based on patient-reported symptoms."},
+            {"role": "user", "content": context}
+        ]
         
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4-turbo",
-                temperature=0.3,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": "You are a medical assistant specializing in rare diseases and HPO classification. Your task is to identify potential HPO codes based on patient-reported symptoms."},
-                    {"role": "user", "content": context}
-                ]
-            )
+            with span("symptom_analysis"):
+                if emit is None:
+                    result = await self.llm_client.chat_completion_json(temperature=0.3, messages=messages)
+                else:
+                    # Forward the raw JSON as it is generated, then parse it once complete
+                    content = ""
+                    async for delta in self.llm_client.stream_chat_completion(
+                        messages, temperature=0.3, response_format={"type": "json_object"}
+                    ):
+                        content += delta
+                        await emit("delta", delta)
+                    result = json.loads(content)
             
-            result = json.loads(response.choices[0].message.content)
-            self.identified_hpo_codes = result.get("identified_hpo_codes", [])
+            # Only codes that exist in the loaded HPO release are shown, remembered and scored
+            with span("hpo_grounding"):
+                result["identified_hpo_codes"] = self._ground_hpo_codes(result.get("identified_hpo_codes", []))
+            self.identified_hpo_codes = result["identified_hpo_codes"]
+            self.context.apply_analysis(result)
+            if emit is not None:
+                await emit("hpo_codes", self.identified_hpo_codes)
             followup_questions = result.get("follow_up_questions", [])
             
             # Create a summary response
@@ -91,10 +185,25 @@ class HPODiagnosisChat:
             self.add_message("assistant", error_msg)
             return error_msg
     
-    def process_followup_response(self, user_input):
+    def _ground_hpo_codes(self, hpo_codes):
+        """Correct or drop LLM-proposed codes against the HPO ontology (unchanged if none is loaded)"""
+        grounder = self.grounder
+        if grounder is None and get_engine().loaded:
+            grounder = get_engine().hpo_grounder()
+        if grounder is None:
+            return hpo_codes
+        return grounder.ground_codes(hpo_codes)
+    
+    async def process_followup_response(self, user_input, emit=None):
         """Process the user's response to a follow-up question"""
         # If we have more follow-up questions, ask the next one
         if hasattr(self, 'current_followup_questions') and hasattr(self, 'current_followup_index'):
+            # Keep the answer together with the question it answers
+            if self.current_followup_index < len(self.current_followup_questions):
+                question = self.current_followup_questions[self.current_followup_index]
+            else:
+                question = None
+            self.context.add_user_message(user_input, question)
             self.current_followup_index += 1
             
             if self.current_followup_index < len(self.current_followup_questions):
@@ -102,13 +211,12 @@ class HPODiagnosisChat:
                 self.add_message("assistant", next_question)
                 return next_question
             else:
-                # Re-analyze with all the new information
-                all_symptoms = "\n".join([msg["content"] for msg in self.conversation_history if msg["role"] == "user"])
-                return self.analyze_symptoms(all_symptoms)
+                # Re-analyze with the answers collected since the last analysis
+                return await self.analyze_symptoms(emit=emit)
         else:
-            return self.analyze_symptoms(user_input)
+            return await self.analyze_symptoms(user_input, emit)
     
-    def verify_hpo_codes(self, user_input):
+    async def verify_hpo_codes(self, user_input):
         """Verify the identified HPO codes based on user feedback"""
         lower_input = user_input.lower()
         
@@ -117,20 +225,21 @@ class HPODiagnosisChat:
             # Ask specific verification questions for the most likely HPO
             if self.identified_hpo_codes:
                 top_hpo = self.identified_hpo_codes[0]
-                return self.get_hpo_verification_questions(top_hpo.get("hpo_code"), top_hpo.get("hpo_name"))
+                return await self.get_hpo_verification_questions(top_hpo.get("hpo_code"), top_hpo.get("hpo_name"))
             else:
                 return "I don't have enough information yet. Could you tell me more about your symptoms?"
         else:
             # User didn't confirm, go back to symptom gathering
+            self.context.add_user_message(user_input, "Do any of these phenotypes seem to match your condition?")
             response = "Let's look at this differently. Could you provide more details about your symptoms, especially any changes or specific circumstances when they occur?"
             self.current_state = "gathering_symptoms"
             self.add_message("assistant", response)
             return response
     
-    def get_hpo_verification_questions(self, hpo_code, hpo_name):
+    async def get_hpo_verification_questions(self, hpo_code, hpo_name):
         """Get verification questions for a specific HPO code"""
         try:
-            result = self._generate_verification_questions(hpo_code, hpo_name)
+            result = await self._generate_verification_questions(hpo_code, hpo_name)
             
             response_text = f"Let's verify if {hpo_name} matches your condition.\n\n"
             response_text += f"{result.get('layman_description')}\n\n"
@@ -147,7 +256,18 @@ class HPODiagnosisChat:
             self.add_message("assistant", error_msg)
             return error_msg
     
-    def _generate_verification_questions(self, hpo_code, hpo_name):
+    async def _generate_verification_questions(self, hpo_code, hpo_name):
+        """
+        Questions to verify if a patient has a specific HPO phenotype. They only depend on the
+        term, so they are cached per HPO code and concurrent requests share one LLM call.
+        """
+        with span("verification_questions"):
+            return await self.verification_cache.get_or_generate(
+                hpo_code, VERIFICATION_PROMPT_VERSION,
+                lambda: self._request_verification_questions(hpo_code, hpo_name)
+            )
+    
+    async def _request_verification_questions(self, hpo_code, hpo_name):
         """Generate questions to verify if a patient has a specific HPO phenotype"""
         prompt = f"""
         I need to verify if a patient has the following HPO phenotype:
@@ -169,38 +289,43 @@ class HPODiagnosisChat:
         }}
         """
         
-        response = openai.ChatCompletion.create(
-            model="gpt-4-turbo",
+        result = await self.llm_client.chat_completion_json(
             temperature=0.2,
-            response_format={"type": "json_object"},
             messages=[
                 {"role": "system", "content": "You are a medical assistant specializing in rare diseases and HPO classification. Your task is to translate medical terminology into patient-friendly language and create targeted questions."},
                 {"role": "user", "content": prompt}
             ]
         )
-        
-        return json.loads(response.choices[0].message.content)
+        # Do not cache answers without usable questions
+        if not isinstance(result.get("verification_questions"), list) or not result["verification_questions"]:
+            raise ValueError(f"No verification questions generated for {hpo_code}")
+        return result
     
-    def _create_symptom_analysis_prompt(self, symptoms_description):
-        """Create a prompt for symptom analysis that includes conversation context"""
-        # Get recent user messages to provide context
-        recent_user_messages = [msg["content"] for msg in self.conversation_history 
-                               if msg["role"] == "user"][-3:]
-        combined_symptoms = "\n".join(recent_user_messages)
+    def _create_symptom_analysis_prompt(self):
+        """Create a prompt for symptom analysis from the running summary and the new messages"""
+        summary, candidates, new_messages = self.context.prompt_sections()
         
         return f"""
-        The patient describes their symptoms as: 
+        Summary of what the patient has reported so far:
+        
+        "{summary}"
+        
+        HPO codes already considered:
+        {candidates}
         
-        "{combined_symptoms}"
+        New information from the patient since that summary:
         
-        1. Identify the most likely HPO codes that match these symptoms (up to 3)
+        "{new_messages}"
+        
+        1. Identify the most likely HPO codes that match all of the symptoms reported so far (up to 3)
         2. For each potential HPO code, provide:
            a. The HPO code
            b. The HPO term name
            c. Confidence level (high/medium/low)
            d. Brief rationale for why this HPO code matches the symptoms
         3. Suggest 1-3 follow-up questions that would help narrow down the possibilities
-        4. Return your assessment as a JSON object with the following structure:
+        4. Rewrite the summary so it also covers the new information, in at most {self.context.summary_budget // 2} words
+        5. Return your assessment as a JSON object with the following structure:
         {{
             "identified_hpo_codes": [
                 {{
@@ -215,6 +340,7 @@ class HPODiagnosisChat:
                 "Question 1?",
                 "Question 2?",
                 "Question 3?"
-            ]
+            ],
+            "symptom_summary": "Updated summary of all reported symptoms"
         }}
-        """
\ No newline at end of file
+        """
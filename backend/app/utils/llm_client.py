@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import random
+
+import httpx
+from dotenv import load_dotenv
+
+from app.utils.metrics import count, span
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# OpenAI-compatible endpoint (point OPENAI_BASE_URL at tools/mock_llm_server.py for local testing)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4-turbo")
+
+# Per-call timeouts, concurrent requests (also the connection pool size) and retry policy
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", "10"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.environ.get("LLM_RETRY_MAX_SECONDS", "8"))
+
+# Responses worth retrying: rate limiting, timeouts and transient server errors
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when a chat completion cannot be obtained."""
+
+
+class AsyncLLMClient:
+    """
+    Non-blocking client for an OpenAI-compatible /chat/completions endpoint.
+
+    All calls share one pooled httpx.AsyncClient, at most max_concurrency requests are in
+    flight at a time, and transient failures are retried with exponential backoff and
+    full jitter (honouring Retry-After when the server sends one).
+    """
+
+    def __init__(self, base_url=OPENAI_BASE_URL, api_key=OPENAI_API_KEY, model=LLM_MODEL,
+                 timeout=LLM_TIMEOUT_SECONDS, connect_timeout=LLM_CONNECT_TIMEOUT_SECONDS,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 retry_base=LLM_RETRY_BASE_SECONDS, retry_max=LLM_RETRY_MAX_SECONDS, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # Optional httpx transport, e.g. an ASGITransport serving tools/mock_llm_server.py in-process
+        self.transport = transport
+        # The HTTP client and semaphore belong to the event loop they were created on
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                transport=self.transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    def _payload(self, messages, temperature, response_format, model):
+        payload = {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": temperature,
+        }
+        if response_format is not None:
+            payload["response_format"] = response_format
+        return payload
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            try:
+                if retry_after is not None:
+                    return min(float(retry_after), self.retry_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+
+    async def chat_completion(self, messages, temperature=0.3, response_format=None, model=None):
+        """Return the message content of one chat completion."""
+        client = self._ensure_client()
+        payload = self._payload(messages, temperature, response_format, model)
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with span("llm_request"):
+                    async with self._semaphore:
+                        response = await client.post("/chat/completions", json=payload)
+                count("llm_requests_total", status=str(response.status_code))
+                if response.status_code < 400:
+                    return response.json()["choices"][0]["message"]["content"]
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise LLMError(f"LLM request failed with status {response.status_code}: {response.text[:200]}")
+                error = LLMError(f"LLM request failed with status {response.status_code}")
+            except httpx.TransportError as e:
+                count("llm_requests_total", status="transport_error")
+                error = LLMError(f"LLM request failed: {e!r}")
+            except (KeyError, IndexError, ValueError) as e:
+                raise LLMError(f"Unexpected LLM response: {e!r}")
+
+            if attempt == self.max_retries:
+                raise error
+            count("llm_retries_total")
+            delay = self._retry_delay(attempt, response)
+            logger.warning(f"{error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def stream_chat_completion(self, messages, temperature=0.3, response_format=None, model=None):
+        """
+        Async generator over the content deltas of a streamed chat completion.
+        Failures are only retried until the first delta has been yielded.
+        """
+        client = self._ensure_client()
+        payload = self._payload(messages, temperature, response_format, model)
+        payload["stream"] = True
+        started = False
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    async with client.stream("POST", "/chat/completions", json=payload) as response:
+                        count("llm_requests_total", status=str(response.status_code))
+                        if response.status_code < 400:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    return
+                                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                                if delta:
+                                    started = True
+                                    yield delta
+                            return
+                        await response.aread()
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise LLMError(f"LLM request failed with status {response.status_code}: {response.text[:200]}")
+                error = LLMError(f"LLM request failed with status {response.status_code}")
+            except httpx.TransportError as e:
+                count("llm_requests_total", status="transport_error")
+                if started:
+                    raise LLMError(f"LLM stream interrupted: {e!r}")
+                error = LLMError(f"LLM request failed: {e!r}")
+            except (KeyError, IndexError, ValueError) as e:
+                raise LLMError(f"Unexpected LLM stream chunk: {e!r}")
+
+            if attempt == self.max_retries:
+                raise error
+            count("llm_retries_total")
+            delay = self._retry_delay(attempt, response)
+            logger.warning(f"{error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def chat_completion_json(self, messages, temperature=0.3, model=None):
+        """Chat completion in JSON mode, parsed into a dict."""
+        content = await self.chat_completion(
+            messages, temperature=temperature, response_format={"type": "json_object"}, model=model
+        )
+        try:
+            return json.loads(content)
+        except ValueError as e:
+            raise LLMError(f"LLM did not return valid JSON: {e}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+_llm_client = None
+
+
+def get_llm_client():
+    """Return the process-wide AsyncLLMClient."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = AsyncLLMClient()
+    return _llm_client
@@ -0,0 +1,234 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from starlette.routing import Match
+
+# Add a Server-Timing header with the stage breakdown to every response; without it the
+# header is only added to requests that send X-Server-Timing
+SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "raremind")
+
+# Histogram buckets in seconds, from sub-millisecond scoring up to slow LLM calls
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Type and help text of the metrics the app records or collects
+METRIC_INFO = {
+    "stage_duration_seconds": ("histogram", "Time spent in each stage of request handling."),
+    "http_requests_total": ("counter", "HTTP requests by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route and method."),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit or miss)."),
+    "subprocess_spawns_total": ("counter", "Child processes started, by command."),
+    "llm_requests_total": ("counter", "LLM HTTP requests by response status (or transport_error)."),
+    "llm_retries_total": ("counter", "LLM requests retried after a transient failure."),
+    "engine_loads_total": ("counter", "Phrank engine (re)loads."),
+    "sessions": ("gauge", "Sessions held by the session store."),
+    "chat_sessions": ("gauge", "Chat sessions, by state (active in memory)."),
+    "chat_session_events_total": ("counter", "Chat session lifecycle events (created, evicted, rehydrated)."),
+}
+
+# Stage timings of the request being handled, set by MetricsMiddleware
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms rendered in the Prometheus text format.
+
+    Values are keyed by metric name and a sorted tuple of label pairs. Collectors are
+    callables run at scrape time that return (name, labels, value) samples, for numbers
+    other components already track (cache hit counts, session counts).
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX, buckets=DURATION_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._counters = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        families = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                families.setdefault(name, []).append((name, labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                samples = families.setdefault(name, [])
+                for bound, count in zip(self.buckets + (float("inf"),), histogram[:len(self.buckets)] + [histogram[-1]]):
+                    samples.append((f"{name}_bucket", labels + (("le", _format_value(float(bound))),), count))
+                samples.append((f"{name}_sum", labels, histogram[-2]))
+                samples.append((f"{name}_count", labels, histogram[-1]))
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    families.setdefault(name, []).append((name, tuple(sorted(labels.items())), value))
+            except Exception:
+                # A failing collector must not take down the whole scrape
+                continue
+
+        lines = []
+        for name in sorted(families):
+            kind, help_text = METRIC_INFO.get(name, ("untyped", None))
+            full_name = f"{self.prefix}_{name}" if self.prefix else name
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for sample_name, labels, value in families[name]:
+                sample = f"{self.prefix}_{sample_name}" if self.prefix else sample_name
+                lines.append(f"{sample}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide MetricsRegistry."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
+
+
+def count(name, amount=1, **labels):
+    """Increment a counter in the process-wide registry."""
+    get_metrics().inc(name, amount, **labels)
+
+
+def count_cache(cache, hit):
+    count("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+class RequestTimings:
+    """Total time and number of spans per stage within one request, for Server-Timing."""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total, calls = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, calls + 1)
+
+    def header(self, total_seconds):
+        with self._lock:
+            entries = [
+                f'{stage};dur={seconds * 1000:.2f}' + (f';desc="{calls} calls"' if calls > 1 else "")
+                for stage, (seconds, calls) in self.stages.items()
+            ]
+        entries.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time the enclosed block as one stage: recorded in the stage_duration_seconds histogram and,
+    inside a request, in that request's Server-Timing breakdown.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        get_metrics().observe("stage_duration_seconds", elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def route_template(scope):
+    """The path template of the route handling scope (e.g. "/hpo-codes"), so labels stay bounded."""
+    app = scope.get("app")
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and their latency per route, and collecting the
+    stage spans recorded while handling each request. The spans are returned in a
+    Server-Timing header when server_timing is set or the request sends X-Server-Timing.
+    """
+
+    def __init__(self, app, server_timing=SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+        add_header = self.server_timing or any(name == b"x-server-timing" for name, _ in scope.get("headers", []))
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if add_header:
+                    header = timings.header(time.perf_counter() - start).encode("latin-1")
+                    message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", header)])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            route = route_template(scope)
+            metrics = get_metrics()
+            metrics.inc("http_requests_total", method=scope["method"], route=route, status=str(status))
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - start,
+                            method=scope["method"], route=route)
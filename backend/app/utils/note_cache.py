@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# In-memory LRU size, and an optional on-disk tier (disabled unless NOTE_CACHE_DIR is set)
+NOTE_CACHE_SIZE = int(os.environ.get("NOTE_CACHE_SIZE", "256"))
+NOTE_CACHE_DIR = os.environ.get("NOTE_CACHE_DIR") or None
+NOTE_CACHE_DISK_BYTES = int(os.environ.get("NOTE_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+# Eviction trims the disk tier to this fraction of its budget, so it runs once per batch of writes
+NOTE_CACHE_DISK_LOW_WATER = float(os.environ.get("NOTE_CACHE_DISK_LOW_WATER", "0.9"))
+
+
+def normalize_note(text):
+    """Normalize line endings and whitespace so trivially different uploads share a key."""
+    lines = (" ".join(line.split()) for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return "\n".join(lines).strip()
+
+
+def note_cache_key(text, extractor_version):
+    """Content address of a note for a given extractor version."""
+    digest = hashlib.sha256(extractor_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_note(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class NoteCache:
+    """
+    Two-tier cache of note extraction results keyed by note_cache_key().
+
+    The memory tier is an LRU of max_entries results. If disk_dir is set, results are also
+    written there as JSON; once the tier grows past max_disk_bytes the oldest files (by
+    last use) are evicted down to low_water of the budget. From async code use aget() and
+    aput(), which keep the disk tier's file I/O off the event loop.
+    """
+
+    def __init__(self, max_entries=NOTE_CACHE_SIZE, disk_dir=NOTE_CACHE_DIR, max_disk_bytes=NOTE_CACHE_DISK_BYTES,
+                 low_water=NOTE_CACHE_DISK_LOW_WATER):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Held while a thread walks the disk tier, so concurrent writes do not all evict
+        self._evict_lock = threading.Lock()
+        self._disk_bytes = self._scan_disk_bytes() if disk_dir else 0
+
+    def get(self, key):
+        """Return the cached result for key, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        value = self._read_disk(key) if self.disk_dir else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self.disk_dir:
+            self._write_disk(key, value)
+
+    async def aget(self, key):
+        """get() for async callers: memory hits are answered inline, disk reads in the threadpool."""
+        if not self.disk_dir:
+            return self.get(key)
+        return await run_in_threadpool(self.get, key)
+
+    async def aput(self, key, value):
+        """put() for async callers: the disk write (and any eviction) runs in the threadpool."""
+        if not self.disk_dir:
+            self.put(key, value)
+            return
+        await run_in_threadpool(self.put, key, value)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                value = json.load(handle)
+            os.utime(path)  # mark as recently used for eviction
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, value):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), delete=False, encoding="utf-8") as handle:
+                json.dump(value, handle)
+                temp_path = handle.name
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write note cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += size
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_disk_bytes(self):
+        return sum(size for _, size, _ in self._disk_entries())
+
+    def _evict_disk(self):
+        """Delete least recently used files until the disk tier is down to low_water of its budget."""
+        if not self._evict_lock.acquire(blocking=False):
+            return  # another thread is already evicting
+        try:
+            entries = sorted(self._disk_entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_disk_bytes * self.low_water
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            with self._lock:
+                self._disk_bytes = total
+        finally:
+            self._evict_lock.release()
+
+
+_note_cache = None
+
+
+def get_note_cache():
+    """Return the process-wide NoteCache."""
+    global _note_cache
+    if _note_cache is None:
+        _note_cache = NoteCache()
+    return _note_cache
@@ -0,0 +1,98 @@
+import asyncio
+import codecs
+import os
+import re
+
+# Bytes read from the upload per call, target characters per extracted segment, characters
+# of context repeated after a forced mid-sentence cut, and segments extracted concurrently
+NOTE_READ_BYTES = int(os.environ.get("NOTE_READ_BYTES", str(1024 * 1024)))
+NOTE_SEGMENT_CHARS = int(os.environ.get("NOTE_SEGMENT_CHARS", str(256 * 1024)))
+NOTE_SEGMENT_OVERLAP = int(os.environ.get("NOTE_SEGMENT_OVERLAP", "256"))
+NOTE_STREAM_PARALLELISM = int(os.environ.get("NOTE_STREAM_PARALLELISM", "4"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"[.;!?]\s|\n")
+
+
+def _find_cut(text, limit):
+    """
+    Position to cut text at, no later than limit: the last paragraph break, else the last
+    sentence break, else limit itself. Returns (position, at_boundary).
+    """
+    window = text[:limit]
+    for pattern in (_PARAGRAPH_BREAK, _SENTENCE_BREAK):
+        last = None
+        for last in pattern.finditer(window):
+            pass
+        if last is not None and last.end() > limit // 2:
+            return last.end(), True
+    return limit, False
+
+
+async def iter_note_segments(read, segment_chars=NOTE_SEGMENT_CHARS, overlap=NOTE_SEGMENT_OVERLAP,
+                             read_bytes=NOTE_READ_BYTES):
+    """
+    Yield a note in segments of about segment_chars characters, read from the async
+    read(n) -> bytes callable a chunk at a time and decoded incrementally as UTF-8.
+
+    Segments end on paragraph or sentence boundaries where possible. When a segment has
+    to be cut mid-sentence, the next one repeats the last `overlap` characters so phrases
+    spanning the cut are still seen whole.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    while True:
+        data = await read(read_bytes)
+        buffer += decoder.decode(data, final=not data)
+        while len(buffer) >= segment_chars:
+            cut, at_boundary = _find_cut(buffer, segment_chars)
+            yield buffer[:cut]
+            carry = 0 if at_boundary else min(overlap, cut // 2)
+            buffer = buffer[cut - carry:]
+        if not data:
+            break
+    if buffer.strip():
+        yield buffer
+
+
+async def extract_streaming(read, count_segment, parallelism=NOTE_STREAM_PARALLELISM, **segment_options):
+    """
+    Extract HPO terms from a note of any size with bounded memory.
+
+    count_segment(text) is a coroutine returning {hpo_id: (name, occurrences)} for one
+    segment. At most `parallelism` segments are held and extracted at a time; their hits
+    are merged into running totals as each one finishes.
+
+    :return: {hpo_id: {"id", "name", "source", "occurrences"}}. Mentions inside the repeated
+        context after a forced mid-sentence cut may be counted twice.
+    """
+    merged = {}
+    pending = set()
+
+    def merge(finished):
+        for task in finished:
+            for hpo_id, (name, occurrences) in task.result().items():
+                if hpo_id in merged:
+                    merged[hpo_id]["occurrences"] += occurrences
+                else:
+                    merged[hpo_id] = {
+                        "id": hpo_id,
+                        "name": name,
+                        "source": "Clinical notes",
+                        "occurrences": occurrences
+                    }
+
+    try:
+        async for segment in iter_note_segments(read, **segment_options):
+            if len(pending) >= parallelism:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                merge(finished)
+            pending.add(asyncio.ensure_future(count_segment(segment)))
+        if pending:
+            finished, pending = await asyncio.wait(pending)
+            merge(finished)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return merged
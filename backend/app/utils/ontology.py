@@ -0,0 +1,252 @@
+import logging
+import os
+import re
+from array import array
+from collections import deque
+
+from app.utils.binary_cache import file_checksum, read_array_file, write_array_file
+from app.utils.metrics import count_cache
+
+logger = logging.getLogger(__name__)
+
+OBO_GRAPH_MAGIC = b"HPOGRAF3"
+OBO_GRAPH_FORMAT_VERSION = 3
+
+
+_SYNONYM_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def _strip_value(value):
+    """Drop trailing '! comment' and '{qualifier}' parts from an OBO tag value."""
+    value = value.split(" !", 1)[0]
+    value = value.split(" {", 1)[0]
+    return value.strip()
+
+
+class OboGraph:
+    """
+    Lightweight, integer-indexed view of an OBO ontology.
+
+    Only the fields needed for scoring, name lookup and text matching are kept: id, name,
+    synonyms, is_a, alt_id, obsolete status and replaced_by. Parents and the transitive
+    ancestor closure are stored CSR-style as uint32 offsets/indices, so the graph can be
+    cached to disk and memory-mapped back.
+    """
+
+    def __init__(self, term_ids, names, synonyms, alt_ids, obsolete, replaced_by, parent_offsets, parents,
+                 ancestor_offsets=None, ancestors=None, _mmap=None):
+        self.term_ids = term_ids
+        self.term_index = {term: index for index, term in enumerate(term_ids)}
+        self.names = names
+        self.synonyms = synonyms
+        self.alt_ids = alt_ids
+        self.obsolete = obsolete
+        self.replaced_by = replaced_by
+        self._name_index = None
+        # sha256 of the source hp.obo, set by load_obo_graph
+        self.checksum = None
+        self.parent_offsets = parent_offsets
+        self.parents = parents
+        self._mmap = _mmap
+        if ancestors is None:
+            ancestor_offsets, ancestors = self._compute_closure()
+        self.ancestor_offsets = ancestor_offsets
+        self.ancestors = ancestors
+
+    def __len__(self):
+        return len(self.term_ids)
+
+    def resolve_id(self, hpo_id):
+        """Map an alt_id or a replaced obsolete id to the current primary id (None if unknown)."""
+        hpo_id = self.alt_ids.get(hpo_id, hpo_id)
+        hpo_id = self.replaced_by.get(hpo_id, hpo_id)
+        return hpo_id if hpo_id in self.term_index else None
+
+    def name_index(self):
+        """id -> name for every primary id, alt_id and replaced obsolete id, built once."""
+        if self._name_index is None:
+            name_index = dict(zip(self.term_ids, self.names))
+            for alias in list(self.alt_ids) + list(self.replaced_by):
+                primary = self.resolve_id(alias)
+                if primary is not None:
+                    name_index[alias] = name_index[primary]
+            self._name_index = name_index
+        return self._name_index
+
+    def lookup_name(self, hpo_id):
+        """O(1) name lookup for an HPO id, or None if the id is unknown."""
+        return self.name_index().get(hpo_id)
+
+    def lookup_names(self, hpo_ids):
+        """Resolve a list of HPO ids in one call; unknown ids are left out of the result."""
+        name_index = self.name_index()
+        return {hpo_id: name_index[hpo_id] for hpo_id in hpo_ids if hpo_id in name_index}
+
+    def parents_of(self, index):
+        return self.parents[self.parent_offsets[index]:self.parent_offsets[index + 1]]
+
+    def ancestors_of(self, index):
+        return self.ancestors[self.ancestor_offsets[index]:self.ancestor_offsets[index + 1]]
+
+    @classmethod
+    def parse(cls, path):
+        """Stream an OBO file, keeping only [Term] id/name/synonym/is_a/alt_id/is_obsolete/replaced_by."""
+        term_ids, names, raw_parents = [], [], []
+        synonyms = {}
+        alt_ids = {}
+        replaced_by = {}
+        obsolete = set()
+
+        current = None
+        with open(path, "r", encoding="utf-8") as obo_handle:
+            for line in obo_handle:
+                line = line.strip()
+                if line.startswith("["):
+                    current = {"parents": []} if line == "[Term]" else None
+                    continue
+                if current is None or ":" not in line:
+                    continue
+
+                tag, value = line.split(":", 1)
+                value = value.strip()
+                if tag == "id":
+                    current["id"] = value
+                    term_ids.append(value)
+                    names.append("")
+                    raw_parents.append(current["parents"])
+                elif tag == "name" and "id" in current:
+                    names[-1] = value
+                elif tag == "synonym" and "id" in current:
+                    # synonym: "text" SCOPE [xrefs]
+                    match = _SYNONYM_RE.match(value)
+                    if match:
+                        synonyms.setdefault(current["id"], []).append(match.group(1).replace('\\"', '"'))
+                elif tag == "is_a":
+                    current["parents"].append(_strip_value(value))
+                elif tag == "alt_id" and "id" in current:
+                    alt_ids[_strip_value(value)] = current["id"]
+                elif tag == "is_obsolete" and value == "true" and "id" in current:
+                    obsolete.add(current["id"])
+                elif tag == "replaced_by" and "id" in current:
+                    replaced_by[current["id"]] = _strip_value(value)
+
+        term_index = {term: index for index, term in enumerate(term_ids)}
+        parent_offsets = array("I", [0])
+        parents = array("I")
+        for term_parents in raw_parents:
+            parents.extend(term_index[parent] for parent in term_parents if parent in term_index)
+            parent_offsets.append(len(parents))
+
+        return cls(term_ids, names, synonyms, alt_ids, obsolete, replaced_by, parent_offsets, parents)
+
+    def _compute_closure(self):
+        """Transitive is_a closure in one topological (parents-first) pass."""
+        n_terms = len(self.term_ids)
+        children = [[] for _ in range(n_terms)]
+        pending_parents = [0] * n_terms
+        for index in range(n_terms):
+            for parent in self.parents_of(index):
+                children[parent].append(index)
+                pending_parents[index] += 1
+
+        closures = [None] * n_terms
+        queue = deque(index for index in range(n_terms) if pending_parents[index] == 0)
+        while queue:
+            index = queue.popleft()
+            closure = set()
+            for parent in self.parents_of(index):
+                closure.add(parent)
+                closure.update(closures[parent])
+            closures[index] = closure
+            for child in children[index]:
+                pending_parents[child] -= 1
+                if pending_parents[child] == 0:
+                    queue.append(child)
+
+        if any(closure is None for closure in closures):
+            raise ValueError("Ontology is_a graph contains a cycle")
+
+        ancestor_offsets = array("I", [0])
+        ancestors = array("I")
+        for closure in closures:
+            ancestors.extend(sorted(closure))
+            ancestor_offsets.append(len(ancestors))
+        return ancestor_offsets, ancestors
+
+    def ancestor_dict(self):
+        """Drop-in replacement for precompute_ancestors(): term id -> set of ancestor ids."""
+        term_ids = self.term_ids
+        return {
+            term: {term_ids[ancestor] for ancestor in self.ancestors_of(index)}
+            for index, term in enumerate(term_ids)
+        }
+
+    def parent_dict(self):
+        """Term id -> set of direct is_a parent ids."""
+        term_ids = self.term_ids
+        return {
+            term: {term_ids[parent] for parent in self.parents_of(index)}
+            for index, term in enumerate(term_ids)
+        }
+
+    def save(self, path):
+        """Write the graph and its closure to path atomically."""
+        header = {
+            "version": OBO_GRAPH_FORMAT_VERSION,
+            "term_ids": self.term_ids,
+            "names": self.names,
+            "synonyms": self.synonyms,
+            "alt_ids": self.alt_ids,
+            "obsolete": sorted(self.obsolete),
+            "replaced_by": self.replaced_by,
+        }
+        write_array_file(path, OBO_GRAPH_MAGIC, header, [
+            ("parent_offsets", self.parent_offsets),
+            ("parents", self.parents),
+            ("ancestor_offsets", self.ancestor_offsets),
+            ("ancestors", self.ancestors),
+        ])
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a graph previously written by save()."""
+        header, arrays, mapped = read_array_file(path, OBO_GRAPH_MAGIC)
+        if header.get("version") != OBO_GRAPH_FORMAT_VERSION:
+            raise ValueError(f"Unsupported ontology cache version in {path}")
+        return cls(
+            header["term_ids"], header["names"], header["synonyms"],
+            header["alt_ids"], set(header["obsolete"]), header["replaced_by"],
+            arrays["parent_offsets"], arrays["parents"],
+            arrays["ancestor_offsets"], arrays["ancestors"], _mmap=mapped,
+        )
+
+
+def load_obo_graph(path_to_obo, cache_dir=None):
+    """
+    Load an OboGraph for path_to_obo, reusing a binary cache in cache_dir keyed by the
+    file checksum when available and writing one otherwise.
+    """
+    checksum = file_checksum(path_to_obo)
+    if cache_dir is None:
+        graph = OboGraph.parse(path_to_obo)
+        graph.checksum = checksum
+        return graph
+
+    cache_path = os.path.join(cache_dir, f"ontology-{checksum[:16]}.bin")
+    if os.path.exists(cache_path):
+        try:
+            graph = OboGraph.load(cache_path)
+            graph.checksum = checksum
+            count_cache("ontology", hit=True)
+            return graph
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable ontology cache {cache_path}: {e}")
+    count_cache("ontology", hit=False)
+
+    graph = OboGraph.parse(path_to_obo)
+    graph.checksum = checksum
+    try:
+        graph.save(cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write ontology cache {cache_path}: {e}")
+    return graph
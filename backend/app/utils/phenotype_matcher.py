@@ -0,0 +1,153 @@
+import re
+from collections import Counter, deque
+
+# Bump when matching behaviour changes so cached extraction results are invalidated
+MATCHER_VERSION = "1"
+
+PHENOTYPIC_ABNORMALITY_ID = "HP:0000118"
+
+# Tokens that negate the phenotypes mentioned shortly after them in the same sentence
+NEGATION_CUES = {"no", "not", "denies", "denied", "deny", "without", "negative", "absent", "absence", "never", "free"}
+# Tokens that end a negation's scope ("no fever but severe headache")
+NEGATION_TERMINATORS = {"but", "however", "although", "though", "except", "yet"}
+NEGATION_WINDOW = 6
+
+# Words, or punctuation that ends a sentence (matches never span sentences)
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+|[.;:!?\n]")
+_NORMALIZED_CACHE_SIZE = 200000
+
+
+def normalize_token(token):
+    """Lowercase a token and strip simple plural endings so "seizures" matches "seizure"."""
+    token = token.lower()
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normalize_phrase(text):
+    """Token list used as the automaton key for a term name or synonym."""
+    return [normalize_token(token) for token in _TOKEN_RE.findall(text) if token[0].isalnum()]
+
+
+class PhenotypeMatcher:
+    """
+    In-process phenotype extractor over a token-level Aho-Corasick automaton.
+
+    Every HPO name and synonym is compiled once into the automaton, so a note is scanned
+    in a single pass regardless of how many phrases there are. Mentions that follow a
+    negation cue within NEGATION_WINDOW tokens of the same sentence are ignored.
+    """
+
+    def __init__(self, phrases, names, version=f"native-{MATCHER_VERSION}"):
+        self.names = names
+        # Identifies this matcher and its vocabulary, e.g. for extraction result caches
+        self.version = version
+        # Raw token -> normalized token (None for sentence boundaries), shared across calls
+        self._normalized = {}
+        # Automaton nodes: transitions, failure links, and (hpo_id, phrase length) outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        for hpo_id, tokens in phrases:
+            self._add_phrase(hpo_id, tokens)
+        self._build_failure_links()
+
+    @classmethod
+    def from_ontology(cls, graph):
+        """Compile the names and synonyms of all current phenotypic abnormality terms."""
+        root = graph.term_index.get(PHENOTYPIC_ABNORMALITY_ID)
+        phrases = []
+        names = {}
+        for index, hpo_id in enumerate(graph.term_ids):
+            if hpo_id in graph.obsolete:
+                continue
+            if root is not None and root not in graph.ancestors_of(index):
+                continue
+            names[hpo_id] = graph.names[index]
+            for text in [graph.names[index]] + graph.synonyms.get(hpo_id, []):
+                tokens = normalize_phrase(text)
+                if tokens:
+                    phrases.append((hpo_id, tokens))
+        return cls(phrases, names, version=f"native-{MATCHER_VERSION}-{(graph.checksum or 'unknown')[:16]}")
+
+    def _add_phrase(self, hpo_id, tokens):
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        output = (hpo_id, len(tokens))
+        if output not in self._outputs[state]:
+            self._outputs[state].append(output)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def count_mentions(self, text):
+        """Return a Counter of hpo_id -> number of non-negated mentions in text."""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        normalized = self._normalized
+        counts = Counter()
+        state = 0
+        position = 0
+        last_negation = None
+
+        for raw in _TOKEN_RE.findall(text):
+            token = normalized.get(raw)
+            if token is None:
+                if len(normalized) >= _NORMALIZED_CACHE_SIZE:
+                    normalized.clear()
+                token = normalized[raw] = normalize_token(raw) if raw[0].isalnum() else None
+            if token is None:
+                # Sentence boundary: reset the automaton and the negation scope
+                state = 0
+                last_negation = None
+                continue
+
+            if token in NEGATION_CUES:
+                last_negation = position
+            elif token in NEGATION_TERMINATORS:
+                last_negation = None
+
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+
+            for hpo_id, length in outputs[state]:
+                start = position - length + 1
+                if last_negation is not None and 0 < start - last_negation <= NEGATION_WINDOW:
+                    continue
+                counts[hpo_id] += 1
+            position += 1
+
+        return counts
+
+    def extract(self, user_input_text, original_hpo_dict=None):
+        """Same result shape as parse_note_to_hpo: {hpo_id: {"id", "name", "source"}}."""
+        if original_hpo_dict is None:
+            original_hpo_dict = {}
+        for hpo_id in self.count_mentions(user_input_text):
+            original_hpo_dict[hpo_id] = {
+                "id": hpo_id,
+                "name": self.names.get(hpo_id, hpo_id),
+                "source": "Clinical notes"
+            }
+        return original_hpo_dict
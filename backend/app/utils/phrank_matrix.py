@@ -0,0 +1,432 @@
+import math
+import threading
+
+import numpy as np
+from scipy import sparse
+
+# IC weights are quantized to multiples of 1 / IC_FIXED_POINT_SCALE. Sums of such values stay
+# exact in float64 (well below 2**53 quanta), so every backend and summation order - sparse
+# mat-vec, set intersections, postings, incremental adds and removes - gives bit-identical
+# scores, and ties between diseases break the same way everywhere
+IC_FIXED_POINT_SCALE = 2.0 ** 32
+
+
+def top_n_indices(scores, top_n):
+    """
+    Indices of the top_n highest scores, best first, without sorting the whole vector.
+
+    Ties are broken by ascending index, which matches the stable sorted() ranking used by
+    phrank_score over diseases in annotation order.
+    """
+    n = len(scores)
+    if top_n <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if top_n >= n:
+        candidates = np.arange(n)
+    else:
+        kth = scores[np.argpartition(-scores, top_n - 1)[top_n - 1]]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:top_n - len(above)]
+        candidates = np.concatenate([above, ties])
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+class SparsePhrankScorer:
+    """
+    Vectorized Phrank backend over a disease x term CSR incidence matrix.
+
+    The matrix is built directly from the (already ancestor-propagated) DiseaseProfiles
+    arrays, so scoring a query is one sparse mat-vec against its expanded term vector.
+    """
+
+    def __init__(self, profiles):
+        self.disease_ids = profiles.disease_ids
+        self.term_index = profiles.term_index
+        indptr = np.frombuffer(profiles.offsets, dtype=np.uint32).astype(np.int32)
+        indices = np.frombuffer(profiles.terms, dtype=np.uint32).astype(np.int32)
+        data = np.ones(len(indices), dtype=np.float64)
+        self.matrix = sparse.csr_matrix(
+            (data, indices, indptr), shape=(len(profiles.disease_ids), len(profiles.term_ids))
+        )
+        self._postings = None
+
+    def information_content(self, parent_dict):
+        """
+        Conditional information content of every vocabulary term, as used by Phrank:
+        IC(t | parents) = log2(#diseases annotated with all parents of t / #diseases annotated with t),
+        where annotations are ancestor-propagated. Root terms get log2(#diseases / #annotated).
+        Values are quantized to multiples of 1 / IC_FIXED_POINT_SCALE (see there).
+        """
+        csc = self.matrix.tocsc()
+        n_diseases = self.matrix.shape[0]
+        term_counts = np.diff(csc.indptr)
+        term_ic = np.zeros(len(term_counts), dtype=np.float64)
+
+        for term, index in self.term_index.items():
+            if term_counts[index] == 0:
+                continue
+            parents = [self.term_index[parent] for parent in parent_dict.get(term, ()) if parent in self.term_index]
+            if not parents:
+                parent_count = n_diseases
+            elif len(parents) == 1:
+                parent_count = term_counts[parents[0]]
+            else:
+                # Diseases carrying every parent show up once per parent column
+                rows = np.concatenate([csc.indices[csc.indptr[p]:csc.indptr[p + 1]] for p in parents])
+                parent_count = np.count_nonzero(np.bincount(rows) == len(parents))
+            term_ic[index] = math.log2(parent_count / term_counts[index])
+        return np.round(term_ic * IC_FIXED_POINT_SCALE) / IC_FIXED_POINT_SCALE
+
+    def term_postings(self):
+        """
+        (indptr, indices) of the term x disease (CSC) layout: the diseases whose expanded
+        profile contains term j are indices[indptr[j]:indptr[j + 1]]. Built on first use.
+        """
+        if self._postings is None:
+            csc = self.matrix.tocsc()
+            self._postings = (csc.indptr, csc.indices)
+        return self._postings
+
+    def column_sums(self, term_indices, term_weights=None):
+        """Per-disease sum of the given term columns (weighted by term_weights if given)."""
+        indptr, indices = self.term_postings()
+        n_diseases = self.matrix.shape[0]
+        if not len(term_indices):
+            return np.zeros(n_diseases, dtype=np.float64)
+        term_indices = np.asarray(term_indices, dtype=np.intp)
+        rows = np.concatenate([indices[indptr[term]:indptr[term + 1]] for term in term_indices])
+        if term_weights is None:
+            return np.bincount(rows, minlength=n_diseases).astype(np.float64)
+        lengths = indptr[term_indices + 1] - indptr[term_indices]
+        return np.bincount(rows, weights=np.repeat(term_weights[term_indices], lengths), minlength=n_diseases)
+
+    def query_vector(self, expanded_terms, term_weights=None):
+        """Indicator (or term_weights-weighted) vector over the term vocabulary for an expanded query."""
+        vector = np.zeros(self.matrix.shape[1], dtype=np.float64)
+        indices = [self.term_index[term] for term in expanded_terms if term in self.term_index]
+        vector[indices] = 1.0 if term_weights is None else term_weights[indices]
+        return vector
+
+    def scores(self, expanded_terms, term_weights=None):
+        """Shared-term count for every disease, or the summed term_weights of shared terms."""
+        return self.matrix @ self.query_vector(expanded_terms, term_weights)
+
+    def rank(self, expanded_terms, top_n=5, term_weights=None):
+        """Return the top_n (disease_id, score) pairs, best first."""
+        scores = self.scores(expanded_terms, term_weights)
+        to_score = int if term_weights is None else float
+        return [(self.disease_ids[index], to_score(scores[index])) for index in top_n_indices(scores, top_n)]
+
+    def rank_batch(self, expanded_queries, top_n=5, term_weights=None):
+        """
+        Rank many expanded queries in one pass: the queries are stacked into a sparse
+        term x patient matrix and scored with a single sparse mat-mat product.
+        """
+        rows, cols, values = [], [], []
+        for column, expanded_terms in enumerate(expanded_queries):
+            indices = [self.term_index[term] for term in expanded_terms if term in self.term_index]
+            rows.extend(indices)
+            cols.extend([column] * len(indices))
+            values.append(np.ones(len(indices)) if term_weights is None else term_weights[indices])
+        values = np.concatenate(values) if values else np.empty(0)
+        queries = sparse.csc_matrix((values, (rows, cols)), shape=(self.matrix.shape[1], len(expanded_queries)))
+
+        all_scores = (self.matrix @ queries).toarray()
+        to_score = int if term_weights is None else float
+        return [
+            [(self.disease_ids[index], to_score(scores[index])) for index in top_n_indices(scores, top_n)]
+            for scores in all_scores.T
+        ]
+
+
+class IncrementalScorer:
+    """
+    Running Phrank score vector over all diseases for one phenotype set that is edited a
+    few terms at a time.
+
+    Every selected HPO code contributes its ancestor closure; a reference count per
+    vocabulary term tracks how many selected codes reach it. Adding or removing a code only
+    touches the terms whose count goes from or to zero, and the score vector is updated by
+    those terms' columns, so an edit costs the size of its closure's postings rather than
+    a rescoring of the whole set.
+    """
+
+    def __init__(self, scorer, term_weights=None):
+        self.scorer = scorer
+        # Integer-valued weights (1 per term, or the IC in fixed-point quanta) keep the running
+        # sums exact. term_weights must be information_content() output, already quantized to
+        # 1 / IC_FIXED_POINT_SCALE, so the scaling is exact and rank() reproduces the scores of
+        # every full-scoring backend bit for bit
+        self.scale = 1.0 if term_weights is None else IC_FIXED_POINT_SCALE
+        self.weights = None if term_weights is None else term_weights * self.scale
+        self.scores = np.zeros(scorer.matrix.shape[0], dtype=np.float64)
+        # code -> term indices of its expanded closure, and term index -> codes reaching it
+        self._closures = {}
+        self._refcounts = {}
+        # Held by callers around update() + rank() so concurrent requests see a consistent vector
+        self.lock = threading.Lock()
+
+    @property
+    def codes(self):
+        return set(self._closures)
+
+    def update(self, added, removed=()):
+        """
+        Apply an edit: added maps new codes to their expanded term indices, removed lists
+        codes to drop. Returns the number of term columns applied to the score vector.
+        """
+        activated, deactivated = [], []
+        for code in removed:
+            for term in self._closures.pop(code, ()):
+                self._refcounts[term] -= 1
+                if self._refcounts[term] == 0:
+                    del self._refcounts[term]
+                    deactivated.append(term)
+        for code, terms in added.items():
+            if code in self._closures:
+                continue
+            self._closures[code] = tuple(terms)
+            for term in self._closures[code]:
+                if term not in self._refcounts:
+                    self._refcounts[term] = 0
+                    activated.append(term)
+                self._refcounts[term] += 1
+
+        # A term removed and re-added in the same edit cancels out
+        changed = set(activated) & set(deactivated)
+        activated = [term for term in activated if term not in changed]
+        deactivated = [term for term in deactivated if term not in changed]
+
+        if len(activated) + len(deactivated) >= len(self._refcounts):
+            # The edit touches more columns than the new set holds: rebuild from scratch
+            self.scores = self.scorer.column_sums(list(self._refcounts), self.weights)
+            return len(self._refcounts)
+        if activated:
+            self.scores += self.scorer.column_sums(activated, self.weights)
+        if deactivated:
+            self.scores -= self.scorer.column_sums(deactivated, self.weights)
+        return len(activated) + len(deactivated)
+
+    def rank(self, top_n=5):
+        """Return the top_n (disease_id, score) pairs, best first, like SparsePhrankScorer.rank."""
+        disease_ids = self.scorer.disease_ids
+        if self.weights is None:
+            return [(disease_ids[index], int(self.scores[index])) for index in top_n_indices(self.scores, top_n)]
+        return [
+            (disease_ids[index], float(self.scores[index] / self.scale))
+            for index in top_n_indices(self.scores, top_n)
+        ]
+
+
+class InvertedPhrankScorer(SparsePhrankScorer):
+    """
+    Phrank backend that scores term-at-a-time over the inverted term -> disease index.
+
+    The postings of a term list every disease annotated with it or with one of its
+    descendants. Partial scores are scattered into a per-thread scratch accumulator that is
+    reset only where a query touched it, and the candidate set is the list of diseases
+    first reached by some posting, so the work per query follows the size of the postings
+    it visits rather than the corpus. Terms are visited most valuable and most selective
+    first, in blocks that double in size; once the weight left in the unvisited terms
+    cannot lift any disease outside the current top_n, the scan stops (MaxScore-style) and
+    only the candidates that can still reach the top_n are completed. The broad ancestors
+    near the root, whose postings cover most of the corpus, are the terms this usually
+    skips.
+    """
+
+    # Terms in the first block; each later block is twice the size of the previous one
+    FIRST_BLOCK = 8
+
+    def __init__(self, profiles):
+        super().__init__(profiles)
+        self.term_postings()
+        self._scratch = threading.local()
+
+    def _accumulator(self):
+        """This thread's (scores, reached) scratch arrays, all zero / False between queries."""
+        scratch = self._scratch
+        if not hasattr(scratch, "scores"):
+            scratch.scores = np.zeros(self.matrix.shape[0], dtype=np.float64)
+            scratch.reached = np.zeros(self.matrix.shape[0], dtype=bool)
+        return scratch.scores, scratch.reached
+
+    def rank(self, expanded_terms, top_n=5, term_weights=None):
+        """Return the top_n (disease_id, score) pairs, best first, as SparsePhrankScorer.rank does."""
+        indptr, indices = self.term_postings()
+        terms = np.unique(np.array(
+            [self.term_index[term] for term in expanded_terms if term in self.term_index], dtype=np.intp
+        ))
+        weights = np.ones(len(terms)) if term_weights is None else term_weights[terms]
+        lengths = indptr[terms + 1] - indptr[terms]
+        # Terms every disease carries (the root, Phenotypic abnormality) add the same weight to
+        # every score, so they are added as a constant instead of scanning their postings
+        universal = lengths == self.matrix.shape[0]
+        offset = float(weights[universal].sum())
+        terms, weights, lengths = terms[~universal], weights[~universal], lengths[~universal]
+        order = np.lexsort((lengths, -weights))
+        terms, weights, lengths = terms[order], weights[order], lengths[order]
+        # bounds[i]: the most the terms from position i on can still add to any disease
+        bounds = np.append(np.cumsum(weights[::-1])[::-1], 0.0)
+
+        accumulator, reached = self._accumulator()
+        # Diseases in the order they were first reached; exactly the non-zero entries to reset
+        reached_parts = []
+        try:
+            visited, block, threshold = 0, self.FIRST_BLOCK, None
+            while visited < len(terms):
+                for term, weight in zip(terms[visited:visited + block], weights[visited:visited + block]):
+                    rows = indices[indptr[term]:indptr[term + 1]]
+                    accumulator[rows] += weight
+                    first_reached = rows[~reached[rows]]
+                    reached[first_reached] = True
+                    reached_parts.append(first_reached)
+                visited = min(visited + block, len(terms))
+                block *= 2
+                if 0 < top_n and visited < len(terms):
+                    candidates = np.concatenate(reached_parts)
+                    reached_parts = [candidates]
+                    if len(candidates) >= top_n:
+                        partial = accumulator[candidates]
+                        kth = np.partition(partial, len(partial) - top_n)[len(partial) - top_n]
+                        if bounds[visited] < kth:
+                            threshold = kth
+                            break
+
+            candidates = np.sort(np.concatenate(reached_parts)) if reached_parts else np.empty(0, dtype=np.intp)
+            scores = accumulator[candidates]
+        finally:
+            touched = np.concatenate(reached_parts) if reached_parts else np.empty(0, dtype=np.intp)
+            accumulator[touched] = 0.0
+            reached[touched] = False
+
+        if threshold is not None:
+            # Unseen diseases score at most bounds[visited] < threshold; of the candidates, only
+            # those within that bound of the threshold can still make the top_n
+            keep = scores + bounds[visited] >= threshold
+            candidates, scores = candidates[keep], scores[keep]
+            scores = scores + self._remaining_scores(candidates, terms[visited:], weights[visited:], lengths[visited:])
+
+        # With fewer than top_n scoring diseases the rest of the list is zero-score diseases in
+        # disease order, as in the dense backend
+        scoring = scores > 0
+        candidates, scores = candidates[scoring], scores[scoring]
+        to_score = int if term_weights is None else float
+        # Candidates are in ascending disease order, so ties still break by annotation order
+        ranked = [
+            (self.disease_ids[candidates[index]], to_score(scores[index] + offset)) for index in top_n_indices(scores, top_n)
+        ]
+        if len(ranked) < top_n:
+            scored = set(candidates.tolist())
+            for index in range(self.matrix.shape[0]):
+                if len(ranked) >= top_n:
+                    break
+                if index not in scored:
+                    ranked.append((self.disease_ids[index], to_score(offset)))
+        return ranked
+
+    def _remaining_scores(self, candidates, terms, weights, lengths):
+        """
+        Weight of the unvisited terms in each (sorted) candidate's profile, read from the
+        candidates' CSR rows or from the unvisited postings, whichever is smaller.
+        """
+        row_lengths = self.matrix.indptr[candidates + 1] - self.matrix.indptr[candidates]
+        # A posting entry costs a binary search over the candidates, a row entry one lookup
+        if row_lengths.sum() < lengths.sum() * math.log2(len(candidates) + 1):
+            rest = np.zeros(self.matrix.shape[1], dtype=np.float64)
+            rest[terms] = weights
+            return self.matrix[candidates] @ rest
+        indptr, indices = self.term_postings()
+        rows = np.concatenate([indices[indptr[term]:indptr[term + 1]] for term in terms])
+        row_weights = np.repeat(weights, lengths)
+        # Membership in the sorted candidates is a binary search per posting entry
+        positions = np.minimum(np.searchsorted(candidates, rows), len(candidates) - 1)
+        hits = candidates[positions] == rows
+        return np.bincount(positions[hits], weights=row_weights[hits], minlength=len(candidates))
+
+
+class GenePhrankScorer:
+    """
+    Gene-level Phrank scoring over a gene x term incidence matrix.
+
+    A gene's profile is the union of the ancestor-expanded profiles of its diseases, so a
+    gene scores the terms it shares with the query through any of them. Both matrices are
+    built once from the disease x term matrix and the disease -> gene associations; ranking
+    a candidate list (e.g. the genes of an exome's variants) is one sparse mat-vec over
+    just those rows.
+    """
+
+    def __init__(self, scorer, annotations):
+        self.scorer = scorer
+        self.gene_symbols = annotations.gene_symbols
+        self.gene_index = {symbol: index for index, symbol in enumerate(self.gene_symbols)}
+        # Case-insensitive fallback for candidate lists typed or exported in another case
+        self._folded_index = {}
+        for index, symbol in enumerate(self.gene_symbols):
+            self._folded_index.setdefault(symbol.upper(), index)
+
+        # Gene x disease incidence, with diseases in the order of the scorer's matrix rows
+        gene_offsets = np.frombuffer(annotations.gene_offsets, dtype=np.uint32).astype(np.intp)
+        genes = np.frombuffer(annotations.genes, dtype=np.uint32).astype(np.intp)
+        positions = np.array([annotations.disease_index[disease_id] for disease_id in scorer.disease_ids], dtype=np.intp)
+        lengths = gene_offsets[positions + 1] - gene_offsets[positions]
+        rows = np.concatenate([genes[gene_offsets[position]:gene_offsets[position + 1]] for position in positions]) \
+            if len(positions) else np.empty(0, dtype=np.intp)
+        cols = np.repeat(np.arange(len(positions)), lengths)
+        self.gene_diseases = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)), shape=(len(self.gene_symbols), len(positions))
+        )
+        self.matrix = (self.gene_diseases @ scorer.matrix).tocsr()
+        self.matrix.data[:] = 1.0
+
+    def resolve_genes(self, gene_symbols):
+        """Split gene symbols into (sorted gene indices, symbols with no disease association)."""
+        found, unmatched = set(), []
+        for symbol in gene_symbols:
+            index = self.gene_index.get(symbol)
+            if index is None:
+                index = self._folded_index.get(symbol.strip().upper())
+            if index is None:
+                unmatched.append(symbol)
+            else:
+                found.add(index)
+        return np.array(sorted(found), dtype=np.intp), unmatched
+
+    def rank(self, expanded_terms, top_n=None, term_weights=None, candidates=None):
+        """
+        Return the top_n (gene_symbol, score) pairs, best first, over the candidate gene
+        indices (all genes if None). top_n=None ranks every candidate.
+        """
+        if candidates is None:
+            candidates = np.arange(len(self.gene_symbols))
+            matrix = self.matrix
+        else:
+            matrix = self.matrix[candidates]
+        scores = matrix @ self.scorer.query_vector(expanded_terms, term_weights)
+        to_score = int if term_weights is None else float
+        ranked = top_n_indices(scores, len(candidates) if top_n is None else top_n)
+        return [(self.gene_symbols[candidates[index]], to_score(scores[index])) for index in ranked]
+
+    def diseases_of(self, gene_symbol):
+        """Positions (in the scorer's disease order) of the diseases associated with a gene."""
+        row = self.gene_index[gene_symbol]
+        return self.gene_diseases.indices[self.gene_diseases.indptr[row]:self.gene_diseases.indptr[row + 1]]
+
+    def order_diseases(self, gene_symbols, expanded_terms, term_weights=None):
+        """
+        gene symbol -> positions of its diseases, ordered by their own Phrank score against
+        the query (best first, ties in disease order). Only those diseases' rows are scored.
+        """
+        rows = {symbol: self.diseases_of(symbol) for symbol in gene_symbols}
+        positions = np.unique(np.concatenate(list(rows.values()))) if rows else np.empty(0, dtype=np.intp)
+        query = self.scorer.query_vector(expanded_terms, term_weights)
+        if len(positions) * 4 > self.scorer.matrix.shape[0]:
+            # Slicing out most rows costs more than one full mat-vec
+            scores = (self.scorer.matrix @ query)[positions]
+        else:
+            scores = self.scorer.matrix[positions] @ query
+        disease_scores = dict(zip(positions.tolist(), scores.tolist()))
+        return {
+            symbol: sorted(diseases.tolist(), key=lambda position: (-disease_scores[position], position))
+            for symbol, diseases in rows.items()
+        }
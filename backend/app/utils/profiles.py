@@ -0,0 +1,120 @@
+import logging
+import os
+from array import array
+
+from app.utils.binary_cache import file_checksum, read_array_file, write_array_file
+from app.utils.metrics import count_cache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MAGIC = b"PHRPROF3"
+PROFILE_FORMAT_VERSION = 3
+
+
+class DiseaseProfiles:
+    """
+    Ancestor-expanded HPO profile of every disease in a compact CSR-like layout.
+
+    Terms are interned to integers; the expanded term indices of disease i live in
+    terms[offsets[i]:offsets[i + 1]]. When loaded from disk both arrays are views on a
+    read-only memory map, so the profiles cost almost no private memory per process.
+    """
+
+    def __init__(self, disease_ids, term_ids, offsets, terms, _mmap=None):
+        self.disease_ids = disease_ids
+        self.term_ids = term_ids
+        self.term_index = {term: index for index, term in enumerate(term_ids)}
+        self.offsets = offsets
+        self.terms = terms
+        self._mmap = _mmap
+
+    def __len__(self):
+        return len(self.disease_ids)
+
+    def terms_of(self, index):
+        """Return the expanded term indices of the disease at position index."""
+        return self.terms[self.offsets[index]:self.offsets[index + 1]]
+
+    def encode_terms(self, hpo_terms):
+        """Map HPO ids to term indices, dropping terms no disease profile contains."""
+        term_index = self.term_index
+        return {term_index[term] for term in hpo_terms if term in term_index}
+
+    @classmethod
+    def build(cls, disease_to_hpo, ancestor_dict):
+        """Expand every disease's annotations with their ancestors once."""
+        expanded = []
+        vocabulary = set()
+        for hpo_terms in disease_to_hpo.values():
+            expanded_terms = set(hpo_terms)
+            for term in hpo_terms:
+                expanded_terms.update(ancestor_dict.get(term, set()))
+            expanded.append(expanded_terms)
+            vocabulary.update(expanded_terms)
+
+        term_ids = sorted(vocabulary)
+        term_index = {term: index for index, term in enumerate(term_ids)}
+        offsets = array("I", [0])
+        terms = array("I")
+        for expanded_terms in expanded:
+            terms.extend(sorted(term_index[term] for term in expanded_terms))
+            offsets.append(len(terms))
+
+        return cls(list(disease_to_hpo.keys()), term_ids, offsets, terms)
+
+    @classmethod
+    def from_annotations(cls, annotations, ancestor_dict):
+        """Build the profiles of every disease in an AnnotationTable."""
+        term_ids = annotations.term_ids
+        disease_to_hpo = {
+            disease_id: [term_ids[term] for term in annotations.terms_of(index)]
+            for index, disease_id in enumerate(annotations.disease_ids)
+        }
+        return cls.build(disease_to_hpo, ancestor_dict)
+
+    def save(self, path):
+        """Write the profiles to path atomically."""
+        header = {
+            "version": PROFILE_FORMAT_VERSION,
+            "disease_ids": self.disease_ids,
+            "term_ids": self.term_ids,
+        }
+        write_array_file(path, PROFILE_MAGIC, header, [("offsets", self.offsets), ("terms", self.terms)])
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map profiles previously written by save()."""
+        header, arrays, mapped = read_array_file(path, PROFILE_MAGIC)
+        if header.get("version") != PROFILE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported disease profile cache version in {path}")
+        return cls(header["disease_ids"], header["term_ids"], arrays["offsets"], arrays["terms"], _mmap=mapped)
+
+
+def profile_cache_path(cache_dir, ontology_path, annotations_key):
+    """Cache file name keyed by the checksum of hp.obo and the annotation_cache_key of phenotype.hpoa."""
+    key = f"{file_checksum(ontology_path)[:16]}-{annotations_key}"
+    return os.path.join(cache_dir, f"disease_profiles-{key}.bin")
+
+
+def load_or_build_profiles(cache_dir, ontology_path, annotations_key, annotations, ancestor_dict):
+    """
+    Load the disease profiles for this hp.obo / AnnotationTable pair from cache_dir,
+    building and caching them first if no matching artifact exists.
+    """
+    path = profile_cache_path(cache_dir, ontology_path, annotations_key)
+    if os.path.exists(path):
+        try:
+            profiles = DiseaseProfiles.load(path)
+            count_cache("profiles", hit=True)
+            return profiles
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable disease profile cache {path}: {e}")
+    count_cache("profiles", hit=False)
+
+    profiles = DiseaseProfiles.from_annotations(annotations, ancestor_dict)
+    try:
+        profiles.save(path)
+        return DiseaseProfiles.load(path)
+    except OSError as e:
+        logger.warning(f"Could not write disease profile cache {path}: {e}")
+        return profiles
@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# Backend ("memory" or "sqlite"), idle lifetime of a session, and the shared SQLite file
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "/code/app/data/sessions.sqlite3")
+
+# How many writes happen between sweeps for expired sessions
+_SWEEP_EVERY = 100
+
+
+class SessionStore(ABC):
+    """
+    Per-session key/value state (HPO codes, diagnoses, recommendations, ...).
+
+    Values must be JSON-serialisable so that every backend can store them. A session
+    expires once it has not been read or written for ttl seconds.
+    """
+
+    @abstractmethod
+    def get(self, session_id, key, default=None):
+        """Return the value of key in the session, or default if missing or expired."""
+
+    @abstractmethod
+    def set(self, session_id, key, value):
+        """Store value under key in the session, refreshing its expiry."""
+
+    @abstractmethod
+    def delete(self, session_id, key=None):
+        """Delete one key of a session, or the whole session if key is None."""
+
+    @abstractmethod
+    def session_count(self):
+        """Number of live sessions."""
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store with idle-TTL eviction; fine for a single worker."""
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _live_session(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is not None and session["expires"] < now:
+            del self._sessions[session_id]
+            session = None
+        return session
+
+    def get(self, session_id, key, default=None):
+        now = time.time()
+        with self._lock:
+            session = self._live_session(session_id, now)
+            if session is None or key not in session["data"]:
+                return default
+            session["expires"] = now + self.ttl
+            # Hand out a copy so callers cannot mutate stored state behind the store's back
+            return json.loads(json.dumps(session["data"][key]))
+
+    def set(self, session_id, key, value):
+        now = time.time()
+        value = json.loads(json.dumps(value))
+        with self._lock:
+            session = self._live_session(session_id, now)
+            if session is None:
+                session = self._sessions[session_id] = {"data": {}}
+            session["data"][key] = value
+            session["expires"] = now + self.ttl
+            self._writes += 1
+            if self._writes % _SWEEP_EVERY == 0:
+                self._sweep(now)
+
+    def delete(self, session_id, key=None):
+        with self._lock:
+            if key is None:
+                self._sessions.pop(session_id, None)
+            elif session_id in self._sessions:
+                self._sessions[session_id]["data"].pop(key, None)
+
+    def session_count(self):
+        with self._lock:
+            self._sweep(time.time())
+            return len(self._sessions)
+
+    def _sweep(self, now):
+        expired = [session_id for session_id, session in self._sessions.items() if session["expires"] < now]
+        for session_id in expired:
+            del self._sessions[session_id]
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store backed by a SQLite file, so several uvicorn worker processes on one host can
+    share sessions. Each thread uses its own connection; WAL mode lets readers and the
+    writer proceed concurrently.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS session_values ("
+                " session_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " PRIMARY KEY (session_id, key))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, expires REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, session_id, key, default=None):
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT v.value FROM session_values v JOIN sessions s ON s.session_id = v.session_id"
+                " WHERE v.session_id = ? AND v.key = ? AND s.expires >= ?",
+                (session_id, key, now),
+            ).fetchone()
+            if row is None:
+                return default
+            connection.execute("UPDATE sessions SET expires = ? WHERE session_id = ?", (now + self.ttl, session_id))
+        return json.loads(row[0])
+
+    def set(self, session_id, key, value):
+        now = time.time()
+        with self._connection() as connection:
+            expired = connection.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ? AND expires < ?", (session_id, now)
+            ).fetchone()
+            if expired:
+                self._delete_sessions(connection, [session_id])
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, expires) VALUES (?, ?)", (session_id, now + self.ttl)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO session_values (session_id, key, value) VALUES (?, ?, ?)",
+                (session_id, key, json.dumps(value)),
+            )
+            self._writes += 1
+            if self._writes % _SWEEP_EVERY == 0:
+                self._sweep(connection, now)
+
+    def delete(self, session_id, key=None):
+        with self._connection() as connection:
+            if key is None:
+                self._delete_sessions(connection, [session_id])
+            else:
+                connection.execute("DELETE FROM session_values WHERE session_id = ? AND key = ?", (session_id, key))
+
+    def session_count(self):
+        now = time.time()
+        with self._connection() as connection:
+            self._sweep(connection, now)
+            return connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _delete_sessions(self, connection, session_ids):
+        connection.executemany("DELETE FROM session_values WHERE session_id = ?", [(s,) for s in session_ids])
+        connection.executemany("DELETE FROM sessions WHERE session_id = ?", [(s,) for s in session_ids])
+
+    def _sweep(self, connection, now):
+        expired = [row[0] for row in connection.execute("SELECT session_id FROM sessions WHERE expires < ?", (now,))]
+        if expired:
+            self._delete_sessions(connection, expired)
+
+
+def create_session_store(backend=SESSION_STORE):
+    """Build the session store selected by SESSION_STORE."""
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown session store {backend!r}, expected 'memory' or 'sqlite'")
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide SessionStore."""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = create_session_store()
+    return _session_store
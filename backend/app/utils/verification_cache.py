@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite file holding generated verification questions across restarts and workers
+VERIFICATION_CACHE_PATH = os.environ.get("VERIFICATION_CACHE_PATH", "/code/app/data/verification_questions.sqlite3")
+
+
+class VerificationQuestionCache:
+    """
+    Persistent cache of LLM-generated verification questions keyed by (hpo_code, prompt_version).
+
+    Entries are kept in memory in front of a SQLite table. get_or_generate() also coalesces
+    concurrent requests for the same key, so they share one upstream LLM call.
+    """
+
+    def __init__(self, path=VERIFICATION_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._memory = {}
+        # (hpo_code, prompt_version) -> task of the generation in flight
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._connection = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS verification_questions ("
+                    " hpo_code TEXT NOT NULL, prompt_version TEXT NOT NULL, payload TEXT NOT NULL,"
+                    " created REAL NOT NULL, PRIMARY KEY (hpo_code, prompt_version))"
+                )
+
+    def get(self, hpo_code, prompt_version):
+        """Return the cached questions for hpo_code, or None."""
+        key = (hpo_code, prompt_version)
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+            if self._connection is None:
+                return None
+            row = self._connection.execute(
+                "SELECT payload FROM verification_questions WHERE hpo_code = ? AND prompt_version = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            value = self._memory[key] = json.loads(row[0])
+            return value
+
+    def put(self, hpo_code, prompt_version, value):
+        key = (hpo_code, prompt_version)
+        with self._lock:
+            self._memory[key] = value
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO verification_questions VALUES (?, ?, ?, ?)",
+                        (hpo_code, prompt_version, json.dumps(value), time.time())
+                    )
+
+    def cached_codes(self, prompt_version):
+        """HPO codes that already have questions for prompt_version."""
+        with self._lock:
+            codes = {code for code, version in self._memory if version == prompt_version}
+            if self._connection is not None:
+                codes.update(row[0] for row in self._connection.execute(
+                    "SELECT hpo_code FROM verification_questions WHERE prompt_version = ?", (prompt_version,)
+                ))
+        return codes
+
+    async def get_or_generate(self, hpo_code, prompt_version, generate):
+        """
+        Return the cached questions for hpo_code, or await generate() to produce them.
+        Concurrent callers for the same key share one generation, which runs as its own task
+        so that cancelling any caller (the first included) leaves it running for the others.
+        Results are only cached if generate() succeeds.
+        """
+        cached = self.get(hpo_code, prompt_version)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        key = (hpo_code, prompt_version)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(generate())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._generation_done, key))
+        # Shield so a cancelled caller does not cancel the shared generation
+        return await asyncio.shield(task)
+
+    def _generation_done(self, key, task):
+        del self._inflight[key]
+        # exception() also marks a failure as retrieved when every caller has gone away
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.put(key[0], key[1], task.result())
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_verification_cache = None
+
+
+def get_verification_cache():
+    """Return the process-wide VerificationQuestionCache."""
+    global _verification_cache
+    if _verification_cache is None:
+        _verification_cache = VerificationQuestionCache()
+    return _verification_cache
@@ -0,0 +1,253 @@
+"""
+Synthetic HPO ontology, disease annotations, gene associations and clinical notes for the
+benchmarks, since hp.obo and phenotype.hpoa are not shipped with the repo.
+
+The files use the real formats and roughly the real shape: ~16k terms in organ-system
+subtrees under Phenotypic abnormality, ~20 annotations per disease concentrated in a few
+systems, 1-3 genes per disease. Everything is generated from a seed, so a given scale
+always produces the same files.
+"""
+import os
+import random
+
+# Terms in the synthetic ontology (hp.obo has ~19k)
+DEFAULT_TERM_COUNT = 16000
+
+ROOT_ID = "HP:0000001"
+PHENOTYPIC_ABNORMALITY_ID = "HP:0000118"
+
+# Real terms that tools/mock_llm_server.py proposes, so chat turns can ground its answers
+ANCHOR_TERMS = [
+    ("HP:0001382", "Joint hypermobility", "skeletal"),
+    ("HP:0000974", "Hyperextensible skin", "cutaneous"),
+]
+
+ORGANS = [
+    "renal", "hepatic", "cardiac", "pulmonary", "cerebral", "ocular", "cutaneous", "skeletal",
+    "muscular", "splenic", "gastric", "intestinal", "pancreatic", "thyroid", "adrenal", "retinal",
+    "cochlear", "dental", "vertebral", "pelvic", "cranial", "facial", "digital", "vascular",
+    "lymphatic", "genital", "urinary", "nasal", "laryngeal", "spinal",
+]
+QUALIFIERS = [
+    "progressive", "congenital", "recurrent", "chronic", "severe", "mild", "bilateral", "focal",
+    "diffuse", "episodic", "asymmetric", "transient", "nodular", "cystic", "atrophic", "hypertrophic",
+    "hypoplastic", "dysplastic", "fibrotic", "calcified", "edematous", "hemorrhagic", "sclerotic",
+    "ectatic", "stenotic",
+]
+FINDINGS = [
+    "cyst", "lesion", "atrophy", "dysfunction", "malformation", "insufficiency", "enlargement",
+    "hypoplasia", "inflammation", "deposit", "fibrosis", "anomaly", "dilatation", "stenosis",
+    "thickening", "defect", "duplication", "agenesis", "degeneration", "hemorrhage", "pain",
+    "weakness", "opacity", "nodule", "ulcer",
+]
+
+FREQUENCIES = ["", "", "", "HP:0040280", "HP:0040281", "HP:0040282", "HP:0040283", "HP:0040284", "3/7", "12/20", "45%"]
+ASPECTS = "PPPPPPPPPICM"
+
+ANNOTATIONS_HEADER = (
+    "database_id\tdisease_name\tqualifier\thpo_id\treference\tevidence\tonset\tfrequency\tsex\tmodifier\taspect\tbiocuration"
+)
+GENES_HEADER = "ncbi_gene_id\tgene_symbol\tassociation_type\tdisease_id\tsource"
+
+FILLER_SENTENCES = [
+    "Vital signs were within normal limits.",
+    "The patient was seen in clinic today for follow-up.",
+    "Medications were reviewed and reconciled.",
+    "Laboratory results from the previous visit were discussed with the family.",
+    "She tolerated the procedure well and was discharged home.",
+    "He attends school and is meeting most developmental milestones.",
+    "Plan to repeat imaging in six months.",
+    "Growth parameters are tracking along the 25th percentile.",
+]
+FINDING_TEMPLATES = [
+    "The patient presents with {name}.",
+    "Examination was notable for {name}.",
+    "There is a history of {name} since early childhood.",
+    "Family history is significant for {name} in a sibling.",
+    "No {name} was observed.",
+    "She denies {name}.",
+]
+
+
+def term_id(index):
+    """HPO-style id of the index-th generated term (clear of the real ids used above)."""
+    return f"HP:{1000000 + index:07d}"
+
+
+def term_name(index):
+    qualifier = QUALIFIERS[index % len(QUALIFIERS)]
+    organ = ORGANS[(index // len(QUALIFIERS)) % len(ORGANS)]
+    finding = FINDINGS[(index // (len(QUALIFIERS) * len(ORGANS))) % len(FINDINGS)]
+    return f"{qualifier} {organ} {finding}"
+
+
+def organ_group_id(organ_index):
+    return f"HP:{900000 + organ_index:07d}"
+
+
+def write_ontology(path, term_count=DEFAULT_TERM_COUNT, seed=0):
+    """
+    Write an OBO ontology: the root, Phenotypic abnormality, one "Abnormality of the <organ>"
+    group per organ, and term_count terms nested under them (some with two parents, a synonym
+    or an alt_id), plus one obsolete term.
+    """
+    rng = random.Random(seed)
+    lines = ["format-version: 1.2", "ontology: hp", ""]
+
+    def term(hpo_id, name, parents=(), synonyms=(), alt_ids=()):
+        lines.extend(["[Term]", f"id: {hpo_id}", f"name: {name}"])
+        lines.extend(f"alt_id: {alt_id}" for alt_id in alt_ids)
+        lines.extend(f'synonym: "{synonym}" EXACT []' for synonym in synonyms)
+        lines.extend(f"is_a: {parent}" for parent in parents)
+        lines.append("")
+
+    term(ROOT_ID, "All")
+    term(PHENOTYPIC_ABNORMALITY_ID, "Phenotypic abnormality", [ROOT_ID])
+    for organ_index, organ in enumerate(ORGANS):
+        term(organ_group_id(organ_index), f"Abnormality of the {organ} system", [PHENOTYPIC_ABNORMALITY_ID])
+    for hpo_id, name, organ in ANCHOR_TERMS:
+        term(hpo_id, name, [organ_group_id(ORGANS.index(organ))])
+
+    # Terms of each organ, so parents are picked within the same subtree
+    organ_terms = [[] for _ in ORGANS]
+    for index in range(term_count):
+        organ_index = (index // len(QUALIFIERS)) % len(ORGANS)
+        siblings = organ_terms[organ_index]
+        parents = [organ_group_id(organ_index)]
+        if siblings and rng.random() < 0.85:
+            # Prefer recent terms so subtrees get deep rather than wide
+            parents = [siblings[max(0, len(siblings) - 1 - int(rng.expovariate(0.05)))]]
+            if rng.random() < 0.15:
+                parents.append(rng.choice(siblings))
+        synonyms = []
+        if index % 4 == 0:
+            words = term_name(index).split(" ")
+            synonyms.append(f"{words[2]} of the {words[1]} region, {words[0]}")
+        alt_ids = [f"HP:{2000000 + index:07d}"] if index % 50 == 0 else []
+        term(term_id(index), term_name(index), sorted(set(parents)), synonyms, alt_ids)
+        siblings.append(term_id(index))
+
+    lines.extend(["[Term]", "id: HP:0999999", "name: obsolete synthetic finding", "is_obsolete: true",
+                  f"replaced_by: {term_id(0)}", ""])
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write("\n".join(lines))
+
+
+def write_annotations(path, disease_count, term_count=DEFAULT_TERM_COUNT, seed=0):
+    """
+    Write a phenotype.hpoa with disease_count diseases of 3-40 annotations each, drawn
+    mostly from one to three organ systems. About 2% of annotations are NOT-qualified.
+    """
+    rng = random.Random(seed + 1)
+    per_organ = [[] for _ in ORGANS]
+    for index in range(term_count):
+        per_organ[(index // len(QUALIFIERS)) % len(ORGANS)].append(index)
+
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(f"#description: synthetic HPO annotations for benchmarking\n{ANNOTATIONS_HEADER}\n")
+        for disease in range(disease_count):
+            disease_id = f"OMIM:{100000 + disease}"
+            systems = rng.sample(range(len(ORGANS)), rng.randint(1, 3))
+            annotation_count = min(40, max(3, int(rng.gauss(20, 8))))
+            terms = set()
+            while len(terms) < annotation_count:
+                pool = per_organ[rng.choice(systems)] if rng.random() < 0.9 else range(term_count)
+                terms.add(rng.choice(pool))
+            for index in sorted(terms):
+                qualifier = "NOT" if rng.random() < 0.02 else ""
+                handle.write(
+                    f"{disease_id}\tSynthetic disease {disease}\t{qualifier}\t{term_id(index)}\tPMID:{disease}\tPCS\t\t"
+                    f"{rng.choice(FREQUENCIES)}\t\t\t{rng.choice(ASPECTS)}\tHPO:benchmark[2024-01-01]\n"
+                )
+
+
+def write_genes(path, disease_count, seed=0):
+    """Write a genes_to_disease.txt associating every disease with 1-3 of ~disease_count/3 genes."""
+    rng = random.Random(seed + 2)
+    gene_count = max(10, disease_count // 3)
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(GENES_HEADER + "\n")
+        for disease in range(disease_count):
+            for gene in rng.sample(range(gene_count), rng.randint(1, 3)):
+                handle.write(f"NCBIGene:{gene + 1}\tGENE{gene + 1}\tMENDELIAN\tOMIM:{100000 + disease}\tbenchmark\n")
+
+
+def build_fixtures(directory, disease_count, term_count=DEFAULT_TERM_COUNT, seed=0):
+    """
+    Generate (or reuse) the ontology, annotation and gene files for one scale under directory.
+    Returns a dict with their paths.
+    """
+    fixture_dir = os.path.join(directory, f"hpo-{term_count}t-{disease_count}d-s{seed}")
+    paths = {
+        "ontology": os.path.join(fixture_dir, "hp.obo"),
+        "annotations": os.path.join(fixture_dir, "phenotype.hpoa"),
+        "genes": os.path.join(fixture_dir, "genes_to_disease.txt"),
+    }
+    marker = os.path.join(fixture_dir, ".complete")
+    if not os.path.exists(marker):
+        os.makedirs(fixture_dir, exist_ok=True)
+        write_ontology(paths["ontology"], term_count, seed)
+        write_annotations(paths["annotations"], disease_count, term_count, seed)
+        write_genes(paths["genes"], disease_count, seed)
+        open(marker, "w").close()
+    return paths
+
+
+def note_text(size_bytes, term_count=DEFAULT_TERM_COUNT, seed=0):
+    """
+    A clinical-note-like text of about size_bytes: paragraphs of routine sentences with
+    mentions (some negated) of synthetic terms. Up to 1 MB of distinct text is generated and
+    repeated beyond that, which keeps 100 MB notes cheap to produce.
+    """
+    rng = random.Random(seed + size_bytes)
+    paragraphs = []
+    generated = 0
+    while generated < min(size_bytes, 1024 * 1024):
+        sentences = [rng.choice(FILLER_SENTENCES) for _ in range(rng.randint(2, 5))]
+        for _ in range(rng.randint(1, 3)):
+            name = term_name(rng.randrange(term_count))
+            sentences.insert(rng.randrange(len(sentences) + 1), rng.choice(FINDING_TEMPLATES).format(name=name))
+        paragraph = " ".join(sentences) + "\n\n"
+        paragraphs.append(paragraph)
+        generated += len(paragraph)
+    block = "".join(paragraphs)
+    return (block * (size_bytes // len(block) + 1))[:size_bytes]
+
+
+def write_note(directory, size_bytes, term_count=DEFAULT_TERM_COUNT, seed=0):
+    """Write (or reuse) a note of size_bytes under directory and return its path."""
+    path = os.path.join(directory, f"note-{size_bytes}-s{seed}.txt")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        partial = path + ".tmp"
+        with open(partial, "w", encoding="utf-8") as handle:
+            handle.write(note_text(size_bytes, term_count, seed))
+        os.replace(partial, path)
+    return path
+
+
+def patient_queries(disease_to_hpo, count=64, seed=0):
+    """
+    count HPO code lists resembling patients: 3-8 terms of a random disease plus 0-2
+    unrelated terms from other diseases.
+    """
+    rng = random.Random(seed + 3)
+    diseases = sorted(disease_to_hpo)
+    queries = []
+    for _ in range(count):
+        terms = sorted(disease_to_hpo[rng.choice(diseases)])
+        query = rng.sample(terms, min(len(terms), rng.randint(3, 8)))
+        for _ in range(rng.randint(0, 2)):
+            query.append(rng.choice(sorted(disease_to_hpo[rng.choice(diseases)])))
+        queries.append(query)
+    return queries
+
+
+def symptom_messages(count=64, term_count=DEFAULT_TERM_COUNT, seed=0):
+    """Patient chat messages describing two or three synthetic findings each."""
+    rng = random.Random(seed + 4)
+    messages = []
+    for _ in range(count):
+        names = [term_name(rng.randrange(term_count)) for _ in range(rng.randint(2, 3))]
+        messages.append(f"For the last few months I have had {', '.join(names[:-1])} and {names[-1]}.")
+    return messages
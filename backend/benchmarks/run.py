@@ -0,0 +1,252 @@
+"""
+Benchmark the diagnosis, extraction and chat hot paths on synthetic data.
+
+Scenarios:
+    phrank_score        original set-based Phrank scoring, per patient
+    diagnose_helper     PhrankEngine scoring (--backends), per patient
+    parse_note_to_hpo   ClinPhen CLI extraction (skipped if clinphen is not installed)
+    native_extract      in-process phenotype matcher extraction
+    api_clinical_notes  POST /clinical-notes (--extractor)
+    api_diagnoses       GET /diagnoses after a one-code edit of the session's HPO codes
+    api_diagnoses_cold  GET /diagnoses for sessions never diagnosed before
+    api_send_message    POST /send-message with tools/mock_llm_server.py as the LLM
+
+Disease-scaled scenarios run at every --diseases count, note-scaled ones at every
+--note-sizes size and API ones at every --concurrency level. Each run is a separate
+subprocess and reports latency percentiles, throughput and peak RSS. Run from backend/:
+    python -m benchmarks.run --scale quick
+    python -m benchmarks.run --scale full --output benchmarks/results/v1.2.json
+    python -m benchmarks.run --scenarios diagnose_helper --baseline benchmarks/results/v1.1.json
+
+With --baseline, p50 latencies are compared against an earlier results file and the exit
+status is 1 if any scenario got slower by more than --threshold.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.fixtures import build_fixtures, write_note
+from benchmarks.scenarios import SCENARIOS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {
+    "quick": {"diseases": [1000, 10000], "note_sizes": ["1KB", "1MB"], "concurrency": [1, 8]},
+    "full": {"diseases": [1000, 10000, 100000], "note_sizes": ["1KB", "100KB", "10MB", "100MB"],
+             "concurrency": [1, 8, 32]},
+}
+NOTE_SCENARIOS = ("parse_note_to_hpo", "native_extract", "api_clinical_notes")
+# Notes above this size are only uploaded one at a time
+CONCURRENT_NOTE_MAX_BYTES = 1024 * 1024
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse "100KB" / "10MB" / "512" into bytes."""
+    text = text.strip().upper()
+    for unit in sorted(_SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * _SIZE_UNITS[unit])
+    return int(text)
+
+
+def format_size(size):
+    for unit in ("GB", "MB", "KB"):
+        if size >= _SIZE_UNITS[unit] and size % _SIZE_UNITS[unit] == 0:
+            return f"{size // _SIZE_UNITS[unit]}{unit}"
+    return f"{size}B"
+
+
+def plan_runs(scenarios, diseases, note_sizes, concurrency, backends):
+    """(scenario, params) for every run; API scenarios also vary concurrency."""
+    runs = []
+    for scenario in scenarios:
+        if scenario == "phrank_score":
+            runs.extend((scenario, {"diseases": count}) for count in diseases)
+        elif scenario == "diagnose_helper":
+            runs.extend((scenario, {"diseases": count, "backend": backend}) for count in diseases for backend in backends)
+        elif scenario in ("api_diagnoses", "api_diagnoses_cold"):
+            runs.extend((scenario, {"diseases": count, "concurrency": level}) for count in diseases for level in concurrency)
+        elif scenario == "api_clinical_notes":
+            runs.extend(
+                (scenario, {"note_bytes": size, "concurrency": level})
+                for size in note_sizes for level in concurrency
+                if level == 1 or size <= CONCURRENT_NOTE_MAX_BYTES
+            )
+        elif scenario in NOTE_SCENARIOS:
+            runs.extend((scenario, {"note_bytes": size}) for size in note_sizes)
+        elif scenario == "api_send_message":
+            runs.extend((scenario, {"concurrency": level}) for level in concurrency)
+    return runs
+
+
+def run_key(scenario, params):
+    return scenario + "".join(f" {name}={params[name]}" for name in sorted(params))
+
+
+def run_in_subprocess(spec, timeout):
+    """Run one scenario in a fresh interpreter with the app pointed at the fixtures."""
+    env = dict(os.environ)
+    env.update({
+        "PHRANK_ONTOLOGY_PATH": spec["ontology"],
+        "PHRANK_ANNOTATIONS_PATH": spec["annotations"],
+        "PHRANK_GENES_PATH": spec["genes"],
+        "PHRANK_CACHE_DIR": spec["cache_dir"],
+        "PHRANK_BACKEND": spec.get("backend", "matrix"),
+        "SESSION_STORE": "memory",
+        "CHAT_SESSION_DIR": os.path.join(spec["run_dir"], "chat_sessions"),
+        "VERIFICATION_CACHE_PATH": os.path.join(spec["run_dir"], "verification_questions.sqlite3"),
+        "OPENAI_API_KEY": "benchmark",
+    })
+    env.pop("NOTE_CACHE_DIR", None)
+    os.makedirs(spec["run_dir"], exist_ok=True)
+    spec_path = os.path.join(spec["run_dir"], "spec.json")
+    result_path = os.path.join(spec["run_dir"], "result.json")
+    with open(spec_path, "w", encoding="utf-8") as handle:
+        json.dump(spec, handle)
+    if os.path.exists(result_path):
+        os.remove(result_path)
+
+    try:
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.scenarios", spec_path, result_path],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout}s"}
+    if process.returncode != 0 or not os.path.exists(result_path):
+        return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit status {process.returncode}",
+                "stderr": process.stderr[-4000:]}
+    with open(result_path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(result):
+    if "skipped" in result:
+        return f"skipped: {result['skipped']}"
+    if "error" in result:
+        return f"error: {result['error']}"
+    latency = result["latency_seconds"]
+    rss = result.get("peak_rss_bytes")
+    return (
+        f"p50 {latency['p50'] * 1000:10.3f} ms  p99 {latency['p99'] * 1000:10.3f} ms  "
+        f"{result['throughput_per_second']:10.1f}/s  n={result['iterations']:<6d}"
+        + (f"  rss {rss / 1024 ** 2:7.1f} MB" if rss else "")
+    )
+
+
+def compare(results, baseline, threshold):
+    """Print p50 changes against baseline results; return the keys that regressed beyond threshold."""
+    previous = {run_key(entry["scenario"], entry["params"]): entry for entry in baseline.get("results", [])}
+    regressions = []
+    print(f"\nCompared with {baseline.get('created')} ({(baseline.get('git_commit') or 'unknown commit')[:12]}):")
+    for entry in results:
+        key = run_key(entry["scenario"], entry["params"])
+        before = previous.get(key, {}).get("latency_seconds")
+        after = entry.get("latency_seconds")
+        if not before or not after or not before.get("p50"):
+            continue
+        ratio = after["p50"] / before["p50"]
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(key)
+        print(f"  {key:<60} p50 x{ratio:6.2f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="quick", help="preset input sizes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument("--diseases", help="comma-separated disease counts (overrides --scale)")
+    parser.add_argument("--note-sizes", help="comma-separated note sizes such as 1KB,10MB (overrides --scale)")
+    parser.add_argument("--concurrency", help="comma-separated requests in flight for API scenarios (overrides --scale)")
+    parser.add_argument("--backends", default="matrix", help="comma-separated Phrank backends for diagnose_helper")
+    parser.add_argument("--extractor", default="native", help="extractor used by api_clinical_notes")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the stub LLM waits per call")
+    parser.add_argument("--budget", type=float, default=3.0, help="seconds of timed calls per run")
+    parser.add_argument("--max-iterations", type=int, default=2000, help="timed calls per run at most")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds before a run is abandoned")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "rare-disease-benchmarks"),
+                        help="where fixtures and caches are kept between invocations")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare p50 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale]
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = sorted(set(scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}, expected some of {SCENARIOS}")
+    diseases = [int(count) for count in args.diseases.split(",")] if args.diseases else scale["diseases"]
+    note_sizes = [parse_size(size) for size in (args.note_sizes.split(",") if args.note_sizes else scale["note_sizes"])]
+    concurrency = [int(level) for level in args.concurrency.split(",")] if args.concurrency else scale["concurrency"]
+    backends = [backend.strip() for backend in args.backends.split(",")]
+
+    created = datetime.datetime.now(datetime.timezone.utc)
+    output = args.output or os.path.join(BACKEND_DIR, "benchmarks", "results", f"{created:%Y%m%dT%H%M%SZ}.json")
+    fixture_dir = os.path.join(args.workdir, "fixtures")
+    runs_dir = os.path.join(args.workdir, "runs", f"{created:%Y%m%dT%H%M%SZ}")
+
+    results = []
+    for index, (scenario, params) in enumerate(plan_runs(scenarios, diseases, note_sizes, concurrency, backends)):
+        # Note and chat scenarios load the smallest disease scale for the engine they need
+        fixtures = build_fixtures(fixture_dir, params.get("diseases", min(diseases)))
+        spec = dict(
+            fixtures, scenario=scenario, budget_seconds=args.budget, max_iterations=args.max_iterations,
+            extractor=args.extractor, llm_latency=args.llm_latency,
+            cache_dir=os.path.join(args.workdir, "cache"), run_dir=os.path.join(runs_dir, str(index)), **params
+        )
+        if "note_bytes" in params:
+            spec["note_path"] = write_note(os.path.join(fixture_dir, "notes"), params["note_bytes"])
+
+        result = run_in_subprocess(spec, args.timeout)
+        display = dict(params, note_bytes=format_size(params["note_bytes"])) if "note_bytes" in params else params
+        print(f"{run_key(scenario, display):<60} {format_result(result)}", flush=True)
+        results.append(dict(result, scenario=scenario, params=params))
+
+    report = {
+        "created": created.isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "scale": args.scale, "diseases": diseases, "note_sizes": note_sizes, "concurrency": concurrency,
+            "backends": backends, "extractor": args.extractor, "llm_latency": args.llm_latency,
+            "budget_seconds": args.budget, "max_iterations": args.max_iterations,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            regressions = compare(results, json.load(handle), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} run(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Benchmark scenarios. Each one runs in its own interpreter (started by benchmarks/run.py as
+`python -m benchmarks.scenarios SPEC_PATH RESULT_PATH`), so peak RSS and import/load costs
+belong to that scenario alone. The child reads its configuration from the JSON spec, times
+the operation and writes latency, throughput and peak RSS to RESULT_PATH.
+"""
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class ScenarioSkipped(Exception):
+    """Raised when a scenario cannot run here, e.g. the clinphen CLI is not installed."""
+
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, wall_seconds):
+    ordered = sorted(latencies)
+    return {
+        "iterations": len(ordered),
+        "wall_seconds": wall_seconds,
+        "throughput_per_second": len(ordered) / wall_seconds if wall_seconds > 0 else None,
+        "latency_seconds": {
+            "min": ordered[0] if ordered else None,
+            "p50": percentile(ordered, 0.50),
+            "p90": percentile(ordered, 0.90),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1] if ordered else None,
+            "mean": sum(ordered) / len(ordered) if ordered else None,
+        },
+    }
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(operation, budget_seconds, max_iterations):
+    """
+    Call operation(i) until the time budget or iteration cap is used up. The first call is a
+    discarded warm-up, unless it alone used up the budget (very large inputs), in which case
+    it is the only sample.
+    """
+    start = time.perf_counter()
+    operation(0)
+    warm_up = time.perf_counter() - start
+    if warm_up >= budget_seconds:
+        return summarize([warm_up], warm_up)
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_iterations and time.perf_counter() - started < budget_seconds:
+        call_start = time.perf_counter()
+        operation(len(latencies) + 1)
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def measure_async(operation, concurrency, budget_seconds, max_iterations):
+    """
+    Like measure(), for a coroutine function, with concurrency calls kept in flight.
+    Throughput is completed calls over the wall time of the whole run.
+    """
+    start = time.perf_counter()
+    await operation(0)
+    warm_up = time.perf_counter() - start
+    if warm_up >= budget_seconds:
+        return summarize([warm_up], warm_up)
+
+    latencies = []
+    next_index = 1
+    started = time.perf_counter()
+
+    async def worker():
+        nonlocal next_index
+        while next_index <= max_iterations and time.perf_counter() - started < budget_seconds:
+            index = next_index
+            next_index += 1
+            call_start = time.perf_counter()
+            await operation(index)
+            latencies.append(time.perf_counter() - call_start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def read_note(spec):
+    with open(spec["note_path"], "r", encoding="utf-8") as handle:
+        return handle.read()
+
+
+def load_engine(spec):
+    from app.utils.diagnosing import PhrankEngine
+
+    return PhrankEngine(
+        spec["ontology"], spec["annotations"], spec["cache_dir"],
+        backend=spec.get("backend", "matrix"), genes_path=spec["genes"]
+    ).load()
+
+
+# ___________________________ LIBRARY SCENARIOS ___________________________
+
+def prepare_phrank_score(spec):
+    """The original set-based phrank_score, expanding every disease per call."""
+    from app.utils.diagnosing import phrank_score, read_disease_annotations
+    from app.utils.ontology import load_obo_graph
+    from benchmarks.fixtures import patient_queries
+
+    ancestor_dict = load_obo_graph(spec["ontology"], spec["cache_dir"]).ancestor_dict()
+    disease_to_hpo, _, _ = read_disease_annotations(spec["annotations"])
+    queries = patient_queries(disease_to_hpo)
+    return lambda index: phrank_score(queries[index % len(queries)], disease_to_hpo, ancestor_dict)
+
+
+def prepare_diagnose_helper(spec):
+    """diagnose_helper against a loaded PhrankEngine with the given backend."""
+    from app.utils.diagnosing import diagnose_helper
+    from benchmarks.fixtures import patient_queries
+
+    engine = load_engine(spec)
+    queries = patient_queries(engine.snapshot()["annotations"].disease_to_hpo())
+    return lambda index: diagnose_helper(queries[index % len(queries)], engine=engine)
+
+
+def prepare_parse_note_to_hpo(spec):
+    """ClinPhen extraction through the clinphen CLI, one subprocess per note."""
+    from app.utils.extraction import parse_note_to_hpo
+
+    if shutil.which("clinphen") is None:
+        raise ScenarioSkipped("clinphen CLI is not installed")
+    note = read_note(spec)
+    return lambda index: parse_note_to_hpo(user_input_text=note)
+
+
+def prepare_native_extract(spec):
+    """The in-process Aho-Corasick phenotype matcher."""
+    matcher = load_engine(spec).phenotype_matcher()
+    note = read_note(spec)
+    return lambda index: matcher.extract(note)
+
+
+# ___________________________ API SCENARIOS ___________________________
+# Endpoints are driven in-process through httpx.AsyncClient(app=app), after running the
+# app's startup handlers, so the numbers include routing, validation and serialization.
+
+async def start_app():
+    import httpx
+    from app.main import app
+
+    await app.router.startup()
+    return app, httpx.AsyncClient(app=app, base_url="http://benchmark")
+
+
+def install_stub_llm(latency_seconds):
+    """Serve LLM calls from tools/mock_llm_server.py in-process instead of over the network."""
+    import httpx
+    from app.utils import llm_client
+
+    os.environ["MOCK_LLM_LATENCY_SECONDS"] = str(latency_seconds)
+    from tools.mock_llm_server import app as mock_app
+
+    llm_client._llm_client = llm_client.AsyncLLMClient(
+        base_url="http://mock-llm/v1", api_key="benchmark", transport=httpx.ASGITransport(app=mock_app)
+    )
+
+
+def check_response(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} returned {response.status_code}: "
+                           f"{response.text[:200]}")
+    return response
+
+
+async def prepare_api_clinical_notes(spec, client):
+    """POST /clinical-notes; each upload gets a distinct first line so the note cache misses."""
+    with open(spec["note_path"], "rb") as handle:
+        note = handle.read()
+    extractor = spec.get("extractor", "native")
+    if extractor == "clinphen" and shutil.which("clinphen") is None:
+        raise ScenarioSkipped("clinphen CLI is not installed")
+
+    async def operation(index):
+        response = check_response(await client.post(
+            "/clinical-notes",
+            files={"file": ("note.txt", b"Visit %d.\n" % index + note, "text/plain")},
+            data={"extractor": extractor},
+            headers={"X-Session-ID": f"benchmark-{index}"},
+        ))
+        if not response.json().get("success"):
+            raise RuntimeError(response.json().get("message"))
+
+    return operation
+
+
+async def seed_diagnosis_sessions(client):
+    """Post each synthetic patient's HPO codes to its own session; returns the queries."""
+    from app.utils.diagnosing import get_engine
+    from benchmarks.fixtures import patient_queries
+
+    if not get_engine().loaded:
+        raise RuntimeError("Phrank engine did not load")
+    queries = patient_queries(get_engine().snapshot()["annotations"].disease_to_hpo())
+    for index, query in enumerate(queries):
+        check_response(await client.post(
+            "/hpo-codes", json=[{"id": hpo_id, "name": hpo_id} for hpo_id in query],
+            headers={"X-Session-ID": f"benchmark-{index}"}
+        ))
+    return queries
+
+
+async def prepare_api_diagnoses(spec, client):
+    """
+    GET /diagnoses for sessions whose HPO codes were posted beforehand. Before each call one
+    code (another patient's) is toggled in the session's stored set, the way a clinician edits
+    a patient between diagnoses, so the session's incremental scorer has a real edit to apply
+    rather than an unchanged set.
+    """
+    from app.main import load_hpo_codes, save_hpo_codes
+
+    queries = await seed_diagnosis_sessions(client)
+
+    async def operation(index):
+        session_id = f"benchmark-{index % len(queries)}"
+        hpo_codes = load_hpo_codes(session_id)
+        extra = queries[(index + 1) % len(queries)][0]
+        if extra in hpo_codes:
+            del hpo_codes[extra]
+        else:
+            hpo_codes[extra] = {"id": extra, "name": extra}
+        save_hpo_codes(session_id, hpo_codes)
+        check_response(await client.get("/diagnoses", headers={"X-Session-ID": session_id}))
+
+    return operation
+
+
+async def prepare_api_diagnoses_cold(spec, client):
+    """GET /diagnoses, each call for a session that has never been diagnosed (first-visit latency)."""
+    from app.main import save_hpo_codes
+
+    queries = await seed_diagnosis_sessions(client)
+
+    async def operation(index):
+        session_id = f"benchmark-cold-{index}"
+        save_hpo_codes(session_id, {hpo_id: {"id": hpo_id, "name": hpo_id} for hpo_id in queries[index % len(queries)]})
+        check_response(await client.get("/diagnoses", headers={"X-Session-ID": session_id}))
+
+    return operation
+
+
+async def prepare_api_send_message(spec, client):
+    """
+    POST /send-message with the LLM stubbed. Messages cycle over a set of chats, so the run
+    mixes first symptom descriptions, follow-up answers and verification turns.
+    """
+    from benchmarks.fixtures import symptom_messages
+
+    install_stub_llm(spec.get("llm_latency", 0.0))
+    chats = max(16, 2 * spec.get("concurrency", 1))
+    messages = symptom_messages(chats)
+    # /start-chat assigns the session id; an id the server has not issued would start a fresh,
+    # uninitialised chat that answers without calling the LLM
+    session_ids = []
+    for _ in range(chats):
+        response = check_response(await client.get("/start-chat"))
+        session_ids.append(response.json()["session_id"])
+
+    async def operation(index):
+        chat = index % chats
+        text = messages[chat] if index < chats else "Yes, that started about a year ago."
+        check_response(await client.post(
+            "/send-message", json={"text": text, "session_id": session_ids[chat]},
+            headers={"X-Session-ID": f"benchmark-{chat}"}
+        ))
+
+    return operation
+
+
+LIBRARY_SCENARIOS = {
+    "phrank_score": prepare_phrank_score,
+    "diagnose_helper": prepare_diagnose_helper,
+    "parse_note_to_hpo": prepare_parse_note_to_hpo,
+    "native_extract": prepare_native_extract,
+}
+API_SCENARIOS = {
+    "api_clinical_notes": prepare_api_clinical_notes,
+    "api_diagnoses": prepare_api_diagnoses,
+    "api_diagnoses_cold": prepare_api_diagnoses_cold,
+    "api_send_message": prepare_api_send_message,
+}
+SCENARIOS = sorted(LIBRARY_SCENARIOS) + sorted(API_SCENARIOS)
+
+
+async def run_api_scenario(spec):
+    setup_start = time.perf_counter()
+    app, client = await start_app()
+    try:
+        operation = await API_SCENARIOS[spec["scenario"]](spec, client)
+        setup_seconds = time.perf_counter() - setup_start
+        result = await measure_async(operation, spec.get("concurrency", 1), spec["budget_seconds"], spec["max_iterations"])
+    finally:
+        await client.aclose()
+        await app.router.shutdown()
+    result["setup_seconds"] = setup_seconds
+    return result
+
+
+def run_scenario(spec):
+    """Run the scenario described by spec and return its measurements."""
+    scenario = spec["scenario"]
+    try:
+        if scenario in LIBRARY_SCENARIOS:
+            setup_start = time.perf_counter()
+            operation = LIBRARY_SCENARIOS[scenario](spec)
+            setup_seconds = time.perf_counter() - setup_start
+            result = measure(operation, spec["budget_seconds"], spec["max_iterations"])
+            result["setup_seconds"] = setup_seconds
+        elif scenario in API_SCENARIOS:
+            result = asyncio.run(run_api_scenario(spec))
+        else:
+            raise ValueError(f"Unknown scenario {scenario!r}, expected one of {SCENARIOS}")
+    except ScenarioSkipped as e:
+        result = {"skipped": str(e)}
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def main():
+    spec_path, result_path = sys.argv[1:3]
+    with open(spec_path, "r", encoding="utf-8") as handle:
+        spec = json.load(handle)
+    result = run_scenario(spec)
+    with open(result_path, "w", encoding="utf-8") as handle:
+        json.dump(result, handle)
+
+
+if __name__ == "__main__":
+    main()
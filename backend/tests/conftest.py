@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# Tests import app.* and benchmarks.* the way the API and benchmark runner do, from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.diagnosing import SCORING_BACKENDS, PhrankEngine  # noqa: E402
+from benchmarks.fixtures import build_fixtures  # noqa: E402
+
+# Small enough to build in a couple of seconds, large enough for plenty of exact IC ties
+FIXTURE_DISEASES = 400
+FIXTURE_TERMS = 3000
+
+
+@pytest.fixture(scope="session")
+def fixture_paths(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("phrank")
+    paths = build_fixtures(str(directory / "data"), FIXTURE_DISEASES, term_count=FIXTURE_TERMS)
+    paths["cache_dir"] = str(directory / "cache")
+    return paths
+
+
+@pytest.fixture(scope="session")
+def engines(fixture_paths):
+    """One loaded PhrankEngine per scoring backend, over the same synthetic release."""
+    return {
+        backend: PhrankEngine(
+            fixture_paths["ontology"], fixture_paths["annotations"], fixture_paths["cache_dir"],
+            backend=backend, genes_path=fixture_paths["genes"], preload_text_indexes=False,
+        ).load()
+        for backend in SCORING_BACKENDS
+    }
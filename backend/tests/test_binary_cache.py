@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from app.utils.binary_cache import read_array_file, write_array_file
+from app.utils.ontology import load_obo_graph
+
+MAGIC = b"TEST"
+
+
+def test_truncated_file_raises_value_error(tmp_path):
+    path = str(tmp_path / "arrays.bin")
+    write_array_file(path, MAGIC, {"version": 1}, [("a", list(range(100))), ("b", [1, 2, 3])])
+    data = open(path, "rb").read()
+    for cut in (0, 3, len(MAGIC) + 5, len(MAGIC) + 12, len(data) - 4, len(data) - 1):
+        with open(path, "wb") as handle:
+            handle.write(data[:cut])
+        with pytest.raises(ValueError):
+            read_array_file(path, MAGIC)
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path):
+    with pytest.raises(OverflowError):
+        # Negative values do not fit the uint32 arrays
+        write_array_file(str(tmp_path / "arrays.bin"), MAGIC, {}, [("a", [-1])])
+    assert os.listdir(tmp_path) == []
+
+
+def test_truncated_ontology_cache_is_rebuilt(fixture_paths, tmp_path):
+    cache_dir = str(tmp_path)
+    expected = load_obo_graph(fixture_paths["ontology"], cache_dir)
+    (cache_file,) = os.listdir(cache_dir)
+    cache_path = os.path.join(cache_dir, cache_file)
+    os.truncate(cache_path, os.path.getsize(cache_path) // 2)
+
+    graph = load_obo_graph(fixture_paths["ontology"], cache_dir)
+    assert graph.term_ids == expected.term_ids
+    assert graph.ancestor_dict() == expected.ancestor_dict()
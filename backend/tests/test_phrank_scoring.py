@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from app.utils.diagnosing import SCORING_MODES, PhrankEngine, phrank_score
+from benchmarks.fixtures import patient_queries
+
+TOP_N = 10
+
+
+def edit_sequence(engine, steps=200, seed=0):
+    """Phenotype sets produced by random single-code adds and removes."""
+    terms = sorted(engine.snapshot()["matrix"].term_index)
+    rng = random.Random(seed)
+    selected = []
+    for _ in range(steps):
+        if selected and rng.random() < 0.35:
+            selected.remove(rng.choice(selected))
+        else:
+            selected.append(rng.choice(terms))
+        yield list(selected)
+
+
+def test_matrix_backend_matches_phrank_score(engines):
+    # phrank_score is the original set-based reference; it only has the count mode
+    state = engines["matrix"].snapshot()
+    disease_to_hpo = state["annotations"].disease_to_hpo()
+    for query in patient_queries(disease_to_hpo, count=16):
+        expected = phrank_score(query, disease_to_hpo, state["ancestor_dict"], top_n=TOP_N)
+        assert engines["matrix"].score(query, top_n=TOP_N, mode="count") == expected
+
+
+@pytest.mark.parametrize("mode", SCORING_MODES)
+def test_sets_backend_matches_matrix_backend(engines, mode):
+    for phenotype_list in edit_sequence(engines["matrix"], steps=100, seed=2):
+        expected = engines["matrix"].score(phenotype_list, top_n=TOP_N, mode=mode)
+        assert engines["sets"].score(phenotype_list, top_n=TOP_N, mode=mode) == expected
+
+
+@pytest.mark.parametrize("mode", SCORING_MODES)
+def test_batch_scoring_matches_single_scoring(engines, mode):
+    # More patients than one shard, so the batch is split and reassembled in order
+    engine = engines["matrix"]
+    phenotype_lists = list(edit_sequence(engine, steps=300, seed=3))
+    expected = [engine.score(phenotype_list, top_n=TOP_N, mode=mode) for phenotype_list in phenotype_lists]
+    assert engine.score_batch(phenotype_lists, top_n=TOP_N, mode=mode, workers=1) == expected
+
+
+def test_batch_pool_matches_single_scoring(engines):
+    engine = PhrankEngine(**dict(engines["matrix"].worker_config(), batch_workers=2))
+    try:
+        phenotype_lists = list(edit_sequence(engine, steps=300, seed=4))
+        expected = [engine.score(phenotype_list, top_n=TOP_N, mode="ic") for phenotype_list in phenotype_lists]
+        assert engine.score_batch(phenotype_lists, top_n=TOP_N, mode="ic") == expected
+    finally:
+        engine.shutdown_batch_pool()
+
+
+@pytest.mark.parametrize("mode", SCORING_MODES)
+def test_incremental_scoring_matches_full_scoring(engines, mode):
+    engine = engines["matrix"]
+    for phenotype_list in edit_sequence(engine):
+        expected = engine.score(phenotype_list, top_n=TOP_N, mode=mode)
+        assert engine.score_session("edits", phenotype_list, top_n=TOP_N, mode=mode) == expected
+
+
+@pytest.mark.parametrize("mode", SCORING_MODES)
+@pytest.mark.parametrize("top_n", [1, TOP_N, 1000])
+def test_inverted_backend_matches_matrix_backend(engines, mode, top_n):
+    # top_n=1000 exceeds the diseases any query reaches, exercising the zero-score padding
+    for phenotype_list in edit_sequence(engines["matrix"], steps=100, seed=1):
+        expected = engines["matrix"].score(phenotype_list, top_n=top_n, mode=mode)
+        assert engines["inverted"].score(phenotype_list, top_n=top_n, mode=mode) == expected
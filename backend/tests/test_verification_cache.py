@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from app.utils.verification_cache import VerificationQuestionCache
+
+QUESTIONS = [{"question": "Is the onset congenital?"}]
+
+
+def make_cache(tmp_path):
+    return VerificationQuestionCache(str(tmp_path / "verification_questions.sqlite3"))
+
+
+def test_cancelling_first_caller_does_not_cancel_waiters(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def generate():
+            calls.append(1)
+            await release.wait()
+            return QUESTIONS
+
+        first = asyncio.ensure_future(cache.get_or_generate("HP:0000001", "v1", generate))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_generate("HP:0000001", "v1", generate))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        return await second
+
+    assert asyncio.run(scenario()) == QUESTIONS
+    assert calls == [1]
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 1
+    assert not cache._inflight
+    assert make_cache(tmp_path).get("HP:0000001", "v1") == QUESTIONS
+
+
+def test_failed_generation_is_shared_and_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def generate():
+            await release.wait()
+            raise RuntimeError("upstream failed")
+
+        callers = [asyncio.ensure_future(cache.get_or_generate("HP:0000001", "v1", generate)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get("HP:0000001", "v1") is None
+    assert not cache._inflight
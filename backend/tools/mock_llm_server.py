@@ -0,0 +1,114 @@
+"""
+Local stand-in for the OpenAI /v1/chat/completions endpoint, for exercising the chat
+without network access or API costs.
+
+Run it with:
+    uvicorn tools.mock_llm_server:app --port 8001
+and start the backend with OPENAI_BASE_URL=http://localhost:8001/v1.
+
+MOCK_LLM_LATENCY_SECONDS adds a fixed delay before every response (the time to first token
+when streaming), MOCK_LLM_TOKEN_SECONDS the delay between streamed chunks, and
+MOCK_LLM_FAILURE_RATE makes that fraction of requests fail with 503, to exercise timeouts
+and retries.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_LLM_LATENCY_SECONDS = float(os.environ.get("MOCK_LLM_LATENCY_SECONDS", "0.5"))
+MOCK_LLM_TOKEN_SECONDS = float(os.environ.get("MOCK_LLM_TOKEN_SECONDS", "0.02"))
+MOCK_LLM_FAILURE_RATE = float(os.environ.get("MOCK_LLM_FAILURE_RATE", "0"))
+# Characters per streamed chunk, roughly a few tokens
+STREAM_CHUNK_CHARS = 16
+
+app = FastAPI()
+
+SYMPTOM_ANALYSIS = {
+    "identified_hpo_codes": [
+        {
+            "hpo_code": "HP:0001382",
+            "hpo_name": "Joint hypermobility",
+            "confidence": "high",
+            "rationale": "The patient reports joints that bend further than normal."
+        },
+        {
+            "hpo_code": "HP:0000974",
+            "hpo_name": "Hyperextensible skin",
+            "confidence": "medium",
+            "rationale": "The patient mentions unusually stretchy skin."
+        }
+    ],
+    "follow_up_questions": [
+        "Do you bruise easily?",
+        "Has anyone in your family had similar symptoms?"
+    ],
+    "symptom_summary": "Patient reports joints that bend further than normal and unusually stretchy skin."
+}
+
+
+def verification_questions(prompt):
+    hpo_code = prompt.split("HPO Code:", 1)[1].split("\n", 1)[0].strip() if "HPO Code:" in prompt else ""
+    hpo_name = prompt.split("Term:", 1)[1].split("\n", 1)[0].strip() if "Term:" in prompt else ""
+    return {
+        "hpo_code": hpo_code,
+        "hpo_name": hpo_name,
+        "layman_description": f"{hpo_name} in everyday words.",
+        "verification_questions": [
+            f"Have you noticed signs of {hpo_name.lower()}?",
+            "When did you first notice it?"
+        ]
+    }
+
+
+def completion_content(messages):
+    """Pick a canned answer from the last user message, mirroring the prompts in llm_chat.py."""
+    prompt = messages[-1]["content"] if messages else ""
+    if "verify if a patient has the following HPO phenotype" in prompt:
+        return json.dumps(verification_questions(prompt))
+    return json.dumps(SYMPTOM_ANALYSIS)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(MOCK_LLM_LATENCY_SECONDS)
+    if random.random() < MOCK_LLM_FAILURE_RATE:
+        return JSONResponse(status_code=503, content={"error": {"message": "mock overload"}})
+
+    content = completion_content(body.get("messages", []))
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(content, body.get("model", "mock")), media_type="text/event-stream")
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }]
+    }
+
+
+async def stream_chunks(content, model):
+    """Emit content as chat.completion.chunk server-sent events, like the OpenAI streaming API."""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content[start:start + STREAM_CHUNK_CHARS]}, "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(MOCK_LLM_TOKEN_SECONDS)
+    yield "data: [DONE]\n\n"
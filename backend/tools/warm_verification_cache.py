@@ -0,0 +1,81 @@
+"""
+Pre-generate verification questions for the most common HPO terms, so most verification
+turns of the chat are answered from the cache without an LLM round-trip.
+
+"Most common" means annotated to the most diseases in phenotype.hpoa. Run from backend/:
+    python -m tools.warm_verification_cache --top 500
+
+Terms that already have questions for the current prompt version are skipped, so the job
+can be re-run after a prompt or HPO release change to fill in what is missing.
+"""
+import argparse
+import asyncio
+import logging
+from collections import Counter
+
+from app.utils.diagnosing import DEFAULT_ANNOTATIONS_PATH, DEFAULT_CACHE_DIR, DEFAULT_ONTOLOGY_PATH, read_disease_annotations
+from app.utils.llm_chat import VERIFICATION_PROMPT_VERSION, HPODiagnosisChat
+from app.utils.ontology import load_obo_graph
+from app.utils.verification_cache import get_verification_cache
+
+logger = logging.getLogger(__name__)
+
+
+def most_common_terms(ontology_path, annotations_path, top):
+    """The top (hpo_code, name) pairs by number of annotated diseases, skipping obsolete terms."""
+    graph = load_obo_graph(ontology_path, DEFAULT_CACHE_DIR)
+    disease_to_hpo, _, _ = read_disease_annotations(annotations_path)
+    counts = Counter(hpo_id for hpo_ids in disease_to_hpo.values() for hpo_id in hpo_ids)
+
+    terms = []
+    seen = set()
+    for hpo_id, _ in counts.most_common():
+        primary = graph.resolve_id(hpo_id)
+        if primary is None or primary in graph.obsolete or primary in seen:
+            continue
+        seen.add(primary)
+        terms.append((primary, graph.lookup_name(primary)))
+        if len(terms) == top:
+            break
+    return terms
+
+
+async def warm(terms, concurrency):
+    cache = get_verification_cache()
+    chat = HPODiagnosisChat(verification_cache=cache)
+    cached = cache.cached_codes(VERIFICATION_PROMPT_VERSION)
+    missing = [(hpo_code, hpo_name) for hpo_code, hpo_name in terms if hpo_code not in cached]
+    print(f"{len(terms) - len(missing)} of {len(terms)} terms already cached, generating {len(missing)}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def generate(hpo_code, hpo_name):
+        nonlocal failures
+        async with semaphore:
+            try:
+                await chat._generate_verification_questions(hpo_code, hpo_name)
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Could not generate verification questions for {hpo_code}: {e}")
+
+    await asyncio.gather(*(generate(hpo_code, hpo_name) for hpo_code, hpo_name in missing))
+    await chat.llm_client.aclose()
+    print(f"Generated {len(missing) - failures} entries, {failures} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=500, help="number of most common HPO terms to warm")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM requests in flight at a time")
+    parser.add_argument("--ontology", default=DEFAULT_ONTOLOGY_PATH)
+    parser.add_argument("--annotations", default=DEFAULT_ANNOTATIONS_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    terms = most_common_terms(args.ontology, args.annotations, args.top)
+    asyncio.run(warm(terms, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()